@@ -1,26 +1,100 @@
 import json
+import threading
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
-from src.params import server_ip, server_port, info_prints
+from requests.packages.urllib3.util.retry import Retry
+from src.components.metrics import metrics
+from src.params import server_ip, server_port, info_prints, pool_size, http_retries, http_backoff, topology_chunk_size
 
 class ApiConnector: 
 
-    def __init__(self):
+    asynchronous = False        # See AsyncApiConnector
+
+    def __init__(self, server_ip=server_ip, server_port=server_port):
         self.rest_url = '/restconf'
         self.config_end = '/config'
         self.operational_end = '/operational'
         self.topology_url = '/network-topology:network-topology'
         self.flow_url = '/opendaylight-inventory:nodes/node/{}/flow-node-inventory:table/{}/flow/{}'  # All flows added to table 0 (if not then they are not used)
+        self.table_url = '/opendaylight-inventory:nodes/node/{}/flow-node-inventory:table/{}'
+        self.group_url = '/opendaylight-inventory:nodes/node/{}/flow-node-inventory:group/{}'
+        self.node_url = '/opendaylight-inventory:nodes/node/{}'
         self.auth = HTTPBasicAuth('admin', 'admin')
         self.headers = {'content-type': 'application/xml'}
 
+        # Precompute the base urls of the config and operational datastores
+        self.config_base_url = 'http://' + server_ip + ":" + server_port + self.rest_url + self.config_end
+        self.operational_base_url = 'http://' + server_ip + ":" + server_port + self.rest_url + self.operational_end
+
+        # A keep-alive session with a connection pool and a retry policy, shared by all requests
+        self.session = requests.Session()
+        self.session.auth = self.auth
+        adapter = HTTPAdapter(
+            pool_connections=1,         # We only talk to one server
+            pool_maxsize=pool_size,
+            # Once the retries run out the last answer is returned ( and reported like any failed request ) instead of raising
+            max_retries=Retry(total=http_retries, backoff_factor=http_backoff, status_forcelist=(502, 503, 504), raise_on_status=False)
+        )
+        self.session.mount('http://', adapter)
+        self.adapter = adapter
+
+        # The statistics requests ( the operational inventory ) are bounded by the deadline of their snapshot and
+        # retried by the FlowManager, retrying a timed out request here would wait past the deadline
+        self.stats_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount(self._operational_url_creator('/opendaylight-inventory:nodes/'), self.stats_adapter)
+
+        self.in_flight = 0                      # Number of requests currently waiting for an answer
+        self.in_flight_lock = threading.Lock()
+
 
 
     def _config_url_creator(self, String):
-        return 'http://' + server_ip + ":" + server_port + self.rest_url + self.config_end + String
+        return self.config_base_url + String
 
     def _operational_url_creator(self, String):
-        return 'http://' + server_ip + ":" + server_port + self.rest_url + self.operational_end + String
+        return self.operational_base_url + String
+
+    def _request(self, operation, method, url, **kwargs):
+        '''
+            Issue a request through the pooled session, keeping count of the requests in flight. Its latency
+            and status are recorded in the metrics under the name of the operation ( like 'put_flow' ).
+        '''
+        with self.in_flight_lock:
+            self.in_flight += 1
+        status = 'error'
+        try:
+            with metrics.timer('odl_request_seconds', operation=operation):
+                response = self.session.request(method, url, **kwargs)
+            status = response.status_code
+            return response
+        finally:
+            with self.in_flight_lock:
+                self.in_flight -= 1
+            metrics.inc('odl_requests_total', operation=operation, status=status)
+
+    def get_pool_stats(self):
+        '''
+            Return a dictionary with the statistics of the connection pool:
+                - opened: connections opened to the server
+                - reused: requests that were sent over an already open connection
+                - in_flight: requests currently waiting for an answer
+        '''
+        opened = 0
+        requests_sent = 0
+        for adapter in [self.adapter, self.stats_adapter]:
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    opened += pool.num_connections
+                    requests_sent += pool.num_requests
+
+        return {
+            'opened': opened,
+            'reused': max(requests_sent - opened, 0),
+            'in_flight': self.in_flight
+        }
 
     
     def get_topology_json(self):
@@ -28,7 +102,10 @@ class ApiConnector:
             Return the answer of the server when issuing a get request at the "network-topology" endpoint
         '''
         
-        response = requests.get( self._operational_url_creator(self.topology_url), auth=self.auth)
+        response = self._request('get_topology_json', 'GET', self._operational_url_creator(self.topology_url))
+        return self._topology_json_result(response)
+
+    def _topology_json_result(self, response):
         if(response.ok):
             return json.loads(response.content)
         else:
@@ -37,13 +114,31 @@ class ApiConnector:
             print response.text
             return None
 
-    def put_flow(self, xmlData, switch_id, flow_id, table_id=0):
+    def stream_topology(self, chunk_size=topology_chunk_size):
         '''
-            Make a PUT request to the server's endpoint to add a flow using param xmlData.
+            Streaming version of get_topology_json: return an iterator over the chunks of the answer's body
+            as they arrive ( see Topology.parse_topology_from_stream ), or None on errors
         '''
 
-        response = requests.put(self._config_url_creator(self.flow_url.format(switch_id, table_id, flow_id)), auth=self.auth, data=xmlData, headers=self.headers)
-        
+        response = self._request('stream_topology', 'GET', self._operational_url_creator(self.topology_url), stream=True)
+        if(response.ok):
+            return response.iter_content(chunk_size)
+        else:
+            print '[ERR] While getting toplogy'
+            print '  - Server {}'.format(response.status_code)
+            print response.text
+            return None
+
+    def put_flow(self, xmlData, switch_id, flow_id, table_id=0, content_type='application/xml'):
+        '''
+            Make a PUT request to the server's endpoint to add a flow using param xmlData ( or a json body with content_type='application/json' ).
+        '''
+
+        headers = self.headers if content_type == self.headers['content-type'] else {'content-type': content_type}
+        response = self._request('put_flow', 'PUT', self._config_url_creator(self.flow_url.format(switch_id, table_id, flow_id)), data=xmlData, headers=headers)
+        return self._put_flow_result(response, switch_id, flow_id)
+
+    def _put_flow_result(self, response, switch_id, flow_id):
         if response.ok:
             if info_prints:
                 print '[INFO] Added flow: {} in switch: {}'.format(flow_id, switch_id)
@@ -55,14 +150,17 @@ class ApiConnector:
             return False
 
 
-    def get_flow(self, switch_id, flow_id, table_id=0):
+    def get_flow(self, switch_id, flow_id, table_id=0, timeout=None):
         '''
-            Make a GET request to the server's endpoint to get info about flow with flow_id
+            Make a GET request to the server's endpoint to get info about flow with flow_id ( waiting at most timeout seconds
+            for the server, if given )
         '''
 
-        response = requests.get(self._operational_url_creator(self.flow_url.format(switch_id, table_id, flow_id)), auth=self.auth)
-        
-        if response.ok:            
+        response = self._request('get_flow', 'GET', self._operational_url_creator(self.flow_url.format(switch_id, table_id, flow_id)), timeout=timeout)
+        return self._flow_result(response)
+
+    def _flow_result(self, response):
+        if response.ok:
             return json.loads(response.content)
         else: 
             # print '[ERR] While getting flow: {} in switch: {}'.format(flow_id, switch_id)
@@ -71,12 +169,53 @@ class ApiConnector:
             return None
                 
 
+    def get_table(self, switch_id, table_id=0, timeout=None):
+        '''
+            Make a GET request to the server's operational endpoint to get a whole table of a switch
+            (all its flows with their statistics) in a single request ( see get_flow for timeout )
+        '''
+
+        response = self._request('get_table', 'GET', self._operational_url_creator(self.table_url.format(switch_id, table_id)), timeout=timeout)
+        return self._table_result(response, switch_id, table_id)
+
+    def _table_result(self, response, switch_id, table_id):
+        if response.ok:
+            return json.loads(response.content)
+        else:
+            print '[ERR] While getting table: {} of switch: {}'.format(table_id, switch_id)
+            print '  - Server {}'.format(response.status_code)
+            print response.text
+            return None
+
+
+    def get_config_table(self, switch_id, table_id=0):
+        '''
+            Make a GET request to the server's config endpoint to get a whole table of a switch ( the flows
+            configured in it, installed or not ). Returns an empty table if none is configured, None on errors.
+        '''
+
+        response = self._request('get_config_table', 'GET', self._config_url_creator(self.table_url.format(switch_id, table_id)))
+
+        if response.ok:
+            return json.loads(response.content)
+        elif response.status_code == 404:
+            return {'flow-node-inventory:table': []}
+        else:
+            print '[ERR] While getting config table: {} of switch: {}'.format(table_id, switch_id)
+            print '  - Server {}'.format(response.status_code)
+            print response.text
+            return None
+
+
     def delete_flow(self, switch_id, flow_id,  table_id=0):
         '''
             Make a DELETE request to the server's endpoint to delete a flow with id=flow_id
         '''
 
-        response = requests.delete(self._config_url_creator( self.flow_url.format(switch_id,  table_id, flow_id)), auth=self.auth)
+        response = self._request('delete_flow', 'DELETE', self._config_url_creator( self.flow_url.format(switch_id,  table_id, flow_id)))
+        return self._delete_flow_result(response, switch_id, flow_id)
+
+    def _delete_flow_result(self, response, switch_id, flow_id):
         if response.ok:
             if  info_prints:
                 print '[INFO] Deleted flow: {} from switch: {}'.format(flow_id, switch_id)
@@ -85,4 +224,86 @@ class ApiConnector:
             print '[ERR] While deleting flow: {} from switch: {}'.format(flow_id, switch_id)
             print ' - Server {}'.format(response.status_code)
             print response.text
-            return False
\ No newline at end of file
+            return False
+
+
+    def put_group(self, xmlData, switch_id, group_id, content_type='application/xml'):
+        '''
+            Make a PUT request to the server's endpoint to add ( or replace ) a group using param xmlData
+        '''
+
+        headers = self.headers if content_type == self.headers['content-type'] else {'content-type': content_type}
+        response = self._request('put_group', 'PUT', self._config_url_creator(self.group_url.format(switch_id, group_id)), data=xmlData, headers=headers)
+        return self._put_group_result(response, switch_id, group_id)
+
+    def _put_group_result(self, response, switch_id, group_id):
+        if response.ok:
+            if info_prints:
+                print '[INFO] Added group: {} in switch: {}'.format(group_id, switch_id)
+            return True
+        else:
+            print '[ERR] While adding group: {} in switch: {}'.format(group_id, switch_id)
+            print '  - Server {}'.format(response.status_code)
+            print response.text
+            return False
+
+
+    def get_group(self, switch_id, group_id, timeout=None):
+        '''
+            Make a GET request to the server's operational endpoint to get info about a group ( with its bucket statistics,
+            see get_flow for timeout )
+        '''
+
+        response = self._request('get_group', 'GET', self._operational_url_creator(self.group_url.format(switch_id, group_id)), timeout=timeout)
+        return self._flow_result(response)
+
+
+    def get_node(self, switch_id, timeout=None):
+        '''
+            Make a GET request to the server's operational endpoint to get a whole switch: all its tables and
+            groups with their statistics, in a single request ( see get_flow for timeout )
+        '''
+
+        response = self._request('get_node', 'GET', self._operational_url_creator(self.node_url.format(switch_id)), timeout=timeout)
+        return self._node_result(response, switch_id)
+
+    def get_config_node(self, switch_id):
+        '''
+            Make a GET request to the server's config endpoint to get a whole switch: the flows of all its tables
+            and the groups configured in it. Returns an empty node if nothing is configured, None on errors.
+        '''
+
+        response = self._request('get_config_node', 'GET', self._config_url_creator(self.node_url.format(switch_id)))
+
+        if response.status_code == 404:
+            return {'node': []}
+        return self._node_result(response, switch_id)
+
+    def _node_result(self, response, switch_id):
+        if response.ok:
+            return json.loads(response.content)
+        else:
+            print '[ERR] While getting switch: {}'.format(switch_id)
+            print '  - Server {}'.format(response.status_code)
+            print response.text
+            return None
+
+
+    def delete_group(self, switch_id, group_id):
+        '''
+            Make a DELETE request to the server's endpoint to delete a group with id=group_id
+        '''
+
+        response = self._request('delete_group', 'DELETE', self._config_url_creator(self.group_url.format(switch_id, group_id)))
+        return self._delete_group_result(response, switch_id, group_id)
+
+    def _delete_group_result(self, response, switch_id, group_id):
+        if response.ok:
+            if info_prints:
+                print '[INFO] Deleted group: {} from switch: {}'.format(group_id, switch_id)
+            return True
+        else:
+            print '[ERR] While deleting group: {} from switch: {}'.format(group_id, switch_id)
+            print ' - Server {}'.format(response.status_code)
+            print response.text
+            return False
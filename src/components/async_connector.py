@@ -0,0 +1,433 @@
+import asyncore
+import base64
+import socket
+import sys
+import urllib
+import urlparse
+from collections import deque
+from time import time
+from src.components.api_connector import ApiConnector
+from src.components.event_loop import EventLoop, Future
+from src.components.metrics import metrics
+from src.params import server_ip, server_port, async_connections, async_timeout, http_retries, http_backoff
+
+
+class AsyncApiConnector(ApiConnector):
+    '''
+        An ApiConnector sending its requests from a single event loop ( see EventLoop ), over a pool of
+        keep-alive http connections. The requests wait in a queue for a free connection, so any number of
+        them can be issued at once while at most max_connections are on the wire.
+
+        The *_async methods return a Future with the same result as the method of ApiConnector. The
+        synchronous methods are still available ( they wait for the future ), so it can replace an
+        ApiConnector anywhere. The topology stream is read through the requests session of ApiConnector.
+
+        Like the Retry policy of ApiConnector, a request answered with 502, 503 or 504 or whose connection
+        failed is sent again up to retries times, after a backoff of backoff * 2 ^ retry seconds. A request
+        not answered timeout seconds after it was issued fails with a None status_code and its connection
+        is closed.
+    '''
+
+    asynchronous = True
+
+    # The statuses of the answers sent again ( see the Retry of ApiConnector )
+    retry_statuses = (502, 503, 504)
+
+    def __init__(self, server_ip=server_ip, server_port=server_port, max_connections=async_connections, timeout=async_timeout, retries=http_retries, backoff=http_backoff):
+        ApiConnector.__init__(self, server_ip, server_port)
+        self.address = (server_ip, int(server_port))
+        self.base_headers = 'Host: {}:{}\r\nAuthorization: Basic {}\r\nAccept: */*\r\n'.format(server_ip, server_port, base64.b64encode('admin:admin'))
+        self.max_connections = max_connections
+        self.timeout = timeout          # Default seconds a request waits for its answer
+        self.retries = retries
+        self.backoff = backoff
+
+        # Loop thread only
+        self.queue = deque()            # The requests waiting for a connection
+        self.idle = []                  # The open connections without a request
+        self.connections = 0            # Number of open connections
+        self.opened = 0                 # Number of connections opened
+        self.sent = 0                   # Number of requests sent
+
+        self.loop = EventLoop().start()
+
+
+    def close(self):
+        '''
+            Stop the event loop and close the connections
+        '''
+        self.loop.stop()
+
+
+    def _request(self, operation, method, url, **kwargs):
+        '''
+            Same as ApiConnector._request, the request is sent from the event loop
+        '''
+        if kwargs.get('stream'):
+            return ApiConnector._request(self, operation, method, url, **kwargs)
+        return self._submit(operation, method, url, **kwargs).result()
+
+
+    def _submit(self, operation, method, url, data=None, headers=None, timeout=None):
+        '''
+            Queue a request and return a Future with its response ( an object with the status_code, ok, content
+            and text of a requests.Response, the status_code is None if the connection failed or the request
+            was not answered in timeout seconds, self.timeout if None )
+        '''
+        data = data.encode('utf-8') if isinstance(data, unicode) else (data or '')
+        path = urllib.quote(urlparse.urlsplit(url).path, safe="/:@!$&'()*+,;=-._~%")
+
+        request = [method, ' ', path, ' HTTP/1.1\r\n', self.base_headers, 'Content-Length: {}\r\n'.format(len(data))]
+        for (name, value) in (headers or {}).items():
+            request.append('{}: {}\r\n'.format(name, value))
+        request.append('\r\n')
+        request.append(data)
+
+        task = _Task(operation, ''.join(request), Future())
+        with self.in_flight_lock:
+            self.in_flight += 1
+        self.loop.call_soon(self._dispatch, task)
+        self.loop.call_later(timeout if timeout is not None else self.timeout, self._expire, task)
+        return task.future
+
+
+    def _dispatch(self, task=None):
+        '''
+            Queue task ( if any ) and send the queued requests over the idle connections or new ones
+        '''
+        if task is not None and not task.future.done():     # A task may time out while waiting to be sent again
+            self.queue.append(task)
+
+        while self.queue:
+            if self.idle:
+                connection = self.idle.pop()
+            elif self.connections < self.max_connections:
+                try:
+                    connection = _HttpConnection(self)
+                except socket.error as error:
+                    self._done(self.queue.popleft(), _Response(None, 'Connection failed: {}'.format(error)))
+                    continue
+                self.connections += 1
+                self.opened += 1
+            else:
+                break       # The next request waits for a connection to finish
+
+            task = self.queue.popleft()
+            self.sent += 1
+            task.connection = connection
+            connection.send_task(task)
+
+
+    def _finished(self, connection, task, response, keep_alive):
+        task.connection = None
+        if keep_alive:
+            self.idle.append(connection)
+        else:
+            self.connections -= 1
+
+        if response.status_code not in self.retry_statuses or not self._retry(task):
+            self._done(task, response)
+        self._dispatch()
+
+
+    def _lost(self, connection, task, error):
+        self.connections -= 1
+        if connection in self.idle:
+            self.idle.remove(connection)
+
+        if task is not None:
+            task.connection = None
+            if connection.requests > 1 and not task.resent:
+                # The server closed the idle keep-alive connection before it got the request, send it again
+                task.resent = True
+                self.queue.appendleft(task)
+            elif not self._retry(task):
+                self._done(task, _Response(None, 'Connection failed: {}'.format(error)))
+        self._dispatch()
+
+
+    def _retry(self, task):
+        '''
+            Send task again after its backoff, if it has retries left. Returns whether it will be sent again.
+        '''
+        if task.retries >= self.retries:
+            return False
+        task.retries += 1
+        self.loop.call_later(self.backoff * 2 ** (task.retries - 1), self._dispatch, task)
+        return True
+
+
+    def _expire(self, task):
+        '''
+            Fail task if it is not answered yet, closing the connection waiting for its answer
+        '''
+        if task.future.done():
+            return
+
+        connection = task.connection
+        if connection is not None:
+            connection.abort()
+            self.connections -= 1
+        elif task in self.queue:
+            self.queue.remove(task)
+
+        self._done(task, _Response(None, 'Timed out'))
+        self._dispatch()
+
+
+    def _done(self, task, response):
+        metrics.observe('odl_request_seconds', time() - task.created, operation=task.operation)
+        metrics.inc('odl_requests_total', operation=task.operation, status=response.status_code if response.status_code is not None else 'error')
+        with self.in_flight_lock:
+            self.in_flight -= 1
+        task.future.set_result(response)
+
+
+    def get_pool_stats(self):
+        '''
+            Same as ApiConnector.get_pool_stats for the connections of the event loop
+        '''
+        return {
+            'opened': self.opened,
+            'reused': max(self.sent - self.opened, 0),
+            'in_flight': self.in_flight
+        }
+
+
+    def get_topology_json_async(self):
+        '''
+            Asynchronous version of get_topology_json
+        '''
+        return self._submit('get_topology_json', 'GET', self._operational_url_creator(self.topology_url)).then(self._topology_json_result)
+
+    def put_flow_async(self, xmlData, switch_id, flow_id, table_id=0, content_type='application/xml'):
+        '''
+            Asynchronous version of put_flow
+        '''
+        headers = self.headers if content_type == self.headers['content-type'] else {'content-type': content_type}
+        future = self._submit('put_flow', 'PUT', self._config_url_creator(self.flow_url.format(switch_id, table_id, flow_id)), data=xmlData, headers=headers)
+        return future.then(lambda response: self._put_flow_result(response, switch_id, flow_id))
+
+    def get_flow_async(self, switch_id, flow_id, table_id=0, timeout=None):
+        '''
+            Asynchronous version of get_flow
+        '''
+        return self._submit('get_flow', 'GET', self._operational_url_creator(self.flow_url.format(switch_id, table_id, flow_id)), timeout=timeout).then(self._flow_result)
+
+    def get_table_async(self, switch_id, table_id=0, timeout=None):
+        '''
+            Asynchronous version of get_table
+        '''
+        future = self._submit('get_table', 'GET', self._operational_url_creator(self.table_url.format(switch_id, table_id)), timeout=timeout)
+        return future.then(lambda response: self._table_result(response, switch_id, table_id))
+
+    def delete_flow_async(self, switch_id, flow_id, table_id=0):
+        '''
+            Asynchronous version of delete_flow
+        '''
+        future = self._submit('delete_flow', 'DELETE', self._config_url_creator(self.flow_url.format(switch_id, table_id, flow_id)))
+        return future.then(lambda response: self._delete_flow_result(response, switch_id, flow_id))
+
+    def put_group_async(self, xmlData, switch_id, group_id, content_type='application/xml'):
+        '''
+            Asynchronous version of put_group
+        '''
+        headers = self.headers if content_type == self.headers['content-type'] else {'content-type': content_type}
+        future = self._submit('put_group', 'PUT', self._config_url_creator(self.group_url.format(switch_id, group_id)), data=xmlData, headers=headers)
+        return future.then(lambda response: self._put_group_result(response, switch_id, group_id))
+
+    def get_group_async(self, switch_id, group_id, timeout=None):
+        '''
+            Asynchronous version of get_group
+        '''
+        return self._submit('get_group', 'GET', self._operational_url_creator(self.group_url.format(switch_id, group_id)), timeout=timeout).then(self._flow_result)
+
+    def get_node_async(self, switch_id, timeout=None):
+        '''
+            Asynchronous version of get_node
+        '''
+        future = self._submit('get_node', 'GET', self._operational_url_creator(self.node_url.format(switch_id)), timeout=timeout)
+        return future.then(lambda response: self._node_result(response, switch_id))
+
+    def delete_group_async(self, switch_id, group_id):
+        '''
+            Asynchronous version of delete_group
+        '''
+        future = self._submit('delete_group', 'DELETE', self._config_url_creator(self.group_url.format(switch_id, group_id)))
+        return future.then(lambda response: self._delete_group_result(response, switch_id, group_id))
+
+
+class _Task:
+
+    def __init__(self, operation, data, future):
+        self.operation = operation
+        self.data = data            # The whole request
+        self.future = future
+        self.created = time()
+        self.resent = False
+        self.retries = 0            # Number of times it was sent again ( see AsyncApiConnector._retry )
+        self.connection = None      # The connection waiting for its answer
+
+
+class _Response:
+    '''
+        The parts of a requests.Response the connector uses
+    '''
+
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+
+    @property
+    def ok(self):
+        return self.status_code is not None and self.status_code < 400
+
+    @property
+    def text(self):
+        return self.content
+
+
+class _HttpConnection(asyncore.dispatcher):
+    '''
+        A keep-alive http connection of an AsyncApiConnector, sending one request at a time
+    '''
+
+    def __init__(self, connector):
+        asyncore.dispatcher.__init__(self, map=connector.loop.map)
+        self.connector = connector
+        self.task = None            # The request being served
+        self.out = ''               # What is left to send of the request
+        self.buffer = ''            # What arrived of the response
+        self.head = None            # The ( status, headers ) of the response, once they arrived
+        self.requests = 0           # Number of requests sent over the connection
+        self.error = 'closed by the server'
+        self.lost = False
+
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.connect(connector.address)
+        except socket.error:
+            self.close()
+            raise
+
+
+    def send_task(self, task):
+        self.task = task
+        self.out = task.data
+        self.buffer = ''
+        self.head = None
+        self.requests += 1
+
+
+    def writable(self):
+        return bool(self.out) or not self.connected
+
+    def handle_connect(self):
+        pass
+
+    def handle_write(self):
+        sent = self.send(self.out)
+        self.out = self.out[sent:]
+
+    def handle_read(self):
+        data = self.recv(65536)
+        if data:
+            self.buffer += data
+            self._parse()
+
+
+    def _parse(self):
+        '''
+            Complete the request once its whole response arrived
+        '''
+        if self.task is None:
+            return
+
+        if self.head is None:
+            end = self.buffer.find('\r\n\r\n')
+            if end < 0:
+                return
+            lines = self.buffer[:end].split('\r\n')
+            headers = {}
+            for line in lines[1:]:
+                (name, _, value) = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+            self.head = (int(lines[0].split(' ', 2)[1]), headers)
+            self.buffer = self.buffer[end + 4:]
+
+        (status, headers) = self.head
+        if status in (204, 304):
+            body = ''
+        elif 'chunked' in headers.get('transfer-encoding', ''):
+            body = self._dechunk()
+            if body is None:
+                return
+        elif 'content-length' in headers:
+            length = int(headers['content-length'])
+            if len(self.buffer) < length:
+                return
+            body = self.buffer[:length]
+        else:
+            return      # The body ends when the server closes the connection
+
+        self._complete(_Response(status, body), headers.get('connection', '').lower() != 'close')
+
+
+    def _dechunk(self):
+        '''
+            Return the body of a chunked response, or None if it has not fully arrived
+        '''
+        chunks = []
+        pos = 0
+        while True:
+            end = self.buffer.find('\r\n', pos)
+            if end < 0:
+                return None
+            size = int(self.buffer[pos:end].split(';')[0], 16)
+            if size == 0:
+                return ''.join(chunks) if self.buffer.find('\r\n\r\n', end) >= 0 else None
+            start = end + 2
+            if len(self.buffer) < start + size + 2:
+                return None
+            chunks.append(self.buffer[start:start + size])
+            pos = start + size + 2
+
+
+    def _complete(self, response, keep_alive):
+        task = self.task
+        self.task = None
+        self.head = None
+        self.buffer = ''
+        if not keep_alive:
+            self.close()
+        self.connector._finished(self, task, response, keep_alive)
+
+
+    def abort(self):
+        '''
+            Close the connection without reporting its request ( the connector gave up on it )
+        '''
+        self.lost = True
+        self.task = None
+        self.close()
+
+
+    def handle_close(self):
+        if self.lost:
+            return
+        self.lost = True
+        self.close()
+
+        task = self.task
+        self.task = None
+        if task is not None and self.head is not None and 'content-length' not in self.head[1] and 'chunked' not in self.head[1].get('transfer-encoding', ''):
+            # The body ended with the connection
+            self.connector._finished(self, task, _Response(self.head[0], self.buffer), False)
+        else:
+            self.connector._lost(self, task, self.error)
+
+
+    def handle_error(self):
+        self.error = sys.exc_info()[1]
+        self.handle_close()
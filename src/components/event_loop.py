@@ -0,0 +1,248 @@
+import asyncore
+import errno
+import fcntl
+import heapq
+import os
+import threading
+import traceback
+from collections import deque
+from itertools import count
+from time import time
+
+
+class Future:
+    '''
+        The result of an operation running in an EventLoop. Any thread can wait for it with result(),
+        the callbacks added with add_done_callback / then run in the thread that completes it ( the loop's ).
+    '''
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._result = None
+        self._error = None
+
+
+    def done(self):
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        '''
+            Wait till the future is done and return its result ( or raise its error )
+        '''
+        if timeout is None:
+            # Wait with a timeout, an untimed wait can't be interrupted by signals
+            while not self._event.wait(0.5):
+                pass
+        elif not self._event.wait(timeout):
+            raise RuntimeError('Timed out waiting for a future')
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def set_result(self, result):
+        self._finish(result, None)
+
+    def set_error(self, error):
+        self._finish(None, error)
+
+    def _finish(self, result, error):
+        with self._lock:
+            self._result = result
+            self._error = error
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, None
+
+        for callback in callbacks:
+            callback(self)
+
+    def add_done_callback(self, callback):
+        '''
+            Call callback(future) when the future is done ( right away if it already is )
+        '''
+        with self._lock:
+            if self._callbacks is not None:
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def then(self, function):
+        '''
+            Return a Future with the result of function(result) once this future is done
+        '''
+        chained = Future()
+        def chain(future):
+            try:
+                chained.set_result(function(future.result()))
+            except Exception as error:
+                chained.set_error(error)
+        self.add_done_callback(chain)
+        return chained
+
+    @staticmethod
+    def completed(result):
+        future = Future()
+        future.set_result(result)
+        return future
+
+    @staticmethod
+    def gather(futures):
+        '''
+            Return a Future with the list of the results of futures, done when all of them are
+        '''
+        futures = list(futures)
+        gathered = Future()
+        remaining = [len(futures)]
+        lock = threading.Lock()
+
+        def collect(_):
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                gathered.set_result([future._result for future in futures])
+
+        if not futures:
+            gathered.set_result([])
+        for future in futures:
+            future.add_done_callback(collect)
+        return gathered
+
+
+class AsyncSemaphore:
+    '''
+        Limits the operations running at the same time in an EventLoop without blocking it: acquire(function)
+        calls function once a slot is free and every call must be followed by a release(). Loop thread only.
+    '''
+
+    def __init__(self, value):
+        self.value = value
+        self.waiting = deque()
+
+    def acquire(self, function):
+        if self.value > 0:
+            self.value -= 1
+            function()
+        else:
+            self.waiting.append(function)
+
+    def release(self):
+        if self.waiting:
+            self.waiting.popleft()()
+        else:
+            self.value += 1
+
+
+class EventLoop:
+    '''
+        A single asyncore event loop running in a background thread. It serves the dispatchers created
+        with its map, the callbacks scheduled with call_soon / call_later ( from any thread ) and is woken
+        up through a pipe when a callback is scheduled from another thread.
+    '''
+
+    def __init__(self):
+        self.map = {}                   # The dispatchers served by the loop (key: file descriptor, value: dispatcher )
+        self.ready = deque()            # The callbacks to run in the next iteration
+        self.timers = []                # A heap of the ( when, seq, callback, args ) to run later
+        self.seq = count()
+        self.lock = threading.Lock()
+        self.stopped = False
+        self.waker = _Waker(self.map)
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped = True
+        self.waker.wake()
+        self.thread.join()
+        for dispatcher in self.map.values():
+            dispatcher.close()
+
+
+    def in_loop(self):
+        return threading.current_thread() is self.thread
+
+    def call_soon(self, callback, *args):
+        '''
+            Run callback(*args) in the loop's thread
+        '''
+        self.ready.append( (callback, args) )
+        if not self.in_loop():
+            self.waker.wake()
+
+    def call_later(self, delay, callback, *args):
+        '''
+            Run callback(*args) in the loop's thread after delay seconds
+        '''
+        with self.lock:
+            heapq.heappush(self.timers, (time() + delay, next(self.seq), callback, args))
+        if not self.in_loop():
+            self.waker.wake()
+
+
+    def _run(self):
+        while not self.stopped:
+            # Run the callbacks scheduled till now ( the ones they schedule run in the next iteration )
+            for _ in xrange(len(self.ready)):
+                (callback, args) = self.ready.popleft()
+                self._call(callback, args)
+
+            with self.lock:
+                timeout = max(0.0, min(self.timers[0][0] - time(), 1.0)) if self.timers else 1.0
+            if self.ready:
+                timeout = 0.0
+
+            asyncore.loop(timeout, use_poll=True, map=self.map, count=1)
+
+            # Run the timers that are due
+            now = time()
+            due = []
+            with self.lock:
+                while self.timers and self.timers[0][0] <= now:
+                    due.append(heapq.heappop(self.timers))
+            for (_, _, callback, args) in due:
+                self._call(callback, args)
+
+    @staticmethod
+    def _call(callback, args):
+        # An error in a callback must not stop the loop
+        try:
+            callback(*args)
+        except Exception:
+            print '[ERR] In the event loop:'
+            traceback.print_exc()
+
+
+class _Waker(asyncore.file_dispatcher):
+    '''
+        The read end of a pipe in the loop's map: writing to the pipe wakes the loop up
+    '''
+
+    def __init__(self, map):
+        (read_fd, self.write_fd) = os.pipe()
+        fcntl.fcntl(self.write_fd, fcntl.F_SETFL, fcntl.fcntl(self.write_fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        asyncore.file_dispatcher.__init__(self, read_fd, map=map)
+        os.close(read_fd)       # file_dispatcher keeps a duplicate of it
+
+    def wake(self):
+        try:
+            os.write(self.write_fd, 'x')
+        except OSError as error:
+            if error.errno != errno.EAGAIN:     # A full pipe wakes the loop up anyway
+                raise
+
+    def writable(self):
+        return False
+
+    def handle_read(self):
+        self.recv(4096)
+
+    def close(self):
+        asyncore.file_dispatcher.close(self)
+        os.close(self.write_fd)
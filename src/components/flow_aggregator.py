@@ -0,0 +1,118 @@
+from bisect import bisect_left
+import socket
+import struct
+from src.params import aggregate_default_route, aggregate_prefixes, aggregate_min_prefix
+
+
+# The key of a default route rule in an aggregated flows dictionary
+DEFAULT_ROUTE = 'default'
+
+
+class FlowAggregator:
+    '''
+        Compresses the port forward flows of a topology into fewer rules. A flows dictionary
+            { switch_id: { port_number: set(host_mac, ...), ... }, ... }
+        is turned into a dictionary with the same format where each set holds rule keys instead of macs:
+            - host_mac: a port forward flow for a single host ( like before )
+            - DEFAULT_ROUTE: a low priority flow forwarding every packet no other flow matched
+            - '<ip>/<prefix_len>': a flow forwarding the packets of an IPv4 prefix
+    '''
+
+    def __init__(self, topology, default_route=aggregate_default_route, prefixes=aggregate_prefixes, min_prefix=aggregate_min_prefix):
+        self.topology = topology
+        self.default_route = default_route      # Replace the flows of each switch's busiest port with a default route
+        self.prefixes = prefixes                # Group the hosts of a port by IPv4 prefix
+        self.min_prefix = min_prefix            # The shortest prefix length used when grouping hosts
+        self.compression_ratio = 1.0            # Flows / rules of the last aggregation
+
+
+    @staticmethod
+    def is_prefix(key):
+        '''
+            Return True if key ( of an aggregated flows dictionary ) is an IPv4 prefix
+        '''
+        return '/' in key
+
+
+    def aggregate(self, flows):
+        '''
+            Aggregate flows ( see the class docstring ) and update compression_ratio.
+        '''
+        # Map each mac to the host's ip ( as an int ) for the prefix grouping
+        mac_to_ip = {}
+        if self.prefixes:
+            for host in self.topology.hosts.values():
+                if host.ip:
+                    mac_to_ip[host.mac] = struct.unpack('!I', socket.inet_aton(host.ip))[0]
+        all_ips = sorted(set(mac_to_ip.values()))
+
+        rules = {}
+        flows_count = 0
+        rules_count = 0
+        for switch_id, ports in flows.items():
+            rules[switch_id] = {port_num: set() for port_num in ports}
+
+            # The busiest port (ties broken by port number) gets the default route if it saves flows
+            default_port = None
+            if self.default_route:
+                busiest = sorted(ports.items(), key=lambda item: (-len(item[1]), item[0]))
+                if len(busiest) > 0 and len(busiest[0][1]) > 1:
+                    default_port = busiest[0][0]
+
+            for port_num, macs_set in ports.items():
+                flows_count += len(macs_set)
+
+                if port_num == default_port:
+                    rules[switch_id][port_num].add(DEFAULT_ROUTE)
+                elif self.prefixes and len(macs_set) > 1:
+                    rules[switch_id][port_num] = self._group_by_prefix(macs_set, mac_to_ip, all_ips)
+                else:
+                    rules[switch_id][port_num] = set(macs_set)
+
+                rules_count += len(rules[switch_id][port_num])
+
+        self.compression_ratio = float(flows_count) / rules_count if rules_count > 0 else 1.0
+        return rules
+
+
+    def _group_by_prefix(self, macs_set, mac_to_ip, all_ips):
+        '''
+            Cover the hosts in macs_set with the largest IPv4 prefixes that contain no other known host.
+            Hosts without an ip, or whose prefix would only hold themselves, keep their mac rule.
+            Returns a set of rule keys.
+        '''
+        keys = set()
+        ip_to_macs = {}
+        for mac in macs_set:
+            if mac in mac_to_ip:
+                ip_to_macs.setdefault(mac_to_ip[mac], []).append(mac)
+            else:
+                keys.add(mac)
+
+        port_ips = sorted(ip_to_macs.keys())
+        other_ips = [ip for ip in all_ips if ip not in ip_to_macs]
+
+        # Prefixes are aligned blocks, so growing each uncovered ip's block as much as possible
+        # ( in ascending ip order ) never gives overlapping blocks
+        idx = 0
+        while idx < len(port_ips):
+            ip = port_ips[idx]
+
+            # Find the shortest prefix length whose block holds no other known host
+            for prefix_len in range(self.min_prefix, 33):
+                mask = (0xFFFFFFFF << (32 - prefix_len)) & 0xFFFFFFFF
+                first = ip & mask
+                last = first | (~mask & 0xFFFFFFFF)
+                other_idx = bisect_left(other_ips, first)
+                if other_idx == len(other_ips) or other_ips[other_idx] > last:
+                    break
+
+            # Find the hosts of the port in this block
+            block_end = bisect_left(port_ips, last + 1, idx)
+            if block_end - idx > 1:
+                keys.add('{}/{}'.format(socket.inet_ntoa(struct.pack('!I', first)), prefix_len))
+            else:
+                keys.update(ip_to_macs[ip])
+            idx = block_end
+
+        return keys
@@ -1,22 +1,113 @@
 from src.components.xml_creator import XmlCreator
 from src.components.api_connector import ApiConnector
-from time import sleep
+from src.components.flow_aggregator import FlowAggregator, DEFAULT_ROUTE
+from src.components.event_loop import Future, AsyncSemaphore
+from src.components.metrics import metrics
+from src.objects.flow_registry import FlowRegistry
+from src.objects.group_registry import GroupRegistry
+from src.params import flow_push_workers, flow_push_per_switch, stats_retries, stats_backoff, stats_backoff_max, flow_id_scheme
+from multiprocessing.pool import ThreadPool
+from requests import RequestException
+from time import sleep, time
+import random
+import threading
 
 class FlowManager:
 
+    # The priority of the port forward flows and of the default routes ( lower, see XmlCreator ). A flow added
+    # while another flow of the switch forwards the same destination gets the alternate priority ( + 1 ), see _flow_priority
+    forward_priority = 2000
+    default_route_priority = 1000
 
-    def __init__(self):
+
+    def __init__(self, connector=None, id_scheme=flow_id_scheme):
         self.xml_creator = XmlCreator()
-        self.connector = ApiConnector()        
-        self.port_forward_flows = []     # A list of all (switch_id, flow_id) tuples, with port forward actions added in the by the Manager.
+        self.destination_ids = id_scheme == 'destination'  # Name the flows after ( switch, destination ) only, see gen_flow_id
+        self.connector = connector if connector is not None else ApiConnector()     # Share the connector (and its connection pool) if one is given
+        self.port_forward_flows = FlowRegistry()     # All the flows, with port forward actions added in the by the Manager.
+        self.select_groups = GroupRegistry()        # All the select groups added by the Manager ( and the flows sending packets to them )
+        self.push_pool = ThreadPool(flow_push_workers)  # Pushes batches of flow changes concurrently
 
 
     def gen_flow_id(self, switch_id, mac, port_num):
         '''
-            Generate flow_id using switch_id , mac , port_number
+            Generate flow_id using switch_id , mac , port_number ( switch_id and mac only with the 'destination' scheme )
+        '''
+
+        # Aggregated rules use their key instead of a mac ( '/' of prefixes is not allowed in urls )
+        if self.destination_ids:
+            return mac.replace('/', '-') + "_at_" + switch_id.split(':')[1]  # The id's format is '<host_mac>_at_<switch_number>'
+        return mac.replace('/', '-') + "_to_" + switch_id.split(':')[1] + ':' + port_num  # The id's format is '<host_mac>_to_<switch_number>:<port_number>'
+
+    def parse_flow_id(self, flow_id):
+        '''
+            The reverse of gen_flow_id ( for the ids of both schemes ). Returns a ( switch_number, mac, port_number ) tuple,
+            with a None port_number for the ids of the 'destination' scheme, or None if flow_id is not formated like
+            the port forward flows' ids.
+        '''
+        mac, sep, switch_port = flow_id.rpartition('_to_')
+        if sep:
+            if switch_port.count(':') != 1:
+                return None
+            switch_num, port_num = switch_port.split(':')
+            return (switch_num, mac.replace('-', '/'), port_num)
+
+        mac, sep, switch_num = flow_id.rpartition('_at_')
+        if not sep or not switch_num or ':' in switch_num:
+            return None
+        return (switch_num, mac.replace('-', '/'), None)
+
+
+    def gen_group_flow_id(self, switch_id, mac):
+        '''
+            Generate the id of the flow sending the packets to mac to its select group in switch_id
+        '''
+        return mac.replace('/', '-') + "_via_" + switch_id.split(':')[1]  # The id's format is '<host_mac>_via_<switch_number>'
+
+
+    def parse_group_flow_id(self, flow_id):
+        '''
+            The reverse of gen_group_flow_id. Returns a ( switch_number, mac ) tuple, or None if flow_id is not
+            formated like the ids of the flows sending packets to select groups.
+        '''
+        mac, sep, switch_num = flow_id.rpartition('_via_')
+        if not sep or not switch_num or ':' in switch_num:
+            return None
+        return (switch_num, mac.replace('-', '/'))
+
+
+    def find_flow_id(self, switch_id, mac, port_num):
         '''
+            Return the id of the installed flow of switch_id forwarding mac to port_num, or the id gen_flow_id gives
+            it if it is not registered ( None with the 'destination' scheme, that id may name a flow to another port )
+        '''
+        flow_id = self.port_forward_flows.find(switch_id, mac, port_num)
+        if flow_id is None and not self.destination_ids:
+            flow_id = self.gen_flow_id(switch_id, mac, port_num)
+        return flow_id
+
 
-        return mac + "_to_" + switch_id.split(':')[1] + ':' + port_num  # The id's format is '<host_mac>_to_<switch_number>:<port_number>'
+    @staticmethod
+    def _output_port(flow):
+        '''
+            Return the output port of a flow's json ( as returned by the server ) or None if it has no instructions
+        '''
+        try:
+            action = flow['instructions']['instruction'][0]['apply-actions']['action'][0]
+            return str(action['output-action']['output-node-connector'])
+        except (KeyError, IndexError, TypeError):
+            return None
+
+    @staticmethod
+    def _group_action(flow):
+        '''
+            Return the id of the group a flow's json ( as returned by the server ) sends its packets to, or None
+        '''
+        try:
+            action = flow['instructions']['instruction'][0]['apply-actions']['action'][0]
+            return int(action['group-action']['group-id'])
+        except (KeyError, IndexError, TypeError, ValueError):
+            return None
 
     def add_port_forward_flow(self, switch_id, mac, port_num):
         '''
@@ -26,46 +117,780 @@ class FlowManager:
 
         # Generate flow_id
         flow_id = self.gen_flow_id(switch_id, mac, port_num)
+        priority = self._flow_priority(switch_id, flow_id, mac)
         
         # Create the xml data from the port forward flow
-        xml = self.xml_creator.crete_port_forward_flow(flow_id, port_num, mac)
+        xml = self._port_forward_xml(flow_id, mac, port_num, priority)
 
         # Send request to the server 
-        success = self.connector.put_flow(xml, switch_id, flow_id)
+        success = self.connector.put_flow(xml, switch_id, flow_id, content_type=self.xml_creator.content_type)
 
-        # If request successfull store the flow_id and return flow_id
+        # If request successfull store the flow_id
         if success: 
-            self.port_forward_flows.append( (switch_id, flow_id) )            
+            self.port_forward_flows.add(switch_id, flow_id, mac, port_num, priority)
+
+        return success
+
+
+    def add_port_forward_flow_async(self, switch_id, mac, port_num):
+        '''
+            Asynchronous version of add_port_forward_flow ( needs an AsyncApiConnector ), returns a Future
+        '''
+        flow_id = self.gen_flow_id(switch_id, mac, port_num)
+        priority = self._flow_priority(switch_id, flow_id, mac)
+        xml = self._port_forward_xml(flow_id, mac, port_num, priority)
 
+        def register(success):
+            if success:
+                self.port_forward_flows.add(switch_id, flow_id, mac, port_num, priority)
+            return success
 
-    def get_flow_packet_count(self, switch_id, mac, port, table_id=0):
+        return self.connector.put_flow_async(xml, switch_id, flow_id, content_type=self.xml_creator.content_type).then(register)
+
+
+    def _flow_priority(self, switch_id, flow_id, mac):
+        '''
+            Return the priority to install a port forward flow with. A switch takes two flows with the same match
+            and priority for the same rule: adding the new one replaces the old one, and deleting the old one
+            ( a strict delete ) deletes the new one too. So a flow replacing another flow to mac in the switch gets
+            the priority the other one does not use. A flow that is installed keeps its priority ( the PUT overwrites it ).
+        '''
+        base = self.default_route_priority if mac == DEFAULT_ROUTE else self.forward_priority
+        installed = self.port_forward_flows.get(switch_id, flow_id)
+        if installed is not None:
+            return installed.priority if installed.priority is not None else base
+
+        # The flows of unknown priority were installed with the base one
+        used = set(flow.priority if flow.priority is not None else base for flow in self.port_forward_flows.flows_to(switch_id, mac))
+        return base + 1 if base in used else base
+
+
+    def _group_flow_xml(self, switch_id, mac, flow_id, group_id):
+        '''
+            Create the body of the flow sending the packets to mac to its select group. It replaces the port
+            forward flows to mac of the switch ( left by a run without multipath ), so it gets the priority they
+            do not use ( see _flow_priority ) and they can be deleted once it is installed.
+        '''
+        return self.xml_creator.crete_group_forward_flow(flow_id, group_id, mac, priority=self._flow_priority(switch_id, flow_id, mac))
+
+
+    def _port_forward_xml(self, flow_id, mac, port_num, priority):
+        '''
+            Create the body of a port forward flow ( or of an aggregated rule, see FlowAggregator )
+        '''
+        if mac == DEFAULT_ROUTE:
+            return self.xml_creator.crete_default_forward_flow(flow_id, port_num, priority=priority)
+        elif FlowAggregator.is_prefix(mac):
+            return self.xml_creator.crete_prefix_forward_flow(flow_id, port_num, mac, priority=priority)
+        else:
+            return self.xml_creator.crete_port_forward_flow(flow_id, port_num, mac, priority=priority)
+
+
+    def _fetch_with_retries(self, fetch, operation, deadline=None):
         '''
-            Return the packet-count for flow with id equal to flow_id
-        '''        
-        # Send the request
-        json = None
-        while json == None:
-            json = self.connector.get_flow(switch_id, self.gen_flow_id(switch_id, mac, port) )
-            
-            # If request successfull
-            if json != None:
-                return json['flow-node-inventory:flow'][0]['opendaylight-flow-statistics:flow-statistics']['packet-count']
+            Call fetch(timeout) until it returns something else than None, retrying up to stats_retries times (see src/params.py)
+            after an exponential backoff with jitter. No attempt is started if it would start after deadline ( a time() ) and
+            each attempt waits for the server till deadline at most ( timeout is None without a deadline ). An attempt raising
+            a RequestException ( like a lost connection ) failed.
+
+            Returns:
+                The result of fetch or None if all the attempts failed.
+        '''
+        for retry in xrange(stats_retries + 1):
+            if retry > 0:
+                delay = random.uniform(0, min(stats_backoff_max, stats_backoff * 2 ** (retry - 1)))
+                if deadline is not None and time() + delay > deadline:
+                    break
+                sleep(delay)
+                metrics.inc('stats_retries_total', operation=operation)
+
+            timeout = None
+            if deadline is not None:
+                timeout = deadline - time()
+                if timeout <= 0:
+                    break
+
+            try:
+                result = fetch(timeout)
+            except RequestException:
+                result = None
+            if result is not None:
+                return result
+
+        metrics.inc('stats_failed_total', operation=operation)
+        return None
+
+
+    def _fetch_with_retries_async(self, fetch, operation, deadline=None):
+        '''
+            Asynchronous version of _fetch_with_retries, fetch(timeout) returns a Future and the retries wait in the event loop
+        '''
+        fetched = Future()
+
+        def attempt(retry):
+            timeout = None
+            if deadline is not None:
+                timeout = deadline - time()
+                if timeout <= 0:
+                    metrics.inc('stats_failed_total', operation=operation)
+                    fetched.set_result(None)
+                    return
+            fetch(timeout).add_done_callback(lambda future: check(retry, future))
+
+        def check(retry, future):
+            result = future.result() if future._error is None else None
+            if result is not None:
+                fetched.set_result(result)
+                return
+
+            if retry < stats_retries:
+                delay = random.uniform(0, min(stats_backoff_max, stats_backoff * 2 ** retry))
+                if deadline is None or time() + delay <= deadline:
+                    metrics.inc('stats_retries_total', operation=operation)
+                    self.connector.loop.call_later(delay, attempt, retry + 1)
+                    return
+
+            metrics.inc('stats_failed_total', operation=operation)
+            fetched.set_result(None)
+
+        attempt(0)
+        return fetched
+
+
+    def get_flow_packet_count(self, switch_id, mac, port, table_id=0, deadline=None):
+        '''
+            Return the packet-count for flow with id equal to flow_id, or None if it could not be
+            fetched ( the request is retried till deadline, see _fetch_with_retries ). If mac has a select group in
+            the switch, the packet-count of the group's bucket for port is returned instead.
+        '''
+        group = self.select_groups.get(switch_id, mac)
+        if group is not None:
+            json = self._fetch_with_retries(lambda timeout: self.connector.get_group(switch_id, group.group_id, timeout=timeout), 'get_group', deadline)
+            return self._bucket_packet_count(json, port)
+
+        flow_id = self.find_flow_id(switch_id, mac, port)
+        if flow_id is None:
+            return None
+        json = self._fetch_with_retries(lambda timeout: self.connector.get_flow(switch_id, flow_id, table_id, timeout=timeout), 'get_flow', deadline)
+
+        return self._flow_packet_count(json)
+
+
+    def get_flow_packet_count_async(self, switch_id, mac, port, table_id=0, deadline=None):
+        '''
+            Asynchronous version of get_flow_packet_count, returns a Future
+        '''
+        group = self.select_groups.get(switch_id, mac)
+        if group is not None:
+            fetched = self._fetch_with_retries_async(lambda timeout: self.connector.get_group_async(switch_id, group.group_id, timeout=timeout), 'get_group', deadline)
+            return fetched.then(lambda json: self._bucket_packet_count(json, port))
+
+        flow_id = self.find_flow_id(switch_id, mac, port)
+        if flow_id is None:
+            return Future.completed(None)
+        return self._fetch_with_retries_async(lambda timeout: self.connector.get_flow_async(switch_id, flow_id, table_id, timeout=timeout), 'get_flow', deadline).then(self._flow_packet_count)
+
+
+    @staticmethod
+    def _flow_packet_count(json):
+        if json == None:
+            return None
+        return json['flow-node-inventory:flow'][0]['opendaylight-flow-statistics:flow-statistics']['packet-count']
+
+
+    @staticmethod
+    def _bucket_packet_count(json, port_num):
+        if json == None:
+            return None
+        for group in json.get('flow-node-inventory:group', []):
+            stats = group.get('opendaylight-group-statistics:group-statistics', {})
+            for bucket in stats.get('buckets', {}).get('bucket-counter', []):
+                if str(bucket['bucket-id']) == port_num:     # The buckets are numbered after their ports
+                    return bucket['packet-count']
+        return None
+
+
+    def get_switch_packet_counts(self, switch_id, table_id=0, deadline=None):
+        '''
+            Return the packet-count of every port forward flow in a table of a switch, fetching the
+            whole table with a single request ( retried till deadline, see _fetch_with_retries ).
+
+            If the switch has select groups, the whole switch is fetched instead ( still a single request ) and the
+            packet-count of each bucket of a group is returned for ( mac, port_number of the bucket ).
+
+            Returns:
+                A dictionary { (mac, port_number): packet_count } or None if the request failed.
+        '''
+        if self.select_groups.has_groups(switch_id):
+            json = self._fetch_with_retries(lambda timeout: self.connector.get_node(switch_id, timeout=timeout), 'get_node', deadline)
+            return self._node_packet_counts(json, switch_id, table_id)
+
+        json = self._fetch_with_retries(lambda timeout: self.connector.get_table(switch_id, table_id, timeout=timeout), 'get_table', deadline)
+        return self._table_packet_counts(json, switch_id)
+
+
+    def get_switch_packet_counts_async(self, switch_id, table_id=0, deadline=None):
+        '''
+            Asynchronous version of get_switch_packet_counts, returns a Future
+        '''
+        if self.select_groups.has_groups(switch_id):
+            fetched = self._fetch_with_retries_async(lambda timeout: self.connector.get_node_async(switch_id, timeout=timeout), 'get_node', deadline)
+            return fetched.then(lambda json: self._node_packet_counts(json, switch_id, table_id))
+
+        return self._fetch_with_retries_async(lambda timeout: self.connector.get_table_async(switch_id, table_id, timeout=timeout), 'get_table', deadline).then(lambda json: self._table_packet_counts(json, switch_id))
+
+
+    def _table_packet_counts(self, json, switch_id):
+        if json == None:
+            return None
+
+        packet_counts = {}
+        for table in json.get('flow-node-inventory:table', []):
+            for flow in table.get('flow', []):
+                ids = self.parse_flow_id(flow['id'])
+                stats = flow.get('opendaylight-flow-statistics:flow-statistics')
+                if ids == None or stats == None:
+                    continue
+
+                (_, mac, port_num) = ids
+                if port_num == None:
+                    # The id of the 'destination' scheme has no port, take it from the registry ( or the flow's body )
+                    installed = self.port_forward_flows.get(switch_id, flow['id'])
+                    port_num = installed.port_num if installed is not None else self._output_port(flow)
+                    if port_num == None:
+                        continue
+                packet_counts[(mac, port_num)] = stats['packet-count']
+
+        return packet_counts
+
+
+    def _node_packet_counts(self, json, switch_id, table_id):
+        if json == None:
+            return None
+
+        packet_counts = {}
+        for node in json.get('node', []):
+            tables = [table for table in node.get('flow-node-inventory:table', []) if table.get('id') == table_id]
+            packet_counts.update(self._table_packet_counts({'flow-node-inventory:table': tables}, switch_id))
+
+            for group in node.get('flow-node-inventory:group', []):
+                installed = self.select_groups.get_by_id(switch_id, group['group-id'])
+                stats = group.get('opendaylight-group-statistics:group-statistics')
+                if installed == None or stats == None:
+                    continue
+
+                for bucket in stats.get('buckets', {}).get('bucket-counter', []):
+                    packet_counts[(installed.mac, str(bucket['bucket-id']))] = bucket['packet-count']
+
+        return packet_counts
+
+
+    def get_configured_flows(self, switch_ids, table_id=0):
+        '''
+            Read the port forward flows configured in the switches from the server's config datastore,
+            one request per switch ( sent concurrently ).
+
+            Returns:
+                A dictionary { switch_id: { (mac, port_number): (flow_id, priority), ... } } with None for the switches
+                whose request failed. The port_number of the flows of the 'destination' scheme and the priority are
+                read from their body, they are None if the server did not return them.
+        '''
+        def read(switch_id):
+            json = self.connector.get_config_table(switch_id, table_id)
+            if json == None:
+                return None
+
+            configured = {}
+            for table in json.get('flow-node-inventory:table', []):
+                for flow in table.get('flow', []):
+                    ids = self.parse_flow_id(flow['id'])
+                    if ids != None:
+                        port_num = ids[2] if ids[2] != None else self._output_port(flow)
+                        configured[(ids[1], port_num)] = (flow['id'], flow.get('priority'))
+            return configured
+
+        switch_ids = list(switch_ids)
+        return dict(zip(switch_ids, self.push_pool.map(read, switch_ids)))
+
+
+    def adopt_flows(self, flows, flow_ids=None, priorities=None):
+        '''
+            Register port forward flows that are already installed ( by a previous run ), without sending any request.
+
+            Parameters:
+                flows: An iterable of ( switch_id, mac, port ) tuples.
+                flow_ids: The ids the flows are installed with (key: (switch_id, mac, port), value: flow_id ),
+                    the flows missing from it are given the id of gen_flow_id.
+                priorities: The priorities the flows are installed with (key: (switch_id, mac, port), value: priority ),
+                    the flows missing from it are assumed to have the base one ( see _flow_priority ).
+        '''
+        for flow in flows:
+            (switch_id, mac, port_num) = flow
+            flow_id = flow_ids.get(flow) if flow_ids is not None else None
+            if flow_id is None:
+                flow_id = self.gen_flow_id(switch_id, mac, port_num)
+            priority = priorities.get(flow) if priorities is not None else None
+            self.port_forward_flows.add(switch_id, flow_id, mac, port_num, priority)
+
+
+    def get_configured_groups(self, switch_ids):
+        '''
+            Read the select groups configured in the switches from the server's config datastore, one request
+            per switch ( sent concurrently ). A group belongs to the destination of the flow sending packets to
+            it, or of the flow it is named after ( see add_select_group ) if that flow is gone.
+
+            Returns:
+                A dictionary { switch_id: { mac: (group_id, flow_id, buckets), ... } } with None for the switches whose
+                request failed. flow_id is None for a group without its flow, buckets is a { port_number: weight }
+                dictionary.
+        '''
+        def read(switch_id):
+            json = self.connector.get_config_node(switch_id)
+            if json == None:
+                return None
+
+            configured = {}
+            for node in json.get('node', []):
+                flows = {}      # The flows sending packets to groups (key: group_id, value: (mac, flow_id) )
+                for table in node.get('flow-node-inventory:table', []):
+                    for flow in table.get('flow', []):
+                        ids = self.parse_group_flow_id(flow['id'])
+                        group_id = self._group_action(flow)
+                        if ids != None and group_id != None:
+                            flows[group_id] = (ids[1], flow['id'])
+
+                for group in node.get('flow-node-inventory:group', []):
+                    group_id = int(group['group-id'])
+                    (mac, flow_id) = flows.get(group_id, (None, None))
+                    if mac == None:
+                        ids = self.parse_group_flow_id(group.get('group-name', ''))
+                        if ids == None:
+                            continue        # Not a group of the manager
+                        mac = ids[1]
+
+                    buckets = {}
+                    for bucket in group.get('buckets', {}).get('bucket', []):
+                        try:
+                            port_num = str(bucket['action'][0]['output-action']['output-node-connector'])
+                        except (KeyError, IndexError, TypeError):
+                            port_num = str(bucket['bucket-id'])     # The buckets are numbered after their port
+                        buckets[port_num] = bucket.get('weight', 1)
+                    configured[mac] = (group_id, flow_id, buckets)
+            return configured
+
+        switch_ids = list(switch_ids)
+        return dict(zip(switch_ids, self.push_pool.map(read, switch_ids)))
+
+
+    def adopt_groups(self, groups):
+        '''
+            Register select groups that are already installed ( by a previous run ), without sending any request.
+            They keep their ids ( see GroupRegistry.adopt ).
+
+            Parameters:
+                groups: An iterable of ( switch_id, mac, group_id, flow_id, buckets ) tuples, flow_id is None for a
+                    group without its flow.
+        '''
+        for (switch_id, mac, group_id, flow_id, buckets) in groups:
+            self.select_groups.adopt(switch_id, group_id, flow_id, mac, buckets)
 
 
     def delete_port_forward_flow(self, switch_id, mac, port, table_id=0):
         '''
             Deletes a port forward flow with id equal to flow_id
         '''
-        flow_id = self.gen_flow_id(switch_id, mac, port)
+        flow_id = self.find_flow_id(switch_id, mac, port)
+        if flow_id is None:
+            return True     # Not installed ( or already overwritten by a flow to another port )
         success = self.connector.delete_flow(switch_id, flow_id)
         if success:
-            self.port_forward_flows.remove( (switch_id, flow_id) )
+            self.port_forward_flows.remove(switch_id, flow_id)
+
+        return success
+
+
+    def delete_port_forward_flow_async(self, switch_id, mac, port, table_id=0):
+        '''
+            Asynchronous version of delete_port_forward_flow ( needs an AsyncApiConnector ), returns a Future
+        '''
+        flow_id = self.find_flow_id(switch_id, mac, port)
+        if flow_id is None:
+            return Future.completed(True)
+
+        def unregister(success):
+            if success:
+                self.port_forward_flows.remove(switch_id, flow_id)
+            return success
+
+        return self.connector.delete_flow_async(switch_id, flow_id).then(unregister)
+
+
+    def modify_port_forward_flow(self, switch_id, mac, old_port, new_port):
+        '''
+            Move the port forward flow of mac from old_port to new_port: the new flow is added before the old
+            one is deleted ( the old one is kept if the new one could not be added ). The new flow gets the other
+            priority ( see _flow_priority ), so deleting the old one leaves it installed. With the 'destination'
+            scheme both flows have the same id, the PUT overwrites the old flow and nothing is left to delete,
+            unless the old flow was installed under the 'port' scheme ( see NetworkOptimizer.reconcile_flows ).
+        '''
+        if not self.add_port_forward_flow(switch_id, mac, new_port):
+            return False
+        return self.delete_port_forward_flow(switch_id, mac, old_port)
+
+
+    def modify_port_forward_flow_async(self, switch_id, mac, old_port, new_port):
+        '''
+            Asynchronous version of modify_port_forward_flow, returns a Future
+        '''
+        modified = Future()
+
+        def added(future):
+            if future._error is None and future.result():
+                self.delete_port_forward_flow_async(switch_id, mac, old_port).add_done_callback(lambda future: modified.set_result(future._error is None and future.result()))
+            else:
+                modified.set_result(False)
+
+        self.add_port_forward_flow_async(switch_id, mac, new_port).add_done_callback(added)
+        return modified
+
+
+    def add_select_group(self, switch_id, mac, buckets):
+        '''
+            Creates a select group sharing the packets to mac between the ports of buckets ( key: port_number,
+            value: weight ) and the flow sending them to it. The group is written before the flow, so the
+            flow never points to a missing group. The group is named after the flow, so it can be told
+            apart in the switch ( see get_configured_groups ).
+        '''
+        group_id = self.select_groups.group_id(switch_id, mac)
+        flow_id = self.gen_group_flow_id(switch_id, mac)
+        content_type = self.xml_creator.content_type
+
+        if not self.connector.put_group(self.xml_creator.crete_select_group(group_id, buckets, flow_id), switch_id, group_id, content_type=content_type):
+            return False
+        if not self.connector.put_flow(self._group_flow_xml(switch_id, mac, flow_id, group_id), switch_id, flow_id, content_type=content_type):
+            return False
+
+        self.select_groups.add(switch_id, group_id, flow_id, mac, buckets)
+        return True
+
+
+    def add_select_group_async(self, switch_id, mac, buckets):
+        '''
+            Asynchronous version of add_select_group ( needs an AsyncApiConnector ), returns a Future
+        '''
+        group_id = self.select_groups.group_id(switch_id, mac)
+        flow_id = self.gen_group_flow_id(switch_id, mac)
+        content_type = self.xml_creator.content_type
+
+        def register(success):
+            if success:
+                self.select_groups.add(switch_id, group_id, flow_id, mac, buckets)
+            return success
+
+        group = self.connector.put_group_async(self.xml_creator.crete_select_group(group_id, buckets, flow_id), switch_id, group_id, content_type=content_type)
+        return self._if_succeeded(group, lambda: self.connector.put_flow_async(self._group_flow_xml(switch_id, mac, flow_id, group_id), switch_id, flow_id, content_type=content_type).then(register))
+
+
+    def modify_select_group(self, switch_id, mac, buckets):
+        '''
+            Replace the buckets of the select group of mac in switch_id with a single PUT ( the flow sending the
+            packets to it is kept ). Creates the group if it is not installed.
+        '''
+        group = self.select_groups.get(switch_id, mac)
+        if group is None or group.flow_id is None:
+            return self.add_select_group(switch_id, mac, buckets)
+
+        success = self.connector.put_group(self.xml_creator.crete_select_group(group.group_id, buckets, group.flow_id), switch_id, group.group_id, content_type=self.xml_creator.content_type)
+        if success:
+            self.select_groups.add(switch_id, group.group_id, group.flow_id, mac, buckets)
+
+        return success
+
+
+    def modify_select_group_async(self, switch_id, mac, buckets):
+        '''
+            Asynchronous version of modify_select_group, returns a Future
+        '''
+        group = self.select_groups.get(switch_id, mac)
+        if group is None or group.flow_id is None:
+            return self.add_select_group_async(switch_id, mac, buckets)
+
+        def register(success):
+            if success:
+                self.select_groups.add(switch_id, group.group_id, group.flow_id, mac, buckets)
+            return success
+
+        return self.connector.put_group_async(self.xml_creator.crete_select_group(group.group_id, buckets, group.flow_id), switch_id, group.group_id, content_type=self.xml_creator.content_type).then(register)
+
+
+    def delete_select_group(self, switch_id, mac, buckets=None):
+        '''
+            Deletes the select group of mac in switch_id: the flow sending the packets to it first, then the group.
+            ( buckets is not used, it is there to take the tuples of apply_group_changes )
+        '''
+        group = self.select_groups.get(switch_id, mac)
+        if group is None:
+            return True
+
+        if group.flow_id is not None:
+            if not self.connector.delete_flow(switch_id, group.flow_id):
+                return False
+            # Keep the group without its flow till the group is deleted too
+            self.select_groups.add(switch_id, group.group_id, None, mac, group.buckets)
+
+        success = self.connector.delete_group(switch_id, group.group_id)
+        if success:
+            self.select_groups.remove(switch_id, mac)
+
+        return success
+
+
+    def delete_select_group_async(self, switch_id, mac, buckets=None):
+        '''
+            Asynchronous version of delete_select_group, returns a Future
+        '''
+        group = self.select_groups.get(switch_id, mac)
+        if group is None:
+            return Future.completed(True)
+
+        def delete_group():
+            def unregister(success):
+                if success:
+                    self.select_groups.remove(switch_id, mac)
+                return success
+            return self.connector.delete_group_async(switch_id, group.group_id).then(unregister)
+
+        if group.flow_id is None:
+            return delete_group()
+
+        def flow_deleted(success):
+            if success:
+                self.select_groups.add(switch_id, group.group_id, None, mac, group.buckets)
+            return success
+
+        return self._if_succeeded(self.connector.delete_flow_async(switch_id, group.flow_id).then(flow_deleted), delete_group)
+
+
+    @staticmethod
+    def _if_succeeded(future, function):
+        '''
+            Return a Future with the result of the Future function() returns, once future succeeded, or False if it failed
+        '''
+        chained = Future()
+
+        def check(future):
+            if future._error is None and future.result():
+                function().add_done_callback(lambda next_future: chained.set_result(next_future._error is None and next_future.result()))
+            else:
+                chained.set_result(False)
+
+        future.add_done_callback(check)
+        return chained
+
+
+    def modify_requests(self, switch_id, mac, old_port, new_port):
+        '''
+            Return the number of requests modify_port_forward_flow sends: 1 if it overwrites the old flow, else 2
+        '''
+        return 1 if self.find_flow_id(switch_id, mac, old_port) == self.gen_flow_id(switch_id, mac, new_port) else 2
+
+
+    def apply_flow_changes(self, add_flows, del_flows, per_switch=flow_push_per_switch, modify_flows=()):
+        '''
+            Push a batch of port forward flow changes concurrently. All the new flows are added before any
+            old flow is deleted (make-before-break), so while the batch runs the packets always match
+            either the old or the new flow and are never flooded. A new flow to a destination that still
+            has a flow in the switch is installed with the other priority ( see _flow_priority ), so deleting
+            the old flow afterwards does not delete the new one.
+
+            Parameters:
+                add_flows & del_flows: Lists of ( switch_id, mac, port ) tuples with the flows to add / delete.
+                per_switch: The maximum number of requests in flight for the same switch.
+                modify_flows: A list of ( switch_id, mac, old_port, new_port ) tuples with the flows to move to
+                    another port ( with the additions, see modify_port_forward_flow ).
+
+            Returns:
+                report: A dictionary formated like
+                    {
+                        switch_id: {
+                            'requests': number of requests sent,
+                            'failures': [ ('add' | 'delete' | 'modify', mac, port), ... ],
+                            'max_latency': the slowest request (in seconds),
+                            'elapsed': time from the start of the batch till the switch's last request finished (in seconds)
+                        },
+                        ...
+                    }
+        '''
+        first_tasks = self._interleave_by_switch('add', add_flows) + self._interleave_by_switch('modify', modify_flows)
+        return self._apply_tasks(first_tasks, self._interleave_by_switch('delete', del_flows), per_switch)
+
+
+    def apply_flow_changes_async(self, add_flows, del_flows, per_switch=flow_push_per_switch, modify_flows=()):
+        '''
+            Asynchronous version of apply_flow_changes ( needs an AsyncApiConnector ), returns a Future with the report
+        '''
+        first_tasks = self._interleave_by_switch('add', add_flows) + self._interleave_by_switch('modify', modify_flows)
+        return self._apply_tasks_async(first_tasks, self._interleave_by_switch('delete', del_flows), per_switch)
+
+
+    def apply_group_changes(self, add_groups, del_groups, modify_groups, per_switch=flow_push_per_switch):
+        '''
+            Same as apply_flow_changes for select groups ( see add_select_group ): the groups are added and
+            updated before any is deleted.
+
+            Parameters:
+                add_groups, del_groups & modify_groups: Lists of ( switch_id, mac, buckets ) tuples with the groups to
+                    add / delete / update ( buckets: {port_number: weight} ).
+
+            Returns:
+                report: Formated like the one of apply_flow_changes, with ( 'add_group' | 'delete_group' | 'modify_group', mac, buckets )
+                    failures.
+        '''
+        first_tasks = self._interleave_by_switch('add_group', add_groups) + self._interleave_by_switch('modify_group', modify_groups)
+        return self._apply_tasks(first_tasks, self._interleave_by_switch('delete_group', del_groups), per_switch)
+
+
+    # The method applying each action of a batch ( the asynchronous one is named with an '_async' suffix )
+    task_methods = {
+        'add': 'add_port_forward_flow',
+        'modify': 'modify_port_forward_flow',
+        'delete': 'delete_port_forward_flow',
+        'add_group': 'add_select_group',
+        'modify_group': 'modify_select_group',
+        'delete_group': 'delete_select_group'
+    }
+
+    def _task_requests(self, action, item):
+        '''
+            Return the number of requests a task of a batch sends
+        '''
+        if action == 'modify':
+            return self.modify_requests(*item)
+        return 2 if action in ('add_group', 'delete_group') else 1
+
+
+    def _apply_tasks(self, first_tasks, last_tasks, per_switch):
+        '''
+            Run a batch of ( action, item ) tasks concurrently, the first_tasks before the last_tasks, keeping at most
+            per_switch of them in flight for the same switch ( the first field of every item ). Returns the report
+            of apply_flow_changes.
+        '''
+        if self.connector.asynchronous:
+            return self._apply_tasks_async(first_tasks, last_tasks, per_switch).result()
+
+        started = time()
+        report = {}
+        report_lock = threading.Lock()
+        semaphores = {item[0]: threading.BoundedSemaphore(per_switch) for (_, item) in first_tasks + last_tasks}
+
+        def push(task):
+            (action, item) = task
+            switch_id = item[0]
+            with semaphores[switch_id]:
+                requests = self._task_requests(action, item)
+                sent = time()
+                try:
+                    success = getattr(self, self.task_methods[action])(*item)
+                except RequestException as error:
+                    # A connection error fails this task only, the rest of the batch goes on
+                    print '[ERR] While pushing {} {} to switch: {}: {}'.format(action, item[1], switch_id, error)
+                    success = False
+                finished = time()
+
+            with report_lock:
+                switch_report = report.setdefault(switch_id, {'requests': 0, 'failures': [], 'max_latency': 0.0, 'elapsed': 0.0})
+                switch_report['requests'] += requests
+                switch_report['max_latency'] = max(switch_report['max_latency'], finished - sent)
+                switch_report['elapsed'] = max(switch_report['elapsed'], finished - started)
+                if not success:
+                    switch_report['failures'].append( (action, item[1], item[-1]) )
+
+        # First add the new flows ( and move the modified ones ), then delete the old ones
+        self.push_pool.map(push, first_tasks)
+        self.push_pool.map(push, last_tasks)
+
+        return report
+
+
+    def _apply_tasks_async(self, first_tasks, last_tasks, per_switch):
+        '''
+            Asynchronous version of _apply_tasks ( needs an AsyncApiConnector ): all the requests of the batch are
+            issued from the event loop at once, a semaphore per switch keeps at most per_switch of them in flight
+            for the same switch. Returns a Future with the report.
+        '''
+        started = time()
+        report = {}
+        pushed = Future()
+        semaphores = {item[0]: AsyncSemaphore(per_switch) for (_, item) in first_tasks + last_tasks}
+
+        def push(tasks, then):
+            # Push tasks and call then() once all of them finished
+            remaining = [len(tasks)]
+            if not tasks:
+                then()
+
+            def start(action, item):
+                requests = self._task_requests(action, item)
+                sent = time()
+                future = getattr(self, self.task_methods[action] + '_async')(*item)
+                future.add_done_callback(lambda future: finish(action, item, requests, sent, future))
+
+            def finish(action, item, requests, sent, future):
+                switch_id = item[0]
+                semaphores[switch_id].release()
+                finished = time()
+                success = future._error is None and future.result()
+
+                switch_report = report.setdefault(switch_id, {'requests': 0, 'failures': [], 'max_latency': 0.0, 'elapsed': 0.0})
+                switch_report['requests'] += requests
+                switch_report['max_latency'] = max(switch_report['max_latency'], finished - sent)
+                switch_report['elapsed'] = max(switch_report['elapsed'], finished - started)
+                if not success:
+                    switch_report['failures'].append( (action, item[1], item[-1]) )
+
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    then()
+
+            for (action, item) in tasks:
+                semaphores[item[0]].acquire(lambda action=action, item=item: start(action, item))
+
+        # First add the new flows ( and move the modified ones ), then delete the old ones ( in the event loop's thread )
+        self.connector.loop.call_soon(push, first_tasks, lambda: push(last_tasks, lambda: pushed.set_result(report)))
+        return pushed
+
+
+    @staticmethod
+    def _interleave_by_switch(action, flows):
+        '''
+            Order ( switch_id, mac, port ) flows ( or any tuples starting with the switch_id ) round-robin across switches, so the workers of the pool
+            spread over all switches instead of queueing on the fan-out limit of a single one.
+            Returns a list of ( action, flow ) tasks.
+        '''
+        by_switch = {}
+        for flow in flows:
+            by_switch.setdefault(flow[0], []).append(flow)
+
+        tasks = []
+        queues = by_switch.values()
+        for idx in range(max([len(queue) for queue in queues] + [0])):
+            for queue in queues:
+                if idx < len(queue):
+                    tasks.append( (action, queue[idx]) )
+        return tasks
 
 
     def delete_all_flows(self):
         '''
-            Deletes all flows added by the manager from the server.
+            Deletes all flows ( and select groups ) added by the manager from the server.
         '''
-        for (switch_id, flow_id) in self.port_forward_flows:
-            self.connector.delete_flow(switch_id, flow_id)            
-        self.port_forward_flows = []
\ No newline at end of file
+        if self.connector.asynchronous:
+            Future.gather([self.connector.delete_flow_async(flow.switch_id, flow.flow_id) for flow in self.port_forward_flows]).result()
+            Future.gather([self.delete_select_group_async(group.switch_id, group.mac) for group in self.select_groups]).result()
+        else:
+            for flow in self.port_forward_flows:
+                self.connector.delete_flow(flow.switch_id, flow.flow_id)
+            for group in self.select_groups:
+                self.delete_select_group(group.switch_id, group.mac)
+        self.port_forward_flows.clear()
+        self.select_groups.clear()
\ No newline at end of file
@@ -0,0 +1,238 @@
+import BaseHTTPServer
+import logging
+import logging.handlers
+import threading
+from time import time
+from src.params import metrics_enabled, metrics_port, metrics_file, metrics_file_interval, metrics_file_max_bytes, metrics_file_backups
+
+
+# The upper bounds of the histograms' buckets (in seconds)
+default_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metrics:
+    '''
+        Keeps the daemon's metrics and renders them in the Prometheus text format:
+            - counters: totals that only grow ( like the flows added )
+            - gauges: values that are set ( like the flows installed )
+            - histograms: the distribution of observed values ( like the latency of the requests )
+
+        Each metric can have labels, given as keyword arguments ( like phase='recompute' ).
+    '''
+
+    def __init__(self, buckets=default_buckets):
+        self.buckets = buckets
+        self.counters = {}      # (key: (name, labels), value: total )
+        self.gauges = {}        # (key: (name, labels), value: value )
+        self.histograms = {}    # (key: (name, labels), value: [ count per bucket..., count, sum ] )
+        self.lock = threading.Lock()
+
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.gauges[key] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * (len(self.buckets) + 2)
+            for idx, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[idx] += 1
+            histogram[-2] += 1
+            histogram[-1] += value
+
+    def timer(self, name, **labels):
+        '''
+            A context manager observing the time spent in its block in histogram name
+        '''
+        return _Timer(self, name, labels)
+
+
+    def render(self):
+        '''
+            Return all the metrics in the Prometheus text format
+        '''
+        with self.lock:
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+            histograms = sorted((key, list(histogram)) for key, histogram in self.histograms.items())
+
+        lines = []
+        for (kind, metrics) in [('counter', counters), ('gauge', gauges)]:
+            typed = set()
+            for (name, labels), value in metrics:
+                if name not in typed:
+                    typed.add(name)
+                    lines.append('# TYPE {} {}'.format(name, kind))
+                lines.append('{}{} {}'.format(name, self._labels(labels), value))
+
+        typed = set()
+        for (name, labels), histogram in histograms:
+            if name not in typed:
+                typed.add(name)
+                lines.append('# TYPE {} histogram'.format(name))
+            for bound, count in zip(self.buckets, histogram):
+                lines.append('{}_bucket{} {}'.format(name, self._labels(labels + (('le', repr(bound)),)), count))
+            lines.append('{}_bucket{} {}'.format(name, self._labels(labels + (('le', '+Inf'),)), histogram[-2]))
+            lines.append('{}_count{} {}'.format(name, self._labels(labels), histogram[-2]))
+            lines.append('{}_sum{} {}'.format(name, self._labels(labels), histogram[-1]))
+
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _labels(labels):
+        if not labels:
+            return ''
+        return '{' + ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"')) for name, value in labels) + '}'
+
+
+class _Timer(object):
+
+    __slots__ = ('metrics', 'name', 'labels', 'started')
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time() - self.started, **self.labels)
+        return False
+
+
+class NullMetrics:
+    '''
+        The disabled Metrics: every call does nothing, so the instrumentation costs next to nothing
+    '''
+
+    def inc(self, name, value=1, **labels):
+        pass
+
+    def set(self, name, value, **labels):
+        pass
+
+    def observe(self, name, value, **labels):
+        pass
+
+    def timer(self, name, **labels):
+        return _null_timer
+
+    def render(self):
+        return ''
+
+
+class _NullTimer(object):
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_null_timer = _NullTimer()
+
+
+# The metrics of the process, shared by all the components
+metrics = Metrics() if metrics_enabled else NullMetrics()
+
+
+
+class MetricsServer:
+    '''
+        Serves the metrics in the Prometheus text format at http://host:port/metrics, in a background thread
+    '''
+
+    def __init__(self, metrics, port=metrics_port, host='127.0.0.1'):
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                content = metrics.render()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = BaseHTTPServer.HTTPServer((host, port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MetricsFile:
+    '''
+        Appends the metrics ( in the Prometheus text format, after a '# time' line ) to a file every
+        interval seconds, in a background thread. The file is rotated when it grows over max_bytes.
+    '''
+
+    def __init__(self, metrics, path=metrics_file, interval=metrics_file_interval, max_bytes=metrics_file_max_bytes, backups=metrics_file_backups):
+        self.metrics = metrics
+        self.interval = interval
+        self.logger = logging.getLogger('optimizer.metrics')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups)
+        self.logger.addHandler(self.handler)
+
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._write)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.write()
+        self.logger.removeHandler(self.handler)
+        self.handler.close()
+
+    def write(self):
+        self.logger.info('# time {:.3f}\n{}'.format(time(), self.metrics.render()))
+
+    def _write(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+
+def start_exporters():
+    '''
+        Start exporting the metrics as configured in src/params.py. Returns the exporters started ( to stop them ).
+    '''
+    exporters = []
+    if not metrics_enabled:
+        return exporters
+
+    if metrics_port:
+        exporters.append(MetricsServer(metrics).start())
+    if metrics_file:
+        exporters.append(MetricsFile(metrics).start())
+    return exporters
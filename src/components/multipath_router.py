@@ -0,0 +1,142 @@
+from src.params import multipath_k, multipath_slack, multipath_bucket_total, multipath_rebalance
+
+
+class MultipathRouter:
+    '''
+        Splits the packets to each destination between several paths ( weighted ECMP ), instead of the single
+        dijkstra path of NetworkOptimizer.gen_optimized_flows, so the traffic of a busy destination can be
+        spread over many links instead of being moved as a whole.
+
+        One dijkstra towards each destination host gives the cost of its shortest path from every switch. The
+        next hops of a switch are its neighbors ( the k cheapest ) that are closer to the destination and whose
+        path costs at most slack times the switch's own. Every hop gets closer to the destination, so the
+        packets never loop. The switches reached from the other hosts get a select group per destination, with
+        a bucket per next hop weighted inversely to the measured load ( the graph weight ) of the bucket's port.
+    '''
+
+    def __init__(self, topology, k=multipath_k, slack=multipath_slack, bucket_total=multipath_bucket_total, rebalance=multipath_rebalance):
+        self.topology = topology
+        self.k = k
+        self.slack = slack
+        self.bucket_total = bucket_total    # The weights of the buckets of a group add up to about bucket_total
+        self.rebalance = rebalance          # The change of a bucket's share that is worth rewriting its group
+        self.groups = {}                    # The select groups of the last routing (key: (switch_id, mac), value: {port_number: weight} )
+
+
+    def gen_groups(self):
+        '''
+            Compute the select groups for the current weights of the graph.
+
+            Returns:
+                groups: A dictionary { (switch_id, mac): {port_number: weight, ...}, ... } with the buckets of the
+                    group forwarding the packets to mac in switch_id.
+        '''
+        topology = self.topology
+        succ = topology.graph.succ
+        groups = {}
+
+        for host_id in topology.hosts.keys():
+            mac = topology.host_id_to_mac(host_id)
+            dist = topology.routing_engine.get_distances_to(host_id)
+
+            # Walk the next hops from the switches of the other hosts
+            stack = [node_id for src in topology.hosts if src != host_id and src in dist for node_id in succ[src] if node_id in topology.switches]
+            visited = set(stack)
+            while stack:
+                switch_id = stack.pop()
+                next_hops = self.next_hops(switch_id, dist)
+                if not next_hops:
+                    continue
+
+                groups[(switch_id, mac)] = self.bucket_weights(switch_id, next_hops)
+                for node_id in next_hops:
+                    if node_id in topology.switches and node_id not in visited:
+                        visited.add(node_id)
+                        stack.append(node_id)
+
+        self.groups = groups
+        return groups
+
+
+    def next_hops(self, switch_id, dist):
+        '''
+            Return the next hops of switch_id towards the destination whose distances are dist ( see
+            RoutingEngine.get_distances_to ), the cheapest first
+        '''
+        own = dist.get(switch_id)
+        if own is None:
+            return []
+
+        limit = own * self.slack * (1 + 1e-9)      # Equal costs may differ by rounding errors
+        candidates = []
+        for node_id, attrs in self.topology.graph.succ[switch_id].items():
+            if node_id in dist and dist[node_id] < own:
+                cost = attrs['weight'] + dist[node_id]
+                if cost <= limit:
+                    candidates.append( (cost, node_id) )
+
+        candidates.sort()
+        return [node_id for (_, node_id) in candidates[:self.k]]
+
+
+    def bucket_weights(self, switch_id, next_hops):
+        '''
+            Return the buckets { port_number: weight } of a group of switch_id sending to next_hops: each port
+            gets a share of bucket_total inversely proportional to its load ( at least 1 )
+        '''
+        switch = self.topology.switches[switch_id]
+        edges = self.topology.graph.succ[switch_id]
+        room = {switch.get_port_num(node_id): 1.0 / max(edges[node_id]['weight'], 1) for node_id in next_hops}
+
+        total = sum(room.values())
+        return {port_num: max(1, int(round(self.bucket_total * share / total))) for port_num, share in room.items()}
+
+
+    def needs_update(self, old_buckets, new_buckets):
+        '''
+            Return True if a group's buckets changed enough to rewrite it: its ports changed or the share of a
+            bucket moved by more than rebalance
+        '''
+        if set(old_buckets) != set(new_buckets):
+            return True
+
+        old_total = float(sum(old_buckets.values()))
+        new_total = float(sum(new_buckets.values()))
+        return any(abs(old_buckets[port_num] / old_total - new_buckets[port_num] / new_total) > self.rebalance for port_num in new_buckets)
+
+
+    def diff(self, installed):
+        '''
+            Compare the groups of the last routing with the installed ones.
+
+            Parameters:
+                installed: The buckets of the installed groups (key: (switch_id, mac), value: {port_number: weight} )
+
+            Returns:
+                (add_groups, del_groups, modify_groups): Lists of ( switch_id, mac, buckets ) tuples with the groups to
+                    add, delete and rewrite ( see needs_update ).
+        '''
+        add_groups = []
+        modify_groups = []
+        for key, buckets in self.groups.items():
+            old_buckets = installed.get(key)
+            if old_buckets is None:
+                add_groups.append( key + (buckets,) )
+            elif self.needs_update(old_buckets, buckets):
+                modify_groups.append( key + (buckets,) )
+
+        del_groups = [key + (buckets,) for key, buckets in installed.items() if key not in self.groups]
+        return add_groups, del_groups, modify_groups
+
+
+    def to_flows(self, flows):
+        '''
+            Fill flows, a depth-2 dictionary { switch_id: { port_number: set(), ...}, ... } like the one returned
+            by NetworkOptimizer.gen_empty_flows, with the ports of the groups' buckets ( a destination is listed
+            under every port of its group ). Returns flows.
+        '''
+        for (switch_id, mac), buckets in self.groups.items():
+            ports = flows.setdefault(switch_id, {})
+            for port_num in buckets:
+                ports.setdefault(port_num, set()).add(mac)
+        return flows
@@ -1,18 +1,52 @@
 from src.objects.topology import Topology
+from src.objects.forwarding_tables import ForwardingTables
 from src.components.api_connector import ApiConnector
+from src.components.async_connector import AsyncApiConnector
 from src.components.flow_manager import FlowManager
-from src.params import info_prints, monitor_interval
-from time import sleep
+from src.components.stats_poller import StatsPoller
+from src.components.flow_aggregator import FlowAggregator
+from src.components.scheduler import CycleScheduler
+from src.components.route_stabilizer import RouteStabilizer
+from src.components.parallel_router import ParallelRouter
+from src.components.multipath_router import MultipathRouter
+from src.components.state_store import StateStore
+from src.components.metrics import metrics, start_exporters
+from src.params import info_prints, monitor_interval, incremental_routing, aggregate_flows, scheduled_loop, route_damping, parallel_routing, stream_topology, topology_refresh_cycles, warm_start, state_save_cycles, async_io, forwarding_tables, flow_id_scheme, multipath
+from time import sleep, time
 import networkx as nx
+import resource
 import signal
 
+# NumPy is optional, it is only needed by the vectorized weights
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 class NetworkOptimizer:    
     
-    def __init__(self):
+    def __init__(self, connector=None):
         self.topology = Topology()
-        self.connector = ApiConnector()
-        self.flow_manager = FlowManager()
+        if connector is None:
+            connector = AsyncApiConnector() if async_io else ApiConnector()
+        self.connector = connector          # A connector to another server can be given ( like a simulator )
+        id_scheme = flow_id_scheme
+        if id_scheme == 'destination' and not forwarding_tables:
+            print '[ERR] The \'destination\' flow ids need forwarding_tables, using the \'port\' ones'
+            id_scheme = 'port'
+        self.flow_manager = FlowManager(self.connector, id_scheme)
+        self.stats_poller = StatsPoller(self.flow_manager)
+        self.flow_aggregator = FlowAggregator(self.topology)
+        self.route_stabilizer = RouteStabilizer(self.topology.graph)
+        self.parallel_router = ParallelRouter(self)
+        self.multipath_router = MultipathRouter(self.topology)      # Multipath mode: the select groups of the routing ( see src/params.py )
+        self.state_store = StateStore()
+        self.flow_refs = {}         # Incremental mode: the number of paths using each flow (key: (switch_id, mac, port), value: count )
+        self.forwarding_tables = ForwardingTables()     # The destination tables of the routing ( if forwarding_tables is set, see src/params.py )
+        self.refresh_requested = False      # Set by a SIGHUP, the daemon refreshes the topology in its next loop
+        self.flow_changes = [0, 0, 0]       # Number of flows pushed ( added, deleted, modified ) since the daemon started
+        self.flow_rates = {}                # The packet rate of each flow in the last weights (key: (switch_id, mac, port), value: rate )
 
     
     def load_topology(self):
@@ -20,16 +54,127 @@ class NetworkOptimizer:
             Load the topology managed by the odl server
         '''
 
+        started = time()
+
         # Parse topology from the json retrived by our connector class
-        self.topology.parse_topology_from_json( self.connector.get_topology_json() )
+        self.fetch_topology(self.topology)
 
         if (info_prints):
             print '[INFO] Topology'
             print '  Switches: ', len(self.topology.switches)
             print '  Hosts: ', len(self.topology.hosts)
             print '  Edges: ', self.topology.graph.number_of_edges()
+            print '  Parse time: {:.3f} s'.format(time() - started)
+            print '  Peak memory: {:.1f} MB'.format(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0)
     
 
+    def fetch_topology(self, topology):
+        '''
+            Parse the topology managed by the odl server into topology ( while it arrives if streaming )
+        '''
+        if stream_topology:
+            topology.parse_topology_from_stream( self.connector.stream_topology() or [] )
+        else:
+            topology.parse_topology_from_json( self.connector.get_topology_json() )
+
+
+    def refresh_topology(self, flows):
+        '''
+            Load the topology again and apply only what changed since it was loaded ( see Topology.apply_changes ):
+            only the paths the changes affect are recomputed ( and their flows counted again ) in incremental mode.
+
+            Parameters:
+                flows: The current flows, a depth-2 dictionary formated like the one returned by gen_optimized_flows
+
+            Returns:
+                The flows for the new topology ( in the same format ), or flows itself if nothing changed
+        '''
+        new_topology = Topology()
+        self.fetch_topology(new_topology)
+        if len(new_topology.graph) == 0:
+            print '[ERR] Could not refresh the topology, keeping the current one'
+            return flows
+
+        # The paths being replaced were routed through the switches as they were before the changes
+        old_switches = dict(self.topology.switches)
+        if not self.topology.apply_changes(new_topology):
+            return flows
+
+        if not incremental_routing or multipath:
+            return self.gen_optimized_flows()
+
+        # Repair the trees the changes affected and move the counts of the changed paths only, like update_optimized_flows
+        changed_paths = self.topology.get_changed_dijkstra_paths()
+        if route_damping:
+            self.route_stabilizer.recheck_paths()
+            changed_paths = self.route_stabilizer.stabilize_changes(changed_paths)
+
+        for (old_path, _) in changed_paths:
+            if old_path is not None:
+                for flow in self.get_path_flows(old_path, old_switches):
+                    self.flow_refs[flow] -= 1
+                    if self.flow_refs[flow] == 0:
+                        del self.flow_refs[flow]
+                    if forwarding_tables:
+                        self.forwarding_tables.remove_flow(flow)
+
+        self.renumber_flows(old_switches)
+
+        for (_, new_path) in changed_paths:
+            if new_path is not None:
+                for flow in self.get_path_flows(new_path):
+                    self.flow_refs[flow] = self.flow_refs.get(flow, 0) + 1
+                    if forwarding_tables:
+                        self.forwarding_tables.add_flow(flow)
+
+        if forwarding_tables:
+            self.forwarding_tables.diff()
+            return self.forwarding_tables.to_flows(self.gen_empty_flows())
+
+        new_flows = self.gen_empty_flows()
+        for (switch_id, mac, port_num) in self.flow_refs:
+            new_flows[switch_id][port_num].add(mac)
+        return new_flows
+
+
+    def renumber_flows(self, old_switches):
+        '''
+            Move the counted flows of the ports that were renumbered when the topology changed ( a switch connecting
+            the same neighbor at another port ): the paths through them did not change but their flows did.
+
+            Parameters:
+                old_switches: The switches before the changes (key: switch_id, value: Switch )
+        '''
+        # The new number of each renumbered port (key: (switch_id, old_port), value: new_port )
+        moved_ports = {}
+        for switch_id, switch in self.topology.switches.items():
+            old_switch = old_switches.get(switch_id)
+            if old_switch is None or old_switch is switch:
+                continue
+            for node_id, port_num in old_switch.neighbor_to_port.items():
+                new_port = switch.get_port_num(node_id)
+                if new_port not in ('', port_num):
+                    moved_ports[(switch_id, port_num)] = new_port
+
+        if not moved_ports:
+            return
+
+        for flow in [flow for flow in self.flow_refs if (flow[0], flow[2]) in moved_ports]:
+            count = self.flow_refs.pop(flow)
+            new_flow = (flow[0], flow[1], moved_ports[(flow[0], flow[2])])
+            self.flow_refs[new_flow] = self.flow_refs.get(new_flow, 0) + count
+            if forwarding_tables:
+                self.forwarding_tables.remove_flow(flow, count)
+                self.forwarding_tables.add_flow(new_flow, count)
+
+
+    def request_refresh(self, signalNumber, frame):
+        '''
+            Catches a signal (SIGHUP) and asks the daemon to refresh the topology in its next loop
+        '''
+        self.refresh_requested = True
+
+
     def optimizer_daemon(self):
         '''
             The load balancer runs for ever ( till you kill it with CTR+Z ) using packets_count as weighs for 
@@ -42,17 +187,36 @@ class NetworkOptimizer:
         #    using dijkstra paths for sortest path's calculation.
         #                       ---
 
-        # Create the optimized flows using dijkstra paths.
-        flows = self.gen_optimized_flows()
+        # Export the metrics ( if enabled, see src/params.py )
+        exporters = start_exporters()
 
-        if info_prints:
-            print '\n[INFO] Optimizing flows....'
+        # Start from the weights of the previous run, so the paths are the ones already installed
+        state = self.state_store.load() if warm_start else None
+        if state is not None:
+            self.restore_state(state)
 
-        # Create port forward flows to optimize the switch.        
-        for switch_id in flows.keys():
-            for port_num, macs_set in flows[switch_id].items():
-                for mac in macs_set:
-                    self.flow_manager.add_port_forward_flow(switch_id, mac, port_num)
+        # Create the optimized flows using dijkstra paths.
+        with metrics.timer('optimizer_phase_seconds', phase='recompute'):
+            if incremental_routing and not multipath:
+                flows = self.gen_empty_flows()
+                self.update_optimized_flows(flows)
+            else:
+                flows = self.gen_optimized_flows()
+
+        # Compress the flows to rules if asked to
+        with metrics.timer('optimizer_phase_seconds', phase='aggregate'):
+            rules = self.aggregate_flows(flows)
+
+        # Create port forward flows to optimize the switch ( only the missing ones if warm starting )
+        with metrics.timer('optimizer_phase_seconds', phase='push'):
+            if multipath and warm_start:
+                self.reconcile_groups(state)
+            elif multipath:
+                self.push_select_groups()
+            elif warm_start:
+                self.reconcile_flows(rules, state)
+            else:
+                self.push_flow_changes(self.flows_to_list(rules), [])
 
 
         #                       ---
@@ -61,21 +225,266 @@ class NetworkOptimizer:
 
         # Initialize a signlar handler for CRT Z signal
         signal.signal(signal.SIGTSTP, NetworkOptimizer.receiveSignal)        
-        while True:
-            # Monitor the traffic in a 'time interval' and calculate new weights for the topology graph
-            weights = self.calculate_weights(flows)
-            
-            # Update the network graph using the above weights
-            self.topology.update_graph_weights(weights)
 
-            # Get the optimized flows again using the new graph weights
-            new_flows = self.gen_optimized_flows()
+        # Refresh the topology on demand with a SIGHUP ( and every topology_refresh_cycles loops )
+        signal.signal(signal.SIGHUP, self.request_refresh)
+        cycles = 0
+
+        # Collect the stats on a fixed-rate timer, independent of the work done in each loop
+        scheduler = None
+        if scheduled_loop:
+            scheduler = CycleScheduler(self.stats_poller)
+            scheduler.start(rules)
+
+        try:
+            while True:
+                cycle_started = time()
+                (added, deleted, modified) = self.flow_changes
+
+                # Monitor the traffic in a 'time interval' and calculate new weights for the topology graph
+                with metrics.timer('optimizer_phase_seconds', phase='sample'):
+                    if scheduler is not None:
+                        weights = self.weights_from_snapshots(*scheduler.wait_for_sample())
+                    else:
+                        weights = self.calculate_weights(rules)
+
+                # Smooth the weights, so a single noisy sample does not move the paths
+                if route_damping:
+                    with metrics.timer('optimizer_phase_seconds', phase='smooth'):
+                        weights = self.route_stabilizer.smooth_weights(weights)
+
+                # Update the network graph using the above weights
+                with metrics.timer('optimizer_phase_seconds', phase='update_graph'):
+                    self.topology.update_graph_weights(weights)
+
+                with metrics.timer('optimizer_phase_seconds', phase='recompute'):
+                    if incremental_routing and not multipath:
+                        # Repair only the paths affected by the changed weights
+                        add_flows, del_flows, modify_flows = self.update_optimized_flows(flows)
+                    else:
+                        # Get the optimized flows again using the new graph weights
+                        flows = self.gen_optimized_flows()
+
+                if incremental_routing and not aggregate_flows and not multipath:
+                    # Push only the flows that changed
+                    with metrics.timer('optimizer_phase_seconds', phase='push'):
+                        self.push_flow_changes(add_flows, del_flows, modify_flows)
+                else:
+                    # Update the rules if any different
+                    with metrics.timer('optimizer_phase_seconds', phase='aggregate'):
+                        new_rules = self.aggregate_flows(flows)
+                    with metrics.timer('optimizer_phase_seconds', phase='push'):
+                        self.update_flows(new_rules, rules)
+
+                    # Store new rules for the next loop
+                    rules = new_rules
+
+                # Apply the changes of the topology, if any
+                cycles += 1
+                if self.refresh_requested or (topology_refresh_cycles > 0 and cycles % topology_refresh_cycles == 0):
+                    self.refresh_requested = False
+                    with metrics.timer('optimizer_phase_seconds', phase='refresh'):
+                        new_flows = self.refresh_topology(flows)
+                        if new_flows is not flows:
+                            flows = new_flows
+                            new_rules = self.aggregate_flows(flows)
+                            self.update_flows(new_rules, rules)
+                            rules = new_rules
+
+                # Poll the new rules from the next tick on
+                if scheduler is not None:
+                    scheduler.set_flows(rules)
+                    metrics.set('optimizer_scheduler_overruns', scheduler.overruns)
+                    metrics.set('optimizer_scheduler_coalesced', scheduler.coalesced)
+                    metrics.set('optimizer_scheduler_failures', scheduler.failures)
+
+                if route_damping:
+                    counters = self.route_stabilizer.get_counters()
+                    metrics.set('optimizer_reroutes', counters['applied_reroutes'], result='applied')
+                    metrics.set('optimizer_reroutes', counters['suppressed_reroutes'], result='suppressed')
+                    if info_prints:
+                        print '[INFO] Reroutes applied: {}, suppressed: {}'.format(counters['applied_reroutes'], counters['suppressed_reroutes'])
+
+                # Save the state now and then, in case the daemon does not exit cleanly
+                if warm_start and state_save_cycles > 0 and cycles % state_save_cycles == 0:
+                    with metrics.timer('optimizer_phase_seconds', phase='save_state'):
+                        self.save_state(rules)
+
+                metrics.inc('optimizer_cycles_total')
+                metrics.set('optimizer_cycle_flows', self.flow_changes[0] - added, change='added')
+                metrics.set('optimizer_cycle_flows', self.flow_changes[1] - deleted, change='deleted')
+                metrics.set('optimizer_cycle_flows', self.flow_changes[2] - modified, change='modified')
+                metrics.observe('optimizer_cycle_seconds', time() - cycle_started)
+        finally:
+            if scheduler is not None:
+                scheduler.stop()
+
+            # The flows are kept installed on exit, the next run starts from them
+            if warm_start:
+                self.save_state(rules)
+
+            for exporter in exporters:
+                exporter.stop()
+
+
+    def save_state(self, rules):
+        '''
+            Save the state of the optimizer ( see StateStore ): the topology, the weights of the edges,
+            the installed flows and select groups and the routes ( rules, formated like the flows of gen_optimized_flows )
+        '''
+        state = {
+            'topology': {
+                'switches': sorted(self.topology.switches.keys()),
+                'hosts': sorted(self.topology.hosts.keys())
+            },
+            'weights': [(u, v, attrs['weight']) for (u, v, attrs) in self.topology.graph.edges(data=True) if u in self.topology.switches],
+            'flows': sorted(self.flow_manager.port_forward_flows.installed_flows()),
+            'groups': sorted( (group.switch_id, group.mac, group.group_id, group.flow_id, group.buckets) for group in self.flow_manager.select_groups ),
+            'routes': {
+                switch_id: {port_num: sorted(macs_set) for port_num, macs_set in ports.items() if macs_set}
+                    for switch_id, ports in rules.items()
+            }
+        }
+
+        try:
+            self.state_store.save(state)
+        except (IOError, OSError) as error:
+            print '[ERR] Could not save the state: {}'.format(error)
+
+
+    def restore_state(self, state):
+        '''
+            Restore the weights saved by a previous run ( see save_state ), before any path is computed
+        '''
+        weights = [(u.encode('ascii','ignore'), v.encode('ascii','ignore'), weight) for (u, v, weight) in state['weights']]
+        restored = self.topology.restore_edge_weights(weights)
+
+        if info_prints:
+            print '[INFO] Restored {} of {} edge weights from the previous run'.format(restored, len(weights))
+            if set(state['topology']['switches']) != set(self.topology.switches) or set(state['topology']['hosts']) != set(self.topology.hosts):
+                print '[INFO] The topology changed since the previous run'
+
+
+    def reconcile_flows(self, rules, state=None):
+        '''
+            Reconcile the flows installed by a previous run with rules: the flows configured in the server's
+            config datastore are adopted and only the differences are pushed. If the datastore of a switch can't
+            be read, the flows the saved state lists for it are assumed instead.
+
+            Parameters:
+                rules: The flows to install, formated like the flows of gen_optimized_flows
+                state: The state saved by the previous run ( see save_state ) or None
+        '''
+        installed = self.adopt_configured_flows(state)
+
+        wanted = set(self.flows_to_list(rules))
+        add_flows = list(wanted - installed)
+        del_flows = list(installed - wanted)
+        modify_flows = []
+
+        if self.flow_manager.destination_ids:
+            # A destination of a switch has a single flow id, move its installed flow to the wanted port instead of adding a second one
+            stale = {}
+            for (switch_id, mac, port_num) in del_flows:
+                stale.setdefault((switch_id, mac), []).append(port_num)
+
+            new_flows = []
+            for (switch_id, mac, port_num) in add_flows:
+                old_ports = stale.get((switch_id, mac))
+                if old_ports:
+                    modify_flows.append( (switch_id, mac, old_ports.pop(), port_num) )
+                else:
+                    new_flows.append( (switch_id, mac, port_num) )
+
+            add_flows = new_flows
+            del_flows = [(switch_id, mac, port_num) for (switch_id, mac), ports in stale.items() for port_num in ports]
+
+        if info_prints:
+            print '[INFO] Reconciled flows: {} kept, {} to add, {} to delete, {} to modify'.format(len(wanted & installed), len(add_flows), len(del_flows), len(modify_flows))
+
+        self.push_flow_changes(add_flows, del_flows, modify_flows)
+
+
+    def reconcile_groups(self, state=None):
+        '''
+            The multipath version of reconcile_flows: the select groups and the port forward flows configured by
+            a previous run are adopted ( the saved state is assumed for the switches whose datastore can't be
+            read ) and only the groups that differ from the last routing are pushed. The routing installs no
+            port forward flows, the adopted ones are deleted once the group of their destination is installed
+            ( the flow of a group gets the priority they do not use, see FlowManager.add_select_group ).
+
+            Parameters:
+                state: The state saved by the previous run ( see save_state ) or None
+        '''
+        installed = self.adopt_configured_flows(state)
+        configured = self.flow_manager.get_configured_groups(self.topology.switches.keys())
+
+        saved = {}
+        if state is not None:
+            for (switch_id, mac, group_id, flow_id, buckets) in state.get('groups', []):
+                saved.setdefault(switch_id.encode('ascii','ignore'), {})[mac.encode('ascii','ignore')] = (
+                    group_id,
+                    flow_id.encode('ascii','ignore') if flow_id is not None else None,
+                    {port_num.encode('ascii','ignore'): weight for port_num, weight in buckets.items()}
+                )
+
+        groups = []
+        for switch_id, switch_groups in configured.items():
+            if switch_groups is None:
+                switch_groups = saved.get(switch_id, {})
+            groups.extend( (switch_id, mac) + group for mac, group in switch_groups.items() )
+
+        self.flow_manager.adopt_groups(groups)
+        select_groups = self.flow_manager.select_groups
+
+        # Write the flow of an adopted group again if it is missing, or if it may have the priority of a port
+        # forward flow to its destination that is deleted below ( it gets the other one )
+        destinations = set( (switch_id, mac) for (switch_id, mac, _) in installed )
+        self.flow_manager.apply_group_changes([
+            (group.switch_id, group.mac, group.buckets) for group in select_groups
+                if (group.switch_id, group.mac) in self.multipath_router.groups and (group.flow_id is None or (group.switch_id, group.mac) in destinations)
+        ], [], [])
+        self.push_select_groups()
+
+        # Keep the flows of the destinations whose group could not be installed
+        del_flows = [
+            (switch_id, mac, port_num) for (switch_id, mac, port_num) in installed
+                if (switch_id, mac) not in self.multipath_router.groups or getattr(select_groups.get(switch_id, mac), 'flow_id', None) is not None
+        ]
+
+        if info_prints:
+            print '[INFO] Reconciled groups: {} adopted, {} port forward flows to delete'.format(len(groups), len(del_flows))
+
+        self.push_flow_changes([], del_flows)
+
+
+    def adopt_configured_flows(self, state=None):
+        '''
+            Adopt the port forward flows configured in the server's config datastore ( see
+            FlowManager.adopt_flows ), or the flows the saved state lists for the switches whose datastore
+            can't be read. Returns the set of the adopted ( switch_id, mac, port ) flows.
+        '''
+        configured = self.flow_manager.get_configured_flows(self.topology.switches.keys())
+
+        saved = {}
+        if state is not None:
+            for (switch_id, mac, port_num) in state['flows']:
+                saved.setdefault(switch_id.encode('ascii','ignore'), set()).add( (mac.encode('ascii','ignore'), port_num.encode('ascii','ignore') if port_num is not None else None) )
 
-            # Update the flows if any different 
-            self.update_flows(new_flows, flows)
+        installed = set()
+        flow_ids = {}       # The ids the flows are configured with, the flows of a previous scheme keep theirs
+        priorities = {}     # And their priorities, a flow replacing one of them must be installed with the other one
+        for switch_id, flows in configured.items():
+            if flows is None:
+                flows = saved.get(switch_id, set())
+            else:
+                for (mac, port_num), (flow_id, priority) in flows.items():
+                    flow_ids[(switch_id, mac, port_num)] = flow_id
+                    priorities[(switch_id, mac, port_num)] = priority
+            installed.update( (switch_id, mac, port_num) for (mac, port_num) in flows )
 
-            # Store new flows for the next loop
-            flows = new_flows
+        self.flow_manager.adopt_flows(installed, flow_ids, priorities)
+        return installed
 
 
     def simple_optimization(self):
@@ -90,14 +499,27 @@ class NetworkOptimizer:
         # Create the optimized flows using dijkstra paths.
         flows = self.gen_optimized_flows()
 
+        # Create port forward flows to optimize the switch.        
+        if multipath:
+            self.push_select_groups()
+        else:
+            self.push_flow_changes(self.flows_to_list(self.aggregate_flows(flows)), [])
+
+
+    def aggregate_flows(self, flows):
+        '''
+            If flow aggregation is enabled (see src/params.py) compress flows into fewer rules (see FlowAggregator),
+            else return flows as they are.
+        '''
+        if not aggregate_flows or multipath:
+            return flows
+
+        rules = self.flow_aggregator.aggregate(flows)
+
         if info_prints:
-            print '\n[INFO] Optimizing flows....'
+            print '[INFO] Aggregated flows into rules with compression ratio: {:.2f}'.format(self.flow_aggregator.compression_ratio)
 
-        # Create port forward flows to optimize the switch.        
-        for switch_id in flows.keys():
-            for port_num, macs_set in flows[switch_id].items():
-                for mac in macs_set:
-                    self.flow_manager.add_port_forward_flow(switch_id, mac, port_num)
+        return rules
 
 
     def gen_optimized_flows(self):
@@ -121,32 +543,166 @@ class NetworkOptimizer:
                     } 
                     Where for each switch if host_mac is the destination of a packet then forward it through port with port_number.
 
+            With multipath set ( see src/params.py ) each destination is listed under every port of its select
+            group in each switch ( see MultipathRouter ).
         '''
 
+        # Split the destinations between their near-equal cost paths
+        if multipath:
+            self.multipath_router.gen_groups()
+            return self.multipath_router.to_flows(self.gen_empty_flows())
+
+        # Compute the flows in a pool of processes for large topologies (see ParallelRouter). The route damping
+        # needs the paths themselves, so it always computes them in-process.
+        if parallel_routing and not route_damping and self.parallel_router.is_worth_it():
+            if forwarding_tables:
+                return self.route_flows(self.parallel_router.gen_flow_counts())
+            return self.parallel_router.gen_flows(self.gen_empty_flows())
+
         # Get all dijkstra paths from the topology        
         dijkstra_paths  = self.topology.get_dijkstra_paths_for_host_pairs()
 
+        # Keep the installed paths unless moving is worth it (see RouteStabilizer)
+        if route_damping:
+            dijkstra_paths = self.route_stabilizer.stabilize(dijkstra_paths)
+
         # Loop the paths and find the switches in each one. Add 1 flow in each switch that will ensure 
         # packets with destination the last Host in the path will find the fastest way to that host, 
         # because of the dijkstra paths
         # NOTE the graph is directed so paths from h1 to h2 will be duplicates 
         # but also have different bandwidths and traffic
-        flows = {key.node_id : { conn['port_num']: set() for conn in key.connections } for key in self.topology.switches.values()}  # Holds a depth-2 dictionary : { switch_id: {prot_number : set(mac, ...) , ...}, ...  }
-        for path in dijkstra_paths:
-            # Get the last hosts from the path            
-            host = path[len(path) -1]
+        flows = self.gen_empty_flows()  # Holds a depth-2 dictionary : { switch_id: {prot_number : set(mac, ...) , ...}, ...  }
+        if forwarding_tables:
+            # Count the paths using each flow, the forwarding tables keep one port per destination
+            counts = {}
+            for path in dijkstra_paths:
+                for flow in self.get_path_flows(path):
+                    counts[flow] = counts.get(flow, 0) + 1
+            return self.route_flows(counts)
 
-            for idx in range(1, len(path) - 1):  # path[0] and path[len -1] are hosts.
-                switch = self.topology.switches[path[idx]]                
-                
-                # Get the port number switch uses to connect to next node in this path.                    
-                node_id = path[idx + 1]
-                port_num = switch.get_port_num(node_id)
-                flows[switch.node_id][port_num].add(self.topology.host_id_to_mac( host ))
+        for path in dijkstra_paths:
+            for (switch_id, mac, port_num) in self.get_path_flows(path):
+                flows[switch_id][port_num].add(mac)
 
         return flows
 
 
+    def route_flows(self, counts):
+        '''
+            Route each destination through a single port of each switch ( see ForwardingTables ).
+
+            Parameters:
+                counts: The number of paths using each flow (key: (switch_id, mac, port), value: count )
+
+            Returns:
+                The flows of the forwarding tables, formated like the ones of gen_optimized_flows
+        '''
+        self.forwarding_tables.set_counts(counts)
+        self.forwarding_tables.diff()
+        return self.forwarding_tables.to_flows(self.gen_empty_flows())
+
+
+    def gen_empty_flows(self):
+        '''
+            Returns a depth-2 dictionary { switch_id: {prot_number : set(), ...}, ...  } with an empty set for each port of each switch.
+        '''
+        return {key.node_id : { conn.port_num: set() for conn in key.connections } for key in self.topology.switches.values()}
+
+
+    def get_path_flows(self, path, switches=None):
+        '''
+            Returns the flows needed by a path as a list of ( switch_id, mac, port ) tuples: each switch in the path
+            forwards packets with destination the last host of the path to the port connecting it with the next node.
+            The ports are looked up in switches (key: switch_id, value: Switch ), the topology's ones by default.
+        '''
+        if switches is None:
+            switches = self.topology.switches
+
+        # Get the mac of the last host from the path
+        mac = self.topology.host_id_to_mac( path[len(path) - 1] )
+
+        path_flows = []
+        for idx in range(1, len(path) - 1):  # path[0] and path[len -1] are hosts.
+            switch = switches[path[idx]]
+
+            # Get the port number switch uses to connect to next node in this path.
+            path_flows.append( (switch.node_id, mac, switch.get_port_num(path[idx + 1])) )
+
+        return path_flows
+
+
+    def update_optimized_flows(self, flows):
+        '''
+            Incremental version of gen_optimized_flows. Only the paths affected by the edges whose weight changed
+            since the last call are recomputed (see Topology.get_changed_dijkstra_paths) and parameter flows is
+            updated in place. The first call computes all the paths, so it should get the output of gen_empty_flows.
+
+            Each flow is counted once for every path using it and it is only added / deleted when the first
+            path starts / the last path stops using it.
+
+            Parameters:
+                flows: A depth-2 dictionary formated like the one returned by gen_optimized_flows
+
+            With forwarding_tables set ( see src/params.py ) the flows are the ones of the forwarding tables, only
+            the destinations whose paths changed are compared ( see ForwardingTables.diff ).
+
+            Returns:
+                (add_flows, del_flows, modify_flows): Two lists of ( switch_id, mac, port ) tuples with the flows that
+                    were added to / deleted from flows and a list of ( switch_id, mac, old_port, new_port ) tuples with
+                    the flows that moved to another port ( only with forwarding_tables ).
+        '''
+        # Holds the flows touched and whether they were used before the update
+        touched = {}
+
+        changed_paths = self.topology.get_changed_dijkstra_paths()
+
+        # Only the reroutes worth it are applied, the old paths are the installed ones (see RouteStabilizer)
+        if route_damping:
+            changed_paths = self.route_stabilizer.stabilize_changes(changed_paths)
+
+        for (old_path, new_path) in changed_paths:
+            if old_path is not None:
+                for flow in self.get_path_flows(old_path):
+                    touched.setdefault(flow, True)
+                    self.flow_refs[flow] -= 1
+                    if self.flow_refs[flow] == 0:
+                        del self.flow_refs[flow]
+                    if forwarding_tables:
+                        self.forwarding_tables.remove_flow(flow)
+
+            if new_path is not None:
+                for flow in self.get_path_flows(new_path):
+                    touched.setdefault(flow, flow in self.flow_refs)
+                    self.flow_refs[flow] = self.flow_refs.get(flow, 0) + 1
+                    if forwarding_tables:
+                        self.forwarding_tables.add_flow(flow)
+
+        if forwarding_tables:
+            add_flows, del_flows, modify_flows = self.forwarding_tables.diff()
+            for (switch_id, mac, port_num) in add_flows:
+                flows[switch_id][port_num].add(mac)
+            for (switch_id, mac, port_num) in del_flows:
+                flows[switch_id][port_num].discard(mac)
+            for (switch_id, mac, old_port, new_port) in modify_flows:
+                flows[switch_id][old_port].discard(mac)
+                flows[switch_id][new_port].add(mac)
+            return add_flows, del_flows, modify_flows
+
+        # Keep only the flows whose state actually changed
+        add_flows = []
+        del_flows = []
+        for flow, used_before in touched.items():
+            used_now = flow in self.flow_refs
+            if used_now and not used_before:
+                add_flows.append(flow)
+                flows[flow[0]][flow[2]].add(flow[1])
+            elif used_before and not used_now:
+                del_flows.append(flow)
+                flows[flow[0]][flow[2]].discard(flow[1])
+
+        return add_flows, del_flows, []
+
+
 
     def update_flows(self, new_flows, old_flows):
         '''
@@ -165,47 +721,125 @@ class NetworkOptimizer:
                     } 
                     Where for each switch if host_mac is the destination of a packet then forward it through port with port_number.
 
+            With forwarding_tables set ( see src/params.py ) the destinations that moved to another port are
+            pushed as modifications ( see ForwardingTables.diff_flows ). With multipath set the select groups of
+            the last routing are pushed instead ( see push_select_groups ).
         '''
+        if multipath:
+            self.push_select_groups()
+            return
+
+        if forwarding_tables:
+            self.push_flow_changes(*ForwardingTables.diff_flows(new_flows, old_flows))
+            return
+
         # Both lists contain tuples like ( switch_id, mac, port )
         del_flows = []
         add_flows = []
     
-        for switch in self.topology.switches.values():            
-            for conn in switch.connections:
+        # The switches and ports of both, they differ if the topology changed in between
+        for switch_id in set(new_flows.keys()) | set(old_flows.keys()):
+            new_ports = new_flows.get(switch_id, {})
+            old_ports = old_flows.get(switch_id, {})
+            for port in set(new_ports.keys()) | set(old_ports.keys()):
 
                 # Compare flows in port level
-                port = conn['port_num']
-                hosts_new = new_flows[switch.node_id][port]
-                hosts_old = old_flows[switch.node_id][port]
+                hosts_new = new_ports.get(port, set())
+                hosts_old = old_ports.get(port, set())
+
+                if hosts_new == hosts_old:
+                    continue
 
                 # Get flows to add
-                for host in hosts_new:
-                    if host not in hosts_old:
-                        add_flows.append( (switch.node_id, host, port) )
+                for host in hosts_new - hosts_old:
+                    add_flows.append( (switch_id, host, port) )
 
                 # Get flows to delete
-                for host in hosts_old:
-                    if host not in hosts_new:
-                        del_flows.append( (switch.node_id, host, port) )
-        
-        if info_prints and len(add_flows) > 0:
+                for host in hosts_old - hosts_new:
+                    del_flows.append( (switch_id, host, port) )
+
+        self.push_flow_changes(add_flows, del_flows)
+
+
+    def push_flow_changes(self, add_flows, del_flows, modify_flows=()):
+        '''
+            Push flow changes to the server.
+
+            Parameters:
+                add_flows & del_flows: Lists of ( switch_id, mac, port ) tuples with the flows to add / delete.
+                modify_flows: A list of ( switch_id, mac, old_port, new_port ) tuples with the flows to move to another port.
+
+            Returns:
+                report: The per switch report of FlowManager.apply_flow_changes
+        '''
+        if info_prints and (len(add_flows) > 0 or len(modify_flows) > 0):
             print '\n[INFO] Optimizing flows....'
 
-        # Firs delete old flows
-        for ( switch_id, mac, port ) in del_flows:            
-            self.flow_manager.delete_port_forward_flow(switch_id, mac, port)
+        # Push the changes as one batch: the new flows are added before the old ones are deleted
+        report = self.flow_manager.apply_flow_changes(add_flows, del_flows, modify_flows=modify_flows)
+
+        self.flow_changes[0] += len(add_flows)
+        self.flow_changes[1] += len(del_flows)
+        self.flow_changes[2] += len(modify_flows)
+        metrics.inc('optimizer_flows_total', len(add_flows), change='added')
+        metrics.inc('optimizer_flows_total', len(del_flows), change='deleted')
+        metrics.inc('optimizer_flows_total', len(modify_flows), change='modified')
+
+        for switch_id, switch_report in report.items():
+            metrics.inc('optimizer_flow_failures_total', len(switch_report['failures']))
+            if len(switch_report['failures']) > 0:
+                print '[ERR] {} of {} flow changes failed in switch: {}'.format(len(switch_report['failures']), switch_report['requests'], switch_id)
 
-        # Then add new flows
-        for ( switch_id, mac, port ) in add_flows:
-            self.flow_manager.add_port_forward_flow(switch_id, mac, port)
+        return report
+
+
+    def push_select_groups(self):
+        '''
+            Push the select groups of the last multipath routing ( see MultipathRouter ): only the groups that
+            are missing, gone or whose buckets changed enough are written.
+
+            Returns:
+                report: The per switch report of FlowManager.apply_group_changes
+        '''
+        add_groups, del_groups, modify_groups = self.multipath_router.diff(self.flow_manager.select_groups.installed_groups())
+        if info_prints and (len(add_groups) > 0 or len(modify_groups) > 0):
+            print '\n[INFO] Balancing groups....'
+
+        report = self.flow_manager.apply_group_changes(add_groups, del_groups, modify_groups)
+
+        metrics.inc('optimizer_groups_total', len(add_groups), change='added')
+        metrics.inc('optimizer_groups_total', len(del_groups), change='deleted')
+        metrics.inc('optimizer_groups_total', len(modify_groups), change='modified')
+
+        for switch_id, switch_report in report.items():
+            metrics.inc('optimizer_flow_failures_total', len(switch_report['failures']))
+            if len(switch_report['failures']) > 0:
+                print '[ERR] {} of {} group changes failed in switch: {}'.format(len(switch_report['failures']), switch_report['requests'], switch_id)
+
+        return report
+
+
+    def flows_to_list(self, flows):
+        '''
+            Flatten a depth-2 dictionary formated like the one returned by gen_optimized_flows to a list of ( switch_id, mac, port ) tuples
+        '''
+        return [
+            (switch_id, mac, port_num)
+                for switch_id in flows.keys()
+                    for port_num, macs_set in flows[switch_id].items()
+                        for mac in macs_set
+        ]
 
 
 
     def calculate_weights(self, flows):
         '''
             Monitors flow traffic once, then wait for a time interval (found in src/parameters.py) and 
-            monitor traffic again. Path's weight is the number of packets passed in this time interval
-            from this path ( = switch's port)
+            monitor traffic again. Path's weight is the rate (packets per second) of the packets passed
+            in this time interval from this path ( = switch's port)
+
+            Each snapshot polls all flows concurrently (see StatsPoller) and every sample carries the time it
+            was taken, so the rate of each flow is computed over its own actual sampling interval.
 
             Parameters:
                 flows: A depth-2 dictionary formated like 
@@ -228,37 +862,102 @@ class NetworkOptimizer:
                         ...  
                     }                
         '''
-        # Holds a depth-2 dictionary : { switch_id: {prot_number : packet_count , ...}, ...  }
-        weights = {key.node_id : { conn['port_num']: 0 for conn in key.connections } for key in self.topology.switches.values()} 
-
-        # Get the packet_count for each port in each switch from the flows created in phase1 of 'optimizer_daemon'
-        for switch_id in flows.keys():
-            for port_num, macs_set in flows[switch_id].items():
-                for mac in macs_set:
-                    # Sum the packet_count from multiple hosts that might pass through one port                    
-                    weights[switch_id][port_num] += self.flow_manager.get_flow_packet_count(switch_id, mac, port_num)
-
-        # Sleep for time interval ( in mills )
-        sleep(monitor_interval / 1000)
-
-        # Get the packet_count for each port again , and keep the difference
-        for switch_id in flows.keys():
-            for port_num, macs_set in flows[switch_id].items():                
-                packet_count = 0
-                for mac in macs_set:                    
-                    # Sum the packet_count from multiple hosts that might pass through one port
-                    packet_count += self.flow_manager.get_flow_packet_count(switch_id, mac, port_num)
-
-                # If the packet count is the same as before then assing value 1 to weight (so dijkstra will keep executing in the same way as before)
-                if (packet_count <= weights[switch_id][port_num]):
-                    weights[switch_id][port_num] = 1
-                else:
-                    weights[switch_id][port_num] = packet_count - weights[switch_id][port_num]
+        # Get the packet_count for each flow created in phase1 of 'optimizer_daemon'
+        started = time()
+        first = self.stats_poller.take_snapshot(flows)
+
+        # Sleep for the rest of the time interval ( in mills ), so the snapshots start one interval apart
+        sleep(max(0.0, monitor_interval / 1000.0 - (time() - started)))
+
+        # Get the packet_count for each flow again
+        second = self.stats_poller.take_snapshot(flows)
+
+        return self.weights_from_snapshots(first, second)
+
+
+    def weights_from_snapshots(self, first, second):
+        '''
+            Calculate the weights of the ports from two snapshots of the flows' packet counts
+            (see StatsPoller.take_snapshot). The weight of a port is the rate (packets per second)
+            of the packets passed from it between the two snapshots.
+
+            A flow missing a sample in either snapshot keeps the rate it had in the previous weights ( if any ).
+
+            Returns:
+                weights: A depth-2 dictionary formated like the one returned by calculate_weights
+                    ( or an array, see weight_array_from_snapshots, if the weights are vectorized )
+        '''
+        if self.topology.vectorized:
+            return self.weight_array_from_snapshots(first, second)
+
+        # Holds a depth-2 dictionary : { switch_id: {prot_number : packet_rate , ...}, ...  }
+        weights = {key.node_id : { conn.port_num: 0.0 for conn in key.connections } for key in self.topology.switches.values()} 
+
+        # The packet rate of each flow, the last one known if a sample is missing
+        rates = {}
+        missing = 0
+        for flow, sample in second.items():
+            previous = first.get(flow)
+            if sample is not None and previous is not None:
+                rates[flow] = StatsPoller.packet_rate(previous, sample)
+            else:
+                missing += 1
+                if flow in self.flow_rates:
+                    rates[flow] = self.flow_rates[flow]
+        metrics.inc('stats_missing_samples_total', missing)
+        self.flow_rates = rates
+
+        # Sum the packet rates from multiple hosts that might pass through one port
+        for flow, rate in rates.items():
+            (switch_id, mac, port_num) = flow
+            if port_num in weights.get(switch_id, {}):        # The port might be gone if the topology changed
+                weights[switch_id][port_num] += rate
+
+        # If less than a packet per second passed then assing value 1 to weight (so dijkstra will keep executing in the same way as before)
+        for ports in weights.values():
+            for port_num, rate in ports.items():
+                ports[port_num] = max(rate, 1)
 
         # Return the dictionary with the weights
         return weights
 
 
+    def weight_array_from_snapshots(self, first, second):
+        '''
+            Vectorized version of weights_from_snapshots.
+
+            Returns:
+                weights: An array with the weight of each port ( indexed by Topology.port_ids )
+        '''
+        port_ids = self.topology.port_ids
+        sampled = [flow for flow, sample in second.iteritems() if sample is not None and first.get(flow) is not None]
+        stale = [flow for flow, sample in second.iteritems() if (sample is None or first.get(flow) is None) and flow in self.flow_rates]
+
+        first_samples = np.array([first[flow] for flow in sampled], dtype=float).reshape(-1, 2)
+        second_samples = np.array([second[flow] for flow in sampled], dtype=float).reshape(-1, 2)
+
+        # The packet rate of each flow ( 0 if its packet count did not increase, like StatsPoller.packet_rate )
+        packets = second_samples[:, 0] - first_samples[:, 0]
+        elapsed = second_samples[:, 1] - first_samples[:, 1]
+        valid = (packets > 0) & (elapsed > 0)
+        rates = np.zeros(len(sampled))
+        rates[valid] = packets[valid] / elapsed[valid]
+
+        # The flows missing a sample keep their last rate
+        stale_rates = np.array([self.flow_rates[flow] for flow in stale], dtype=float)
+        metrics.inc('stats_missing_samples_total', len(second) - len(sampled))
+        self.flow_rates = dict(zip(sampled, rates.tolist()))
+        self.flow_rates.update(zip(stale, stale_rates.tolist()))
+
+        sampled.extend(stale)
+        rates = np.concatenate((rates, stale_rates))
+        ports = np.fromiter((port_ids[(flow[0], flow[2])] for flow in sampled), dtype=np.intp, count=len(sampled))
+
+        # Sum the packet rates of each port and assign at least 1 to each weight
+        weights = np.bincount(ports, weights=rates, minlength=len(port_ids))
+        return np.maximum(weights, 1.0)
+
+
     
     @staticmethod
     def receiveSignal(signalNumber, frame):
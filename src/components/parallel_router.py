@@ -0,0 +1,81 @@
+import multiprocessing
+from collections import Counter
+from src.params import path_workers, parallel_min_hosts
+
+
+# The optimizer whose paths are computed, set while the workers are forked ( they inherit it )
+_optimizer = None
+
+
+def _partition_flows(sources):
+    '''
+        Worker: compute the paths starting from the source hosts of a partition and return a Counter with the
+        number of these paths using each flow (key: (switch_id, mac, port), value: count )
+    '''
+    topology = _optimizer.topology
+    counts = Counter()
+    for path in topology.routing_engine.get_paths_for_hosts(topology.hosts.keys(), sources):
+        counts.update(_optimizer.get_path_flows(path))
+
+    return counts
+
+
+class ParallelRouter:
+    '''
+        Computes the flows of all the host pairs ( like NetworkOptimizer.gen_optimized_flows ) in a pool of
+        worker processes, so the recompute is not limited to one core.
+
+        The pool is forked once per computation, so the workers share the current graph ( copy-on-write )
+        instead of receiving it. The source hosts are split among the workers: each one grows the
+        shortest-path trees of its sources, so the paths and their tie-breaking are the same as in-process.
+        Only the flows, with the number of paths using each, are sent back and summed.
+    '''
+
+    def __init__(self, optimizer, workers=path_workers, min_hosts=parallel_min_hosts):
+        self.optimizer = optimizer
+        self.workers = workers
+        self.min_hosts = min_hosts      # Smaller topologies are computed in-process
+
+
+    def is_worth_it(self):
+        '''
+            Return True if the topology is large enough for the pool to pay off
+        '''
+        return self.workers > 1 and len(self.optimizer.topology.hosts) >= self.min_hosts
+
+
+    def gen_flows(self, flows):
+        '''
+            Add the flows of all the host pairs to flows ( the output of NetworkOptimizer.gen_empty_flows ) and return it
+        '''
+        for (switch_id, mac, port_num) in self.gen_flow_counts():
+            flows[switch_id][port_num].add(mac)
+
+        return flows
+
+
+    def gen_flow_counts(self):
+        '''
+            Return a Counter with the number of paths of all the host pairs using each flow (key: (switch_id, mac, port),
+            value: count ), like the counts NetworkOptimizer.route_flows takes
+        '''
+        global _optimizer
+
+        host_ids = self.optimizer.topology.hosts.keys()
+        partitions = [host_ids[idx::self.workers] for idx in range(self.workers)]
+
+        _optimizer = self.optimizer
+        pool = multiprocessing.Pool(self.workers)
+        try:
+            results = pool.map(_partition_flows, partitions)
+        finally:
+            pool.close()
+            pool.join()
+            _optimizer = None
+
+        # Sum the counts of the partitions
+        counts = Counter()
+        for partition_counts in results:
+            counts.update(partition_counts)
+
+        return counts
@@ -0,0 +1,162 @@
+from time import time
+from src.params import ewma_alpha, min_improvement, hold_down
+
+
+class RouteStabilizer:
+    '''
+        Damps the reroutes of the daemon to avoid flow churn, trading a little optimality for a lot
+        less control-plane load:
+            - the port weights are smoothed with an EWMA, so a single noisy sample does not move paths
+            - a destination's paths only move to new ones if they are cheaper than its current paths ( under
+              the current weights ) by at least min_improvement ( a fraction of the current cost )
+            - after a destination's paths move, they can't move again for hold_down seconds
+
+        The stabilizer keeps the path each host pair is installed with. The pairs of a destination move
+        together, so its paths stay a tree. Reroutes that are suppressed are re-evaluated in every following
+        cycle, until they are applied or the candidate paths change. A reroute is counted as suppressed once,
+        not in every cycle it stays suppressed ( again if its candidate path changes ).
+    '''
+
+    def __init__(self, graph, alpha=ewma_alpha, improvement=min_improvement, hold_down=hold_down):
+        self.graph = graph
+        self.alpha = alpha                  # Weight of the newest sample in the EWMA
+        self.improvement = improvement
+        self.hold_down = hold_down          # In seconds
+
+        self.smoothed = {}                  # The smoothed weight of each port (key: (switch_id, port_num), value: weight )
+        self.smoothed_array = None          # The smoothed weights of the ports, if the weights are vectorized
+        self.paths = {}                     # The installed path of each host pair (key: (src_id, dst_id), value: path )
+        self.candidates = {}                # The shortest path of each host pair (key: (src_id, dst_id), value: path or None )
+        self.pending = set()                # The host pairs whose reroute was suppressed
+        self.suppressed = {}                # The candidate path each pending host pair was last suppressed with (key: (src_id, dst_id), value: path )
+        self.last_reroute = {}              # The time each destination's paths last moved (key: dst_id, value: time )
+
+        self.applied_reroutes = 0
+        self.suppressed_reroutes = 0
+
+
+    def smooth_weights(self, weights):
+        '''
+            Return a copy of weights ( a depth-2 dictionary { switch_id: { port_number: weight, ... }, ... } )
+            with each weight replaced by the EWMA of the port's weights so far.
+            With vectorized weights, weights is an array ( see Topology.port_ids ) and an array is returned.
+        '''
+        if not isinstance(weights, dict):
+            # The smoothing starts over if the ports changed
+            if self.smoothed_array is not None and len(self.smoothed_array) == len(weights):
+                weights = self.alpha * weights + (1 - self.alpha) * self.smoothed_array
+            self.smoothed_array = weights
+            return weights
+
+        smoothed_weights = {}
+        for switch_id, ports in weights.items():
+            smoothed_weights[switch_id] = {}
+            for port_num, weight in ports.items():
+                key = (switch_id, port_num)
+                if key in self.smoothed:
+                    weight = self.alpha * weight + (1 - self.alpha) * self.smoothed[key]
+                self.smoothed[key] = weight
+                smoothed_weights[switch_id][port_num] = weight
+
+        return smoothed_weights
+
+
+    def stabilize(self, paths):
+        '''
+            Damp a full set of shortest paths ( like the ones Topology.get_dijkstra_paths_for_host_pairs returns ).
+            Returns the list of paths to install.
+        '''
+        self.candidates = {(path[0], path[len(path) - 1]): path for path in paths}
+        self._evaluate(set(self.candidates.keys()) | set(self.paths.keys()))
+        return self.paths.values()
+
+
+    def stabilize_changes(self, changed_paths):
+        '''
+            Damp the changes of the shortest paths ( like the ones Topology.get_changed_dijkstra_paths returns ).
+            Returns a list of (old_path, new_path) tuples with the changes of the installed paths.
+        '''
+        pairs = set()
+        for (old_path, new_path) in changed_paths:
+            path = new_path if new_path is not None else old_path
+            pair = (path[0], path[len(path) - 1])
+            self.candidates[pair] = new_path
+            pairs.add(pair)
+
+        return self._evaluate(pairs | self.pending)
+
+
+    def recheck_paths(self):
+        '''
+            Re-evaluate in the next cycle the host pairs whose installed path broke ( after the topology changed ),
+            so they move to their candidate path whatever the hold-down and the improvement
+        '''
+        for pair, path in self.paths.items():
+            if not self._is_valid(path):
+                self.pending.add(pair)
+
+
+    def _evaluate(self, pairs):
+        '''
+            Decide for each destination whether its host pairs move to their candidate paths and update the installed
+            paths. The switches forward by destination, so the installed paths to a destination must stay a tree like
+            the candidate ones: the pairs of a destination move together or not at all.
+            Returns a list of (old_path, new_path) tuples with the changes of the installed paths.
+        '''
+        now = time()
+        changes = []
+
+        # The pairs of each destination whose candidate path differs from the installed one
+        by_dst = {}
+        for pair in pairs:
+            if self.candidates.get(pair) == self.paths.get(pair):
+                self.pending.discard(pair)
+                self.suppressed.pop(pair, None)
+            else:
+                by_dst.setdefault(pair[1], []).append(pair)
+
+        for dst, dst_pairs in by_dst.items():
+            moves = [(pair, self.paths.get(pair), self.candidates.get(pair)) for pair in dst_pairs]
+            reroutes = [(current, candidate) for (_, current, candidate) in moves if current is not None and candidate is not None and self._is_valid(current)]
+
+            # New pairs, lost pairs and broken paths always move ( with the rest of their destination ), else check the
+            # hold-down and the improvement of the destination's paths as a whole
+            if len(reroutes) == len(moves):
+                if now - self.last_reroute.get(dst, 0) < self.hold_down or \
+                        sum(self._cost(candidate) for (_, candidate) in reroutes) > sum(self._cost(current) for (current, _) in reroutes) * (1 - self.improvement):
+                    self.pending.update(dst_pairs)
+                    for pair in dst_pairs:
+                        if self.suppressed.get(pair) != self.candidates[pair]:
+                            self.suppressed[pair] = self.candidates[pair]
+                            self.suppressed_reroutes += 1
+                    continue
+
+            if reroutes:
+                self.last_reroute[dst] = now
+                self.applied_reroutes += len(reroutes)
+
+            for (pair, current, candidate) in moves:
+                self.pending.discard(pair)
+                self.suppressed.pop(pair, None)
+                changes.append( (current, candidate) )
+                if candidate is None:
+                    del self.paths[pair]
+                    self.candidates.pop(pair, None)
+                else:
+                    self.paths[pair] = candidate
+
+        return changes
+
+
+    def _cost(self, path):
+        return sum(self.graph[path[idx]][path[idx + 1]]['weight'] for idx in range(len(path) - 1))
+
+    def _is_valid(self, path):
+        return all(self.graph.has_edge(path[idx], path[idx + 1]) for idx in range(len(path) - 1))
+
+
+    def get_counters(self):
+        '''
+            Return the number of reroutes applied and suppressed so far
+        '''
+        return {'applied_reroutes': self.applied_reroutes, 'suppressed_reroutes': self.suppressed_reroutes}
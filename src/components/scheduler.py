@@ -0,0 +1,128 @@
+from time import time
+import threading
+from src.params import info_prints, monitor_interval
+
+
+class CycleScheduler:
+    '''
+        Runs the stats collection of the daemon on a fixed-rate timer thread, independent of the path
+        recomputation and the flow pushing done by the daemon's loop.
+
+        The collector takes a snapshot of the flows' packet counts at every tick of a fixed grid
+        ( start + k * interval ), so the sampling period does not drift with the work done per cycle.
+        Each new snapshot completes a sample, ( previous snapshot, snapshot ), which the daemon's loop
+        consumes with wait_for_sample.
+
+        The scheduler detects when the controller is slow:
+            - overruns: ticks skipped because a snapshot took longer than the interval
+            - coalesced: samples never consumed because the loop was busy ( only the latest one is used )
+            - failures: snapshots that raised ( like a lost connection to the controller ), the next snapshot
+              completes the sample with the last good one
+    '''
+
+    def __init__(self, stats_poller, interval=monitor_interval):
+        self.stats_poller = stats_poller
+        self.interval = interval / 1000.0   # The interval is given in milliseconds
+
+        self.condition = threading.Condition()
+        self.flows = None           # The flows to poll ( a depth-2 dictionary like the ones of NetworkOptimizer )
+        self.sample = None          # The latest completed sample
+        self.sample_seq = 0         # Number of samples completed
+        self.consumed_seq = 0       # Number of the last sample consumed
+
+        self.overruns = 0
+        self.coalesced = 0
+        self.failures = 0
+
+        self.stopped = threading.Event()
+        self.thread = None
+
+
+    def start(self, flows):
+        '''
+            Start polling flows in a background thread
+        '''
+        self.set_flows(flows)
+        self.thread = threading.Thread(target=self._collect)
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def stop(self):
+        '''
+            Stop the background thread ( after its current snapshot )
+        '''
+        self.stopped.set()
+
+
+    def set_flows(self, flows):
+        '''
+            Set the flows polled from the next tick on. A copy is kept, so the caller can keep updating flows.
+        '''
+        flows_copy = {switch_id: {port_num: set(macs_set) for port_num, macs_set in ports.items()} for switch_id, ports in flows.items()}
+        with self.condition:
+            self.flows = flows_copy
+
+
+    def wait_for_sample(self):
+        '''
+            Block until a sample newer than the last consumed one is completed and return it as a
+            ( first_snapshot, second_snapshot ) tuple ( see StatsPoller.take_snapshot ).
+            Samples completed in between are skipped.
+
+            Raises RuntimeError if the collector stopped ( or died ) without completing a new sample.
+        '''
+        with self.condition:
+            while self.sample_seq == self.consumed_seq:
+                if self.thread is None or not self.thread.is_alive():
+                    raise RuntimeError('The stats collector is not running')
+                # Wait with a timeout, an untimed wait can't be interrupted by signals
+                self.condition.wait(0.5)
+
+            skipped = self.sample_seq - self.consumed_seq - 1
+            if skipped > 0:
+                self.coalesced += skipped
+                if info_prints:
+                    print '[INFO] Skipped {} samples, the cycle took longer than the monitor interval'.format(skipped)
+
+            self.consumed_seq = self.sample_seq
+            return self.sample
+
+
+    def _collect(self):
+        '''
+            The collector's loop: take a snapshot at every tick and publish the completed samples
+        '''
+        previous = None
+        next_tick = time()
+        while not self.stopped.is_set():
+            with self.condition:
+                flows = self.flows
+
+            try:
+                snapshot = self.stats_poller.take_snapshot(flows)
+            except Exception as error:
+                # Keep collecting, the next snapshot is paired with the last good one
+                snapshot = None
+                self.failures += 1
+                print '[ERR] Could not take a snapshot of the flows: {}'.format(error)
+
+            if snapshot is not None:
+                if previous is not None:
+                    with self.condition:
+                        self.sample = (previous, snapshot)
+                        self.sample_seq += 1
+                        self.condition.notify_all()
+                previous = snapshot
+
+            # Move to the next tick of the grid, skipping the ticks missed if the snapshot overran
+            next_tick += self.interval
+            now = time()
+            if now >= next_tick:
+                missed = int((now - next_tick) / self.interval) + 1
+                self.overruns += missed
+                next_tick += missed * self.interval
+                if info_prints:
+                    print '[INFO] Polling overran the monitor interval, skipped {} ticks'.format(missed)
+
+            self.stopped.wait(next_tick - now)
@@ -0,0 +1,52 @@
+import gzip
+import json
+import os
+from time import time
+from src.params import state_file
+
+
+class StateStore:
+    '''
+        Saves the state of the optimizer between runs in a gzipped json file, so a restarted daemon can
+        start from where the previous one stopped instead of reprogramming the whole network.
+
+        The file is written to a temporary file first and then renamed over the old one, so a crash while
+        saving never leaves a half written state behind.
+    '''
+
+    version = 1
+
+    def __init__(self, path=state_file):
+        self.path = path
+
+
+    def save(self, state):
+        '''
+            Write state ( a json serializable dictionary ) to the file
+        '''
+        state = dict(state, version=self.version, saved_at=time())
+        tmp_path = self.path + '.tmp'
+        with gzip.open(tmp_path, 'wb') as state_file:
+            json.dump(state, state_file, separators=(',', ':'))
+        os.rename(tmp_path, self.path)
+
+
+    def load(self):
+        '''
+            Return the state read from the file, or None if there is no ( usable ) state
+        '''
+        if not os.path.exists(self.path):
+            return None
+
+        try:
+            with gzip.open(self.path, 'rb') as state_file:
+                state = json.load(state_file)
+        except (IOError, ValueError) as error:
+            print '[ERR] Could not read the state in {}: {}'.format(self.path, error)
+            return None
+
+        if state.get('version') != self.version:
+            print '[ERR] The state in {} has version {}, expected {}'.format(self.path, state.get('version'), self.version)
+            return None
+
+        return state
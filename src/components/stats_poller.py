@@ -0,0 +1,128 @@
+from multiprocessing.pool import ThreadPool
+from src.components.event_loop import Future
+from time import time
+from src.params import stats_workers, bulk_stats, stats_deadline
+
+
+class StatsPoller:
+    '''
+        Polls the packet counts of the port forward flows concurrently, using a bounded pool of threads,
+        so that a snapshot of all flows is taken in a short time window regardless of the number of flows.
+    '''
+
+    def __init__(self, flow_manager, workers=stats_workers, bulk=bulk_stats, deadline=stats_deadline):
+        self.flow_manager = flow_manager
+        self.pool = ThreadPool(workers)     # At most 'workers' requests are sent to the server at the same time
+        self.bulk = bulk                    # Fetch a whole table per switch instead of one request per flow
+        self.deadline = deadline            # Seconds after the start of a snapshot when the requests stop ( and stop being retried )
+
+
+    def take_snapshot(self, flows):
+        '''
+            Get the packet count of every flow in flows.
+
+            Parameters:
+                flows: A depth-2 dictionary formated like the one returned by NetworkOptimizer.gen_optimized_flows
+
+            Returns:
+                snapshot: A dictionary { (switch_id, mac, port): (packet_count, timestamp) } where timestamp
+                    is the time (in seconds) the packet count was received. The sample is None for the flows
+                    whose packet count could not be fetched ( or is missing from their switch's table ).
+        '''
+        if self.flow_manager.connector.asynchronous:
+            return self.take_snapshot_async(flows).result()
+
+        deadline = time() + self.deadline
+
+        if self.bulk:
+            return self._take_bulk_snapshot(flows, deadline)
+
+        entries = [
+            (switch_id, mac, port_num)
+                for switch_id in flows.keys()
+                    for port_num, macs_set in flows[switch_id].items()
+                        for mac in macs_set
+        ]
+
+        return dict(zip(entries, self.pool.map(lambda entry: self._sample(entry, deadline), entries)))
+
+
+    def take_snapshot_async(self, flows):
+        '''
+            Asynchronous version of take_snapshot ( the flow manager needs an AsyncApiConnector ): all the
+            requests are issued from the event loop at once. Returns a Future with the snapshot.
+        '''
+        deadline = time() + self.deadline
+
+        def sample(packet_count):
+            return (packet_count, time()) if packet_count != None else None
+
+        if self.bulk:
+            switch_ids = [switch_id for switch_id in flows.keys() if any(flows[switch_id].values())]
+            samples = [self.flow_manager.get_switch_packet_counts_async(switch_id, deadline=deadline).then(lambda packet_counts: (packet_counts, time())) for switch_id in switch_ids]
+            return Future.gather(samples).then(lambda samples: self._bulk_snapshot(flows, switch_ids, samples))
+
+        entries = [
+            (switch_id, mac, port_num)
+                for switch_id in flows.keys()
+                    for port_num, macs_set in flows[switch_id].items()
+                        for mac in macs_set
+        ]
+        samples = [self.flow_manager.get_flow_packet_count_async(switch_id, mac, port_num, deadline=deadline).then(sample) for (switch_id, mac, port_num) in entries]
+        return Future.gather(samples).then(lambda samples: dict(zip(entries, samples)))
+
+
+    def _sample(self, entry, deadline=None):
+        '''
+            Get the packet count of a single ( switch_id, mac, port ) flow and the time it was received ( None if it failed )
+        '''
+        (switch_id, mac, port_num) = entry
+        packet_count = self.flow_manager.get_flow_packet_count(switch_id, mac, port_num, deadline=deadline)
+        if packet_count == None:
+            return None
+        return (packet_count, time())
+
+
+    def _take_bulk_snapshot(self, flows, deadline=None):
+        '''
+            Bulk version of take_snapshot: one request per switch fetches the packet counts of all its flows
+        '''
+        switch_ids = [switch_id for switch_id in flows.keys() if any(flows[switch_id].values())]
+        samples = self.pool.map(lambda switch_id: self._sample_switch(switch_id, deadline), switch_ids)
+        return self._bulk_snapshot(flows, switch_ids, samples)
+
+
+    def _bulk_snapshot(self, flows, switch_ids, samples):
+        '''
+            Build the snapshot of flows from the ( packet_counts, timestamp ) samples of the switches
+        '''
+        snapshot = {}
+        for switch_id, (packet_counts, timestamp) in zip(switch_ids, samples):
+            for port_num, macs_set in flows[switch_id].items():
+                for mac in macs_set:
+                    if packet_counts != None and (mac, port_num) in packet_counts:
+                        snapshot[(switch_id, mac, port_num)] = (packet_counts[(mac, port_num)], timestamp)
+                    else:
+                        snapshot[(switch_id, mac, port_num)] = None
+
+        return snapshot
+
+
+    def _sample_switch(self, switch_id, deadline=None):
+        '''
+            Get the packet counts of all the flows of a switch and the time they were received
+        '''
+        packet_counts = self.flow_manager.get_switch_packet_counts(switch_id, deadline=deadline)
+        return (packet_counts, time())
+
+
+    @staticmethod
+    def packet_rate(first, second):
+        '''
+            Return the packets per second of a flow between two of its samples, (packet_count, timestamp) tuples.
+            Returns 0 if the packet count did not increase.
+        '''
+        elapsed = second[1] - first[1]
+        if second[0] <= first[0] or elapsed <= 0:
+            return 0.0
+        return (second[0] - first[0]) / elapsed
@@ -1,51 +1,180 @@
+import json
+from src.params import flow_body_format, flow_body_cache_size
 
 
 
 class XmlCreator:
+    '''
+        Creates the bodies of the flows sent to the server, as minified xml or ( with body_format='json' )
+        as json for RESTCONF. A flow body looks like ( indented here for reading ):
+
+            <flow xmlns="urn:opendaylight:flow:inventory">
+                <flow-name>{name}</flow-name>
+                <id>{id}</id>
+                <table_id>{table_id}</table_id>
+                <priority>{priority}</priority>
+                <instructions>
+                    <instruction><order>0</order><apply-actions><action><order>0</order>
+                        <output-action>
+                            <output-node-connector>{output_port}</output-node-connector>
+                            <max-length>65535</max-length>
+                        </output-action>
+                    </action></apply-actions></instruction>
+                </instructions>
+                <match>
+                    <ethernet-match>
+                        <ethernet-type><type>2048</type></ethernet-type>
+                        <ethernet-destination><address>{mac_dst}</address></ethernet-destination>
+                    </ethernet-match>
+                </match>
+            </flow>
 
-    # An xml parametrized sting
-    parametrized_xml = '''<?xml version="1.0" encoding="UTF-8" standalone="no"?>
-        <flow xmlns="urn:opendaylight:flow:inventory">
-            <flow-name>{name}</flow-name>
-            <id>{id}</id>
-            <table_id>{table_id}</table_id>
-            <priority>{priority}</priority>
-            <instructions>
-                <instruction>
-                    <order>0</order>
-                    <apply-actions>
-                        <action>
-                            <order>0</order>
-                            <output-action>
-                                <output-node-connector>{output_port}</output-node-connector>
-                                <max-length>65535</max-length>
-                            </output-action>
-                        </action>
-                    </apply-actions>
-                </instruction>
-            </instructions>
-            <match>
-                <ethernet-match>
-                    <ethernet-type>
-                        <type>2048</type>
-                    </ethernet-type>
-                    <ethernet-destination>
-                        <address>{mac_dst}</address>
-                    </ethernet-destination>
-                </ethernet-match>
-            </match>
-        </flow>
+        Everything from the priority to the end of the body only depends on ( action, match, priority ),
+        so it is built once and cached. Only the name, id and table are filled in for each flow.
+
+        A flow can send its packets to a select group instead of a port ( see crete_group_forward_flow ), the
+        group's buckets share them between ports ( see crete_select_group ).
     '''
 
+    # The constant parts of the minified xml body
+    xml_head = '<?xml version="1.0" encoding="UTF-8" standalone="no"?><flow xmlns="urn:opendaylight:flow:inventory"><flow-name>'
+    xml_tail = (
+        '<priority>{priority}</priority>'
+        '<instructions><instruction><order>0</order><apply-actions><action><order>0</order>{action}'
+        '</action></apply-actions></instruction></instructions>'
+        '<match><ethernet-match><ethernet-type><type>2048</type></ethernet-type>{match}</match></flow>'
+    )
+
+    # The match fields (after the ethernet type) of each kind of forward flow
+    xml_matches = {
+        'mac': '<ethernet-destination><address>{}</address></ethernet-destination></ethernet-match>',
+        'prefix': '</ethernet-match><ipv4-destination>{}</ipv4-destination>',
+        'default': '</ethernet-match>'
+    }
+
+    # The action of each kind of forward flow
+    xml_actions = {
+        'output': '<output-action><output-node-connector>{}</output-node-connector><max-length>65535</max-length></output-action>',
+        'group': '<group-action><group-id>{}</group-id></group-action>'
+    }
+
+    # The constant parts of the minified xml body of a select group and of its buckets
+    xml_group_head = '<?xml version="1.0" encoding="UTF-8" standalone="no"?><group xmlns="urn:opendaylight:flow:inventory"><group-name>'
+    xml_bucket = '<bucket><bucket-id>{bucket_id}</bucket-id><weight>{weight}</weight><action><order>0</order>{action}</action></bucket>'
+
+    content_types = {'xml': 'application/xml', 'json': 'application/json'}
+
+
+    def __init__(self, body_format=flow_body_format, cache_size=flow_body_cache_size):
+        self.body_format = body_format              # 'xml' or 'json'
+        self.content_type = self.content_types[body_format]
+        self.cache_size = cache_size                # Maximum number of cached tails ( the cache is emptied when full )
+        self.tails = {}                             # The cached tails (key: (action_kind, action_value, match_kind, match_value, priority), value: tail )
+
+
     def crete_port_forward_flow(self, flow_id, output_port, mac_dst, flow_name='', table_id=0, priority=2000):
+        '''
+            Forward the IPv4 packets with destination mac_dst to output_port
+        '''
+        return self._create_flow(flow_id, output_port, 'mac', mac_dst, flow_name, table_id, priority)
+
+    def crete_prefix_forward_flow(self, flow_id, output_port, prefix, flow_name='', table_id=0, priority=2000):
+        '''
+            Same as crete_port_forward_flow, but matches all IPv4 packets with destination in prefix ( like '10.0.0.0/24' )
+        '''
+        return self._create_flow(flow_id, output_port, 'prefix', prefix, flow_name, table_id, priority)
+
+    def crete_default_forward_flow(self, flow_id, output_port, flow_name='', table_id=0, priority=1000):
+        '''
+            Same as crete_port_forward_flow, but matches all IPv4 packets. Its priority is lower than
+            the other forward flows, so it only forwards the packets none of them matched.
+        '''
+        return self._create_flow(flow_id, output_port, 'default', None, flow_name, table_id, priority)
+
+    def crete_group_forward_flow(self, flow_id, group_id, mac_dst, flow_name='', table_id=0, priority=2000):
+        '''
+            Same as crete_port_forward_flow, but sends the packets to the group with group_id
+        '''
+        return self._create_flow(flow_id, group_id, 'mac', mac_dst, flow_name, table_id, priority, 'group')
+
+
+    def crete_select_group(self, group_id, buckets, group_name=''):
+        '''
+            A select group sharing the packets between the ports of buckets ( key: port_number, value: weight ):
+            each packet goes out of one of them, picked with a probability proportional to its weight. The
+            bucket of a port is numbered after the port, so its statistics can be told apart across updates.
+        '''
+        if len(group_name) == 0:
+            group_name = 'group_' + str(group_id)
+
+        ports = sorted(buckets, key=int)
+        if self.body_format == 'json':
+            group = {
+                'group-id': group_id,
+                'group-name': group_name,
+                'group-type': 'group-select',
+                'barrier': False,
+                'buckets': {'bucket': [
+                    {'bucket-id': int(port_num), 'weight': buckets[port_num], 'action': [
+                        {'order': 0, 'output-action': {'output-node-connector': port_num, 'max-length': 65535}}
+                    ]} for port_num in ports
+                ]}
+            }
+            return json.dumps({'flow-node-inventory:group': [group]}, separators=(',', ':'))
+
+        return (
+            self.xml_group_head + group_name + '</group-name><group-id>' + str(group_id) + '</group-id>'
+            '<group-type>group-select</group-type><barrier>false</barrier><buckets>' +
+            ''.join(self.xml_bucket.format(bucket_id=int(port_num), weight=buckets[port_num], action=self.xml_actions['output'].format(port_num)) for port_num in ports) +
+            '</buckets></group>'
+        )
+
+
+    def _create_flow(self, flow_id, action_value, match_kind, match_value, flow_name, table_id, priority, action_kind='output'):
+        '''
+            Fill in the name, id and table of a flow in front of its cached tail
+        '''
         if len(flow_name) == 0:
-            self.flow_name = 'flow_' + flow_id
-
-        return self.parametrized_xml.format(
-                name = flow_name, 
-                id = flow_id,
-                table_id = table_id, 
-                priority = priority, 
-                output_port = output_port,
-                mac_dst = mac_dst
-            )    
\ No newline at end of file
+            flow_name = 'flow_' + flow_id
+
+        key = (action_kind, action_value, match_kind, match_value, priority)
+        tail = self.tails.get(key)
+        if tail is None:
+            if len(self.tails) >= self.cache_size:
+                self.tails = {}
+            tail = self.tails[key] = self._compile_tail(*key)
+
+        if self.body_format == 'json':
+            return '{"flow-node-inventory:flow":[{"flow-name":' + json.dumps(flow_name) + ',"id":' + json.dumps(flow_id) + ',"table_id":' + str(table_id) + ',' + tail
+
+        return self.xml_head + flow_name + '</flow-name><id>' + flow_id + '</id><table_id>' + str(table_id) + '</table_id>' + tail
+
+
+    def _compile_tail(self, action_kind, action_value, match_kind, match_value, priority):
+        '''
+            Build the part of a flow body from the priority to the end
+        '''
+        if self.body_format == 'json':
+            match = {'ethernet-match': {'ethernet-type': {'type': 2048}}}
+            if match_kind == 'mac':
+                match['ethernet-match']['ethernet-destination'] = {'address': match_value}
+            elif match_kind == 'prefix':
+                match['ipv4-destination'] = match_value
+
+            if action_kind == 'group':
+                action = {'order': 0, 'group-action': {'group-id': action_value}}
+            else:
+                action = {'order': 0, 'output-action': {'output-node-connector': action_value, 'max-length': 65535}}
+            instructions = {'instruction': [{'order': 0, 'apply-actions': {'action': [action]}}]}
+
+            return (
+                '"priority":' + str(priority) +
+                ',"instructions":' + json.dumps(instructions, separators=(',', ':')) +
+                ',"match":' + json.dumps(match, separators=(',', ':')) + '}]}'
+            )
+
+        return self.xml_tail.format(
+                priority = priority,
+                action = self.xml_actions[action_kind].format(action_value),
+                match = self.xml_matches[match_kind].format(match_value)
+            )
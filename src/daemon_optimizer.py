@@ -1,4 +1,5 @@
 from src.components.optimizer import NetworkOptimizer
+from src.params import warm_start
 
 
 
@@ -17,5 +18,6 @@ if __name__ == '__main__':
     except SystemExit:
         print '\nExiting...'
 
-    # Delete all the flows created during optimization
-    n_opt.flow_manager.delete_all_flows()
\ No newline at end of file
+    # Delete all the flows created during optimization ( unless the next run warm starts from them )
+    if not warm_start:
+        n_opt.flow_manager.delete_all_flows()
\ No newline at end of file
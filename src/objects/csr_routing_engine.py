@@ -0,0 +1,163 @@
+#!/usr/bin/python
+
+from heapq import heappush, heappop
+from itertools import count
+from routing_engine import RoutingEngine
+
+
+class CsrRoutingEngine(RoutingEngine):
+    '''
+        A RoutingEngine that runs dijkstra on a compact copy of the graph in CSR ( compressed sparse row ) form:
+            - every node gets an integer id ( the position of its name in self.names )
+            - the edges leaving node i are the slots offsets[i] .. offsets[i + 1] - 1 of the targets / weights arrays
+        so the search works on integer lists instead of the dictionaries of the networkx graph.
+
+        The nodes and their edges are laid out in the order the graph iterates them, so dijkstra relaxes the
+        edges in the same order as on the graph and the paths ( and their tie-breaking ) stay the same as
+        RoutingEngine's. The paths are translated back to the node names of the graph.
+
+        The structure is built on first use and rebuilt after reset() / invalidate_trees() or when the number
+        of nodes / edges changes. The weights are copied from the graph before each computation.
+    '''
+
+    def __init__(self, graph):
+        RoutingEngine.__init__(self, graph)
+        self.names = None           # The node names by id
+        self.ids = None             # The id of each node (key: node name, value: id )
+        self.offsets = None         # The first slot of each node's edges ( and a last entry with the number of edges )
+        self.targets = None         # The head of the edge in each slot
+        self.weights = None         # The weight of the edge in each slot
+        self.shape = None           # The (number_of_nodes, number_of_edges) the structure was built for
+
+
+    def build(self):
+        '''
+            Build the CSR structure from the graph
+        '''
+        succ = self.graph.succ
+        self.names = list(succ)
+        self.ids = {name: idx for idx, name in enumerate(self.names)}
+
+        self.offsets = [0]
+        self.targets = []
+        for name in self.names:
+            self.targets.extend(self.ids[target] for target in succ[name])
+            self.offsets.append(len(self.targets))
+
+        self.shape = (len(self.names), len(self.targets))
+
+
+    def refresh(self):
+        '''
+            Rebuild the structure if the graph changed and copy the current weights
+        '''
+        if self.shape is None or self.shape != (self.graph.number_of_nodes(), self.graph.number_of_edges()):
+            self.build()
+
+        succ = self.graph.succ
+        self.weights = [attrs['weight'] for name in self.names for attrs in succ[name].values()]
+
+
+    def _tree(self, source):
+        '''
+            Run dijkstra from node id source. Returns the (dist, pred) lists indexed by node id: dist is None
+            for the nodes not reached and pred is -1 for the source.
+        '''
+        offsets = self.offsets
+        targets = self.targets
+        weights = self.weights
+
+        dist = [None] * len(self.names)     # Final distances
+        seen = [None] * len(self.names)     # Tentative distances
+        pred = [None] * len(self.names)
+        seen[source] = 0
+        pred[source] = -1
+        c = count()                         # Breaks ties in the heap by push order ( like networkx does )
+        fringe = [(0, next(c), source)]
+
+        while fringe:
+            (d, _, v) = heappop(fringe)
+            if dist[v] is not None:
+                continue        # Already settled
+            dist[v] = d
+
+            for slot in xrange(offsets[v], offsets[v + 1]):
+                u = targets[slot]
+                vu_dist = d + weights[slot]
+                if dist[u] is None and (seen[u] is None or vu_dist < seen[u]):
+                    seen[u] = vu_dist
+                    pred[u] = v
+                    heappush(fringe, (vu_dist, next(c), u))
+
+        return dist, pred
+
+
+    def _tree_path(self, pred, target):
+        '''
+            Same as RoutingEngine.tree_path for the lists of _tree, returns the path with the node names
+        '''
+        if pred[target] is None:
+            return None
+
+        names = self.names
+        path = []
+        node = target
+        while node != -1:
+            path.append(names[node])
+            node = pred[node]
+        path.reverse()
+        return path
+
+
+    def get_shortest_path_tree(self, source):
+        '''
+            Same as RoutingEngine.get_shortest_path_tree ( the tree is returned as dictionaries keyed by node name )
+        '''
+        self.refresh()
+        dist, pred = self._tree(self.ids[source])
+
+        names = self.names
+        dist_dict = {}
+        pred_dict = {}
+        for idx, node_dist in enumerate(dist):
+            if node_dist is not None:
+                dist_dict[names[idx]] = node_dist
+                pred_dict[names[idx]] = names[pred[idx]] if pred[idx] != -1 else None
+
+        return dist_dict, pred_dict
+
+
+    def get_paths_for_hosts(self, host_ids, sources=None):
+        '''
+            Same as RoutingEngine.get_paths_for_hosts
+        '''
+        self.refresh()
+        ids = self.ids
+
+        paths = []
+        for src in (host_ids if sources is None else sources):
+            _, pred = self._tree(ids[src])
+            for dst in host_ids:
+                if dst == src:
+                    continue
+                path = self._tree_path(pred, ids[dst])
+                if path is not None:
+                    paths.append(path)
+
+        return paths
+
+
+    def invalidate_trees(self, removed_edges, added_edges):
+        '''
+            Same as RoutingEngine.invalidate_trees, also rebuilds the structure on the next computation
+        '''
+        RoutingEngine.invalidate_trees(self, removed_edges, added_edges)
+        self.shape = None
+
+
+    def reset(self):
+        '''
+            Same as RoutingEngine.reset, also rebuilds the structure on the next computation
+        '''
+        RoutingEngine.reset(self)
+        self.shape = None
@@ -0,0 +1,146 @@
+#!/usr/bin/python
+
+from collections import namedtuple
+import threading
+
+
+# A flow installed in a switch: the flow forwards packets with destination mac to the switch's port port_num
+# ( priority is the one it was installed with, None if unknown )
+InstalledFlow = namedtuple('InstalledFlow', ['switch_id', 'flow_id', 'mac', 'port_num', 'priority'])
+
+
+class FlowRegistry:
+    '''
+        This class keeps the flows installed in the switches.
+        The flows are keyed by ( switch_id, flow_id ) and indexed by switch, by destination mac and by
+        ( switch_id, mac ), so adding, removing and looking up flows takes constant time.
+    '''
+
+    def __init__(self):
+        self.flows = {}         # All installed flows (key: (switch_id, flow_id), value: InstalledFlow )
+        self.by_switch = {}     # The flow ids installed in each switch (key: switch_id, value: set(flow_id, ...) )
+        self.by_mac = {}        # The flows forwarding to each destination (key: mac, value: set((switch_id, flow_id), ...) )
+        self.by_destination = {}    # The flow ids of each destination in each switch (key: (switch_id, mac), value: set(flow_id, ...) )
+        self.lock = threading.Lock()    # Flows are added / removed by concurrent requests
+
+
+    def add(self, switch_id, flow_id, mac, port_num, priority=None):
+        '''
+            Register a flow. Registering a flow that already exists ( like a retried PUT ) replaces it.
+        '''
+        key = (switch_id, flow_id)
+        with self.lock:
+            if key in self.flows:
+                self._unindex(self.flows[key])
+
+            flow = InstalledFlow(switch_id, flow_id, mac, port_num, priority)
+            self.flows[key] = flow
+            self.by_switch.setdefault(switch_id, set()).add(flow_id)
+            self.by_mac.setdefault(mac, set()).add(key)
+            self.by_destination.setdefault( (switch_id, mac), set() ).add(flow_id)
+
+
+    def remove(self, switch_id, flow_id):
+        '''
+            Unregister a flow. Returns the removed InstalledFlow or None if it was not registered.
+        '''
+        with self.lock:
+            flow = self.flows.pop((switch_id, flow_id), None)
+            if flow is not None:
+                self._unindex(flow)
+            return flow
+
+
+    def _unindex(self, flow):
+        '''
+            Remove a flow from the secondary indexes ( the lock must be held )
+        '''
+        flow_ids = self.by_switch[flow.switch_id]
+        flow_ids.discard(flow.flow_id)
+        if len(flow_ids) == 0:
+            del self.by_switch[flow.switch_id]
+
+        keys = self.by_mac[flow.mac]
+        keys.discard( (flow.switch_id, flow.flow_id) )
+        if len(keys) == 0:
+            del self.by_mac[flow.mac]
+
+        flow_ids = self.by_destination[(flow.switch_id, flow.mac)]
+        flow_ids.discard(flow.flow_id)
+        if len(flow_ids) == 0:
+            del self.by_destination[(flow.switch_id, flow.mac)]
+
+
+    def get(self, switch_id, flow_id):
+        '''
+            Return the InstalledFlow with this key or None
+        '''
+        return self.flows.get((switch_id, flow_id))
+
+
+    def flows_on_switch(self, switch_id):
+        '''
+            Return a list with the InstalledFlows of a switch
+        '''
+        with self.lock:
+            return [self.flows[(switch_id, flow_id)] for flow_id in self.by_switch.get(switch_id, ())]
+
+
+    def flows_to_mac(self, mac):
+        '''
+            Return a list with the InstalledFlows forwarding to destination mac
+        '''
+        with self.lock:
+            return [self.flows[key] for key in self.by_mac.get(mac, ())]
+
+
+    def flows_to(self, switch_id, mac):
+        '''
+            Return a list with the InstalledFlows of switch_id forwarding to destination mac
+        '''
+        with self.lock:
+            return [self.flows[(switch_id, flow_id)] for flow_id in self.by_destination.get((switch_id, mac), ())]
+
+
+    def find(self, switch_id, mac, port_num):
+        '''
+            Return the flow_id of the flow of switch_id forwarding mac to port_num or None
+        '''
+        with self.lock:
+            for flow_id in self.by_destination.get((switch_id, mac), ()):
+                if self.flows[(switch_id, flow_id)].port_num == port_num:
+                    return flow_id
+            return None
+
+
+    def installed_flows(self):
+        '''
+            Return a set with a ( switch_id, mac, port ) tuple for each installed flow, to compute diffs against
+        '''
+        with self.lock:
+            return set( (flow.switch_id, flow.mac, flow.port_num) for flow in self.flows.values() )
+
+
+    def clear(self):
+        '''
+            Unregister all flows
+        '''
+        with self.lock:
+            self.flows = {}
+            self.by_switch = {}
+            self.by_mac = {}
+            self.by_destination = {}
+
+
+    def __contains__(self, key):
+        return key in self.flows
+
+    def __len__(self):
+        return len(self.flows)
+
+    def __iter__(self):
+        '''
+            Iterate over a copy of the InstalledFlows, so flows can be removed while iterating
+        '''
+        with self.lock:
+            return iter(self.flows.values())
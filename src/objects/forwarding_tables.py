@@ -0,0 +1,152 @@
+#!/usr/bin/python
+
+
+class ForwardingTables:
+    '''
+        The routing as a destination table per switch { switch_id: { mac: port_number } }: each switch forwards
+        the packets of a destination through exactly one of its ports.
+
+        The tables are built from the flows of the paths, ( switch_id, mac, port_number ) tuples counted once
+        for every path using them. When the paths to a destination leave a switch through different ports the
+        port used by most paths wins ( the current one on ties, so the tables don't flap ). Every such port is
+        on a shortest path from the switch to the destination, so the tables never loop.
+
+        The ( switch_id, mac ) entries whose counts changed are kept, so diff() costs time proportional to
+        the destinations whose paths changed instead of the size of the tables. A destination moving to another
+        port is reported as a single modification instead of a delete and an add.
+    '''
+
+    def __init__(self):
+        self.tables = {}        # The destination tables (key: switch_id, value: {mac: port_number} )
+        self.counts = {}        # The paths using each port for each entry (key: (switch_id, mac), value: {port_number: count} )
+        self.dirty = set()      # The ( switch_id, mac ) entries whose counts changed since the last diff
+
+
+    def add_flow(self, flow, count=1):
+        '''
+            Count a ( switch_id, mac, port_number ) flow for count more paths ( negative to uncount it )
+        '''
+        (switch_id, mac, port_num) = flow
+        key = (switch_id, mac)
+        ports = self.counts.setdefault(key, {})
+        ports[port_num] = ports.get(port_num, 0) + count
+        if ports[port_num] <= 0:
+            del ports[port_num]
+            if not ports:
+                del self.counts[key]
+        self.dirty.add(key)
+
+    def remove_flow(self, flow, count=1):
+        self.add_flow(flow, -count)
+
+
+    def set_counts(self, counts):
+        '''
+            Replace all the counts with counts (key: (switch_id, mac, port_number), value: number of paths )
+        '''
+        self.dirty.update(self.counts)
+        self.counts = {}
+        for (switch_id, mac, port_num), count in counts.iteritems():
+            if count > 0:
+                self.counts.setdefault((switch_id, mac), {})[port_num] = count
+        self.dirty.update(self.counts)
+
+
+    def diff(self):
+        '''
+            Bring the tables up to date with the counts.
+
+            Returns:
+                (add_flows, del_flows, modify_flows): The entries added / deleted as lists of ( switch_id, mac, port )
+                    tuples and the entries that moved as a list of ( switch_id, mac, old_port, new_port ) tuples.
+        '''
+        add_flows = []
+        del_flows = []
+        modify_flows = []
+
+        for key in self.dirty:
+            (switch_id, mac) = key
+            table = self.tables.get(switch_id)
+            old_port = table.get(mac) if table is not None else None
+            new_port = self._choose_port(self.counts.get(key), old_port)
+
+            if new_port == old_port:
+                continue
+            if new_port is None:
+                del table[mac]
+                if not table:
+                    del self.tables[switch_id]
+                del_flows.append( (switch_id, mac, old_port) )
+            else:
+                self.tables.setdefault(switch_id, {})[mac] = new_port
+                if old_port is None:
+                    add_flows.append( (switch_id, mac, new_port) )
+                else:
+                    modify_flows.append( (switch_id, mac, old_port, new_port) )
+
+        self.dirty = set()
+        return add_flows, del_flows, modify_flows
+
+
+    @staticmethod
+    def _choose_port(ports, current):
+        '''
+            The port used by most paths, current on ties ( then the lowest port number ), None if ports is empty
+        '''
+        if not ports:
+            return None
+        most = max(ports.itervalues())
+        if ports.get(current) == most:
+            return current
+        return min(port_num for port_num, count in ports.iteritems() if count == most)
+
+
+    def to_flows(self, flows):
+        '''
+            Fill flows, a depth-2 dictionary { switch_id: { port_number: set(), ...}, ... } like the one returned
+            by NetworkOptimizer.gen_empty_flows, with the tables. Returns flows.
+        '''
+        for switch_id, table in self.tables.iteritems():
+            ports = flows.setdefault(switch_id, {})
+            for mac, port_num in table.iteritems():
+                ports.setdefault(port_num, set()).add(mac)
+        return flows
+
+
+    @staticmethod
+    def diff_flows(new_flows, old_flows):
+        '''
+            Same as diff for two depth-2 dictionaries formated like the flows of NetworkOptimizer.gen_optimized_flows,
+            that forward each destination through a single port of each switch.
+        '''
+        new_tables = ForwardingTables._flows_to_tables(new_flows)
+        old_tables = ForwardingTables._flows_to_tables(old_flows)
+
+        add_flows = []
+        del_flows = []
+        modify_flows = []
+        for switch_id in set(new_tables) | set(old_tables):
+            new_table = new_tables.get(switch_id, {})
+            old_table = old_tables.get(switch_id, {})
+            if new_table == old_table:
+                continue
+
+            for mac, port_num in new_table.iteritems():
+                old_port = old_table.get(mac)
+                if old_port is None:
+                    add_flows.append( (switch_id, mac, port_num) )
+                elif old_port != port_num:
+                    modify_flows.append( (switch_id, mac, old_port, port_num) )
+            for mac, port_num in old_table.iteritems():
+                if mac not in new_table:
+                    del_flows.append( (switch_id, mac, port_num) )
+
+        return add_flows, del_flows, modify_flows
+
+
+    @staticmethod
+    def _flows_to_tables(flows):
+        return {
+            switch_id: {mac: port_num for port_num, macs_set in ports.iteritems() for mac in macs_set}
+                for switch_id, ports in flows.iteritems()
+        }
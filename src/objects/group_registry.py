@@ -0,0 +1,138 @@
+#!/usr/bin/python
+
+from collections import namedtuple
+import threading
+
+
+# A select group installed in a switch: the flow flow_id sends the packets with destination mac to the group,
+# whose buckets share them between ports ( buckets: {port_number: weight} )
+InstalledGroup = namedtuple('InstalledGroup', ['switch_id', 'group_id', 'flow_id', 'mac', 'buckets'])
+
+
+class GroupRegistry:
+    '''
+        This class keeps the select groups installed in the switches, keyed by ( switch_id, mac ).
+        It also hands out the group ids: a destination keeps the id of its group in a switch till the group
+        is released, so a group that failed to install is written again under the same id.
+    '''
+
+    def __init__(self):
+        self.groups = {}        # All installed groups (key: (switch_id, mac), value: InstalledGroup )
+        self.by_id = {}         # The installed groups by id (key: (switch_id, group_id), value: InstalledGroup )
+        self.by_switch = {}     # The destinations with a group installed in each switch (key: switch_id, value: set(mac, ...) )
+        self.ids = {}           # The group id of each destination (key: (switch_id, mac), value: group_id )
+        self.free_ids = {}      # The released ids of each switch (key: switch_id, value: list(group_id, ...) )
+        self.next_ids = {}      # The next new id of each switch (key: switch_id, value: group_id )
+        self.lock = threading.Lock()    # Groups are added / removed by concurrent requests
+
+
+    def group_id(self, switch_id, mac):
+        '''
+            Return the id of the group of mac in switch_id, assigning one if it has none
+        '''
+        key = (switch_id, mac)
+        with self.lock:
+            group_id = self.ids.get(key)
+            if group_id is None:
+                free = self.free_ids.get(switch_id)
+                if free:
+                    group_id = free.pop()
+                else:
+                    group_id = self.next_ids.get(switch_id, 1)
+                    self.next_ids[switch_id] = group_id + 1
+                self.ids[key] = group_id
+            return group_id
+
+
+    def add(self, switch_id, group_id, flow_id, mac, buckets):
+        '''
+            Register a group. Registering a group that already exists ( like an update ) replaces it.
+        '''
+        group = InstalledGroup(switch_id, group_id, flow_id, mac, dict(buckets))
+        with self.lock:
+            self.groups[(switch_id, mac)] = group
+            self.by_id[(switch_id, group_id)] = group
+            self.by_switch.setdefault(switch_id, set()).add(mac)
+
+
+    def adopt(self, switch_id, group_id, flow_id, mac, buckets):
+        '''
+            Register a group installed with a known id ( by a previous run ): mac keeps group_id and the new
+            ids of the switch are handed out above it
+        '''
+        with self.lock:
+            self.ids[(switch_id, mac)] = group_id
+            self.next_ids[switch_id] = max(self.next_ids.get(switch_id, 1), group_id + 1)
+        self.add(switch_id, group_id, flow_id, mac, buckets)
+
+
+    def remove(self, switch_id, mac):
+        '''
+            Unregister a group and release its id. Returns the removed InstalledGroup or None if it was not registered.
+        '''
+        key = (switch_id, mac)
+        with self.lock:
+            group = self.groups.pop(key, None)
+            if group is not None:
+                del self.by_id[(switch_id, group.group_id)]
+                macs = self.by_switch[switch_id]
+                macs.discard(mac)
+                if len(macs) == 0:
+                    del self.by_switch[switch_id]
+            group_id = self.ids.pop(key, None)
+            if group_id is not None:
+                self.free_ids.setdefault(switch_id, []).append(group_id)
+            return group
+
+
+    def get(self, switch_id, mac):
+        '''
+            Return the InstalledGroup of mac in switch_id or None
+        '''
+        return self.groups.get((switch_id, mac))
+
+
+    def get_by_id(self, switch_id, group_id):
+        '''
+            Return the InstalledGroup with this id or None
+        '''
+        return self.by_id.get((switch_id, group_id))
+
+
+    def has_groups(self, switch_id):
+        '''
+            Return True if any group is installed in switch_id
+        '''
+        return switch_id in self.by_switch
+
+
+    def installed_groups(self):
+        '''
+            Return a dictionary with the buckets of each installed group (key: (switch_id, mac), value: {port_number: weight} )
+        '''
+        with self.lock:
+            return {key: group.buckets for key, group in self.groups.items()}
+
+
+    def clear(self):
+        '''
+            Unregister all groups and release their ids
+        '''
+        with self.lock:
+            self.groups = {}
+            self.by_id = {}
+            self.by_switch = {}
+            self.ids = {}
+            self.free_ids = {}
+            self.next_ids = {}
+
+
+    def __len__(self):
+        return len(self.groups)
+
+    def __iter__(self):
+        '''
+            Iterate over a copy of the InstalledGroups, so groups can be removed while iterating
+        '''
+        with self.lock:
+            return iter(self.groups.values())
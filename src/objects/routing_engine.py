@@ -0,0 +1,288 @@
+#!/usr/bin/python
+
+from heapq import heappush, heappop
+from itertools import count
+
+
+class RoutingEngine:
+    '''
+        This class computes the shortest paths between the hosts of a topology.
+        Instead of running one dijkstra per host pair, it grows one shortest-path
+        tree per source host and reads the path to every other host from that tree.
+    '''
+
+    def __init__(self, graph):
+        self.graph = graph          # The directed graph of the topology ( edges must carry a 'weight' attribute )
+        self.trees = {}             # Incremental mode: the shortest-path tree of each source host (key: host_id, value: (dist, pred) )
+        self.paths = {}             # Incremental mode: the current path of each host pair (key: (src_id, dst_id), value: path )
+
+
+    def get_shortest_path_tree(self, source):
+        '''
+            Run dijkstra once from source and return the shortest-path tree to every reachable node.
+
+            The search visits nodes and relaxes edges in the same order as nx.dijkstra_path, and a node's
+            predecessor is only replaced by a strictly shorter path. So the path read from the tree for
+            any (source, target) is exactly the one nx.dijkstra_path(graph, source, target) returns,
+            including the tie-breaking between equal cost paths.
+
+            Returns:
+                (dist, pred): Two dictionaries keyed by node_id. dist holds the cost of the shortest path
+                    from source and pred holds the previous node in that path ( None for the source ).
+        '''
+        succ = self.graph.succ
+        dist = {}               # Final distances
+        seen = {source: 0}      # Tentative distances
+        pred = {source: None}
+        c = count()             # Breaks ties in the heap by push order ( like networkx does )
+        fringe = [(0, next(c), source)]
+
+        while fringe:
+            (d, _, v) = heappop(fringe)
+            if v in dist:
+                continue        # Already settled
+            dist[v] = d
+
+            for u, attrs in succ[v].items():
+                vu_dist = d + attrs['weight']
+                if u not in dist and (u not in seen or vu_dist < seen[u]):
+                    seen[u] = vu_dist
+                    pred[u] = v
+                    heappush(fringe, (vu_dist, next(c), u))
+
+        return dist, pred
+
+
+    def get_distances_to(self, target):
+        '''
+            Run dijkstra once towards target ( over the edges reversed ) and return the cost of the shortest path
+            from every node that reaches target, as a dictionary keyed by node_id.
+        '''
+        graph_pred = self.graph.pred
+        dist = {}
+        seen = {target: 0}
+        c = count()
+        fringe = [(0, next(c), target)]
+
+        while fringe:
+            (d, _, v) = heappop(fringe)
+            if v in dist:
+                continue
+            dist[v] = d
+
+            for u, attrs in graph_pred[v].items():
+                uv_dist = d + attrs['weight']
+                if u not in dist and (u not in seen or uv_dist < seen[u]):
+                    seen[u] = uv_dist
+                    heappush(fringe, (uv_dist, next(c), u))
+
+        return dist
+
+
+    @staticmethod
+    def tree_path(pred, target):
+        '''
+            Walk the predecessors of a shortest-path tree back from target and return the path as a list
+            of node ids ( source first ). Returns None if target is not reachable.
+        '''
+        if target not in pred:
+            return None
+
+        path = []
+        node = target
+        while node is not None:
+            path.append(node)
+            node = pred[node]
+        path.reverse()
+        return path
+
+
+    def get_paths_for_hosts(self, host_ids, sources=None):
+        '''
+            Return the dijkstra paths between every ordered pair of different hosts in host_ids,
+            running a single dijkstra per source host. Pairs that are not connected are skipped.
+            If sources is given, only the paths starting from those hosts are returned.
+        '''
+        paths = []
+        for src in (host_ids if sources is None else sources):
+            _, pred = self.get_shortest_path_tree(src)
+            for dst in host_ids:
+                if dst == src:
+                    continue
+                path = self.tree_path(pred, dst)
+                if path is not None:
+                    paths.append(path)
+
+        return paths
+
+
+    def repair_shortest_path_tree(self, dist, pred, changed_edges):
+        '''
+            Repair in place a shortest-path tree returned by get_shortest_path_tree after some edge weights
+            changed ( dynamic SSSP ). Only the part of the tree the changed edges affect is recomputed:
+                - a tree edge that got more expensive detaches the subtree below it. Its nodes are re-attached
+                  to their best settled neighbour and dijkstra continues from there.
+                - an edge that got cheaper and now offers a strictly shorter path re-opens its head node
+                  and dijkstra continues from there.
+            Edges that got more expensive but are not in the tree can not change it. Paths of nodes that are not
+            affected are kept as they are, even if an equal cost path appears.
+
+            Parameters:
+                dist, pred: The tree to repair ( see get_shortest_path_tree ).
+                changed_edges: A dict { (node_u, node_v): old_weight } of the edges whose weight changed.
+                    The graph must already hold the new weights.
+
+            Returns:
+                touched: A set with the nodes whose distance or predecessor might have changed.
+        '''
+        succ = self.graph.succ
+        graph_pred = self.graph.pred
+
+        # Find the subtrees hanging below tree edges that got more expensive
+        invalid = set()
+        stack = [v for (u, v), old_weight in changed_edges.items() if pred.get(v) == u and succ[u][v]['weight'] > old_weight]
+        if stack:
+            children = {}
+            for node, parent in pred.items():
+                children.setdefault(parent, []).append(node)
+            while stack:
+                node = stack.pop()
+                if node not in invalid:
+                    invalid.add(node)
+                    stack.extend(children.get(node, []))
+
+        for node in invalid:
+            del dist[node]
+            del pred[node]
+
+        seen = {}               # Tentative distances of the nodes that are not settled
+        c = count()
+        fringe = []
+
+        # Re-attach each invalid node to its best settled neighbour
+        for node in invalid:
+            for parent, attrs in graph_pred[node].items():
+                if parent in dist:
+                    nd = dist[parent] + attrs['weight']
+                    if node not in seen or nd < seen[node]:
+                        seen[node] = nd
+                        pred[node] = parent
+            if node in seen:
+                heappush(fringe, (seen[node], next(c), node))
+
+        # Re-open the nodes that edges which got cheaper now reach with a shorter path
+        for (u, v), old_weight in changed_edges.items():
+            weight = succ[u][v]['weight']
+            if weight < old_weight and u in dist and v not in invalid:
+                nd = dist[u] + weight
+                if (v not in dist or nd < dist[v]) and (v not in seen or nd < seen[v]):
+                    dist.pop(v, None)
+                    seen[v] = nd
+                    pred[v] = u
+                    heappush(fringe, (nd, next(c), v))
+
+        # Continue dijkstra from the re-opened nodes
+        touched = set(invalid)
+        while fringe:
+            (d, _, v) = heappop(fringe)
+            if v in dist:
+                continue
+            dist[v] = d
+            touched.add(v)
+
+            for u, attrs in succ[v].items():
+                vu_dist = d + attrs['weight']
+                if u in dist:
+                    if vu_dist < dist[u]:
+                        del dist[u]     # A settled node got a shorter path, re-open it
+                    else:
+                        continue
+                if u not in seen or vu_dist < seen[u]:
+                    seen[u] = vu_dist
+                    pred[u] = v
+                    heappush(fringe, (vu_dist, next(c), u))
+
+        return touched
+
+
+    def get_changed_paths_for_hosts(self, host_ids, changed_edges):
+        '''
+            Incremental version of get_paths_for_hosts. The shortest-path tree of each source host is kept
+            between calls and only repaired for the edges in changed_edges ( see repair_shortest_path_tree ).
+            The first call for a source computes its tree from scratch.
+
+            Parameters:
+                host_ids: The hosts to route between.
+                changed_edges: A dict { (node_u, node_v): old_weight } of the edges whose weight changed since the last call.
+
+            Returns:
+                A list of (old_path, new_path) tuples, one for each host pair whose path changed.
+                old_path / new_path is None if the pair was / is not connected.
+        '''
+        changed_paths = []
+        for src in host_ids:
+            if src not in self.trees:
+                self.trees[src] = self.get_shortest_path_tree(src)
+            elif changed_edges:
+                dist, pred = self.trees[src]
+                if not self.repair_shortest_path_tree(dist, pred, changed_edges):
+                    continue
+            else:
+                continue
+
+            pred = self.trees[src][1]
+            for dst in host_ids:
+                if dst == src:
+                    continue
+                new_path = self.tree_path(pred, dst)
+                old_path = self.paths.get((src, dst))
+                if new_path != old_path:
+                    changed_paths.append((old_path, new_path))
+                    if new_path is None:
+                        del self.paths[(src, dst)]
+                    else:
+                        self.paths[(src, dst)] = new_path
+
+        return changed_paths
+
+
+    def remove_hosts(self, host_ids):
+        '''
+            Forget the trees and paths of the hosts in host_ids ( removed from the topology ).
+
+            Returns:
+                A list of (old_path, None) tuples, one for each kept path starting or ending at one of the hosts.
+        '''
+        removed = set(host_ids)
+        for host_id in removed:
+            self.trees.pop(host_id, None)
+
+        removed_paths = []
+        if removed:
+            for pair, path in self.paths.items():
+                if pair[0] in removed or pair[1] in removed:
+                    removed_paths.append((path, None))
+                    del self.paths[pair]
+
+        return removed_paths
+
+
+    def invalidate_trees(self, removed_edges, added_edges):
+        '''
+            Drop the kept trees that edges added to / removed from the graph affect, so the next call of
+            get_changed_paths_for_hosts computes them again: the trees using a removed edge and the trees
+            an added edge offers a shorter path ( or a new node ) to. The graph must already hold the changes.
+        '''
+        succ = self.graph.succ
+        for source, (dist, pred) in self.trees.items():
+            if any(pred.get(v) == u for (u, v) in removed_edges) or \
+                    any(u in dist and (v not in dist or dist[u] + succ[u][v]['weight'] < dist[v]) for (u, v) in added_edges):
+                del self.trees[source]
+
+
+    def reset(self):
+        '''
+            Drop the trees and paths kept by the incremental mode, so the next call recomputes them from scratch.
+        '''
+        self.trees = {}
+        self.paths = {}
@@ -1,24 +1,48 @@
 #!/usr/bin/python
 
-class Switch:
+from collections import namedtuple
+
+
+# A connection of a switch: port_num = switch's port number / conn_id = connected element id / conn_port = connected element port
+Connection = namedtuple('Connection', ['port_num', 'conn_id', 'conn_port'])
+
+
+class Switch(object):
     '''
         This class Represents a Switch located in a topology.
-        A Switch contais :            
+        A Switch contais :
             - node_id
             - connections
-    '''    
+        and two indexes over the connections to look up ports and neighbors in constant time.
+    '''
+
+    __slots__ = ('node_id', 'connections', 'neighbor_to_port', 'port_to_neighbor')
 
     def __init__(self, node_id):
         self.node_id = node_id      # The switch id ( usually 'openflow:X' )
-        self.connections = []       # A list of the connections ( contains dictionaries {"port_num": X, "conn_id": Y, "conn_port": Z } ) 
-                                    # where : port_num = switch's port number/ con_id = connected element id / con_port = connected element port)
-        
+        self.connections = []       # A list of the connections ( contains Connection tuples )
+        self.neighbor_to_port = {}  # The port where this switch connects with each neighbor (key: conn_id, value: port_num )
+        self.port_to_neighbor = {}  # The neighbor connected at each port (key: port_num, value: conn_id )
+
+
+    def add_connection(self, port_num, conn_id, conn_port):
+        '''
+            Add a connection of this switch's port port_num with element conn_id ( at its port conn_port )
+        '''
+        self.connections.append( Connection(port_num, conn_id, conn_port) )
+        self.neighbor_to_port.setdefault(conn_id, port_num)     # Keep the first port if connected more than once
+        self.port_to_neighbor[port_num] = conn_id
+
+
     def get_port_num(self, node_id):
         '''
             Returns the port where this switch connects with node_id
-        '''        
-        for conn in self.connections:            
-            if conn['conn_id'] == node_id:
-                return conn['port_num']
-        return ''
+        '''
+        return self.neighbor_to_port.get(node_id, '')
+
 
+    def get_neighbor(self, port_num):
+        '''
+            Returns the id of the element connected at port port_num
+        '''
+        return self.port_to_neighbor.get(port_num, '')
@@ -2,10 +2,19 @@ import requests
 from requests.auth import HTTPBasicAuth
 from switch import Switch
 from host import Host
+from routing_engine import RoutingEngine
+from csr_routing_engine import CsrRoutingEngine
+from topology_stream import TopologyStreamParser
 import networkx as nx
-from src.params import info_prints
+from src.params import info_prints, vectorized_weights, routing_backend
 import unicodedata
 
+# NumPy is optional, it is only needed by the vectorized weights
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 
 class Topology:
@@ -18,6 +27,24 @@ class Topology:
         self.pairs_of_hosts = []    # Holds all combinations of hosts (size 2 pairs)        
         self.switches = {}          # A dict of all switches in this topology (key: id , value: SwitchClass )
         self.hosts = {}             # A dict of all hosts in this topology (key: id , value: HostClass )
+        # Computes the shortest paths on self.graph ( see routing_backend in src/params.py )
+        self.routing_engine = CsrRoutingEngine(self.graph) if routing_backend == 'csr' else RoutingEngine(self.graph)
+        self.changed_edges = {}     # The edges whose weight changed since the paths were last updated (key: (u, v), value: old weight )
+        self.removed_paths = []     # The paths of removed hosts, not reported by get_changed_dijkstra_paths yet
+
+        # Integer ids assigned while parsing, so counters and weights can be held in arrays
+        self.node_ids = {}          # (key: node_id, value: id )
+        self.port_ids = {}          # The switch ports (key: (switch_id, port_num), value: id )
+        self.edge_ids = {}          # The edges leaving a switch (key: (switch_id, conn_id), value: id )
+        self.edges = []             # The edges leaving a switch by id, as (switch_id, conn_id) tuples
+        self.edge_port = []         # The port whose weight each edge takes ( the last port connecting the edge's nodes )
+
+        # Vectorized weights (see src/params.py): the arrays are built after parsing
+        self.vectorized = vectorized_weights and np is not None
+        if vectorized_weights and np is None:
+            print '[ERR] NumPy is not installed, the weights will not be vectorized'
+        self.edge_ports = None      # self.edge_port as an array
+        self.edge_weights = None    # The current weight of each edge
     
     # Parses Topology from a json object
     def parse_topology_from_json(self, data):
@@ -36,51 +63,200 @@ class Topology:
         # Find the nodes
         if 'node' in topology:
             for node in topology['node']:
+                self.parse_node(node)
 
-                # If the node is a host then gather usefull info about this host
-                if 'host' in node['node-id']:
-
-                    # Get host's ID, IP and MAC
-                    host_id = node['node-id'].encode('ascii','ignore')
-                    ip  = node['host-tracker-service:addresses'][0]['ip'].encode('ascii','ignore')
-                    mac = node['host-tracker-service:addresses'][0]['mac'].encode('ascii','ignore')                    
-                    self.hosts[host_id] = Host(ip, mac, host_id)                    
-
-                # Else if the node is a switch gather usefull info about this switch
-                else:
-                    # Get switch's id
-                    switch_id = node['node-id'].encode('ascii','ignore')                    
-                    self.switches[switch_id] = Switch(switch_id)
-                
-                # Add this node_id in the graph
-                self.graph.add_node(node['node-id'].encode('ascii','ignore'))
-
-                    
         # Find the links of the graph        
-        # [NOTE : WE USE A DIRECTED GRAPH ]
         if 'link' in topology:
             for link in topology['link']:
+                self.parse_link(link)
+
+        self.finish_parse()
+
+
+    def parse_topology_from_stream(self, chunks):
+        '''
+            Streaming version of parse_topology_from_json: chunks is an iterable with the pieces of the json document
+            as they arrive ( see ApiConnector.stream_topology ). Each node and link is added as soon as it arrives,
+            so the whole document is never held in memory.
+        '''
+        pending_links = []      # The links that arrive before the nodes end ( a link must know if its nodes are hosts )
+        state = {'nodes_done': False}
+
+        def on_element(kind, element):
+            if kind == 'node':
+                if element is not None:
+                    self.parse_node(element)
+                else:
+                    state['nodes_done'] = True
+                    for link in pending_links:
+                        self.parse_link(link)
+                    del pending_links[:]
+            elif element is not None:
+                if state['nodes_done']:
+                    self.parse_link(element)
+                else:
+                    pending_links.append(element)
+
+        parser = TopologyStreamParser(on_element)
+        for chunk in chunks:
+            parser.feed(chunk)
+
+        if not parser.finished:
+            print '[ERR] The topology document ended early'
+        if parser.topologies == 0:
+            print '[ERR] There topology is empty'
+            return
+
+        # A topology without nodes
+        for link in pending_links:
+            self.parse_link(link)
+
+        self.finish_parse()
+
+
+    def parse_node(self, node):
+        '''
+            Add a node of the topology document ( a host or a switch )
+        '''
+        # The ids are interned, each id string is kept once however many switches, links and flows refer to it
+        node_id = intern(node['node-id'].encode('ascii','ignore'))
+
+        # If the node is a host then gather usefull info about this host
+        if 'host' in node_id:
+
+            # Get host's IP and MAC
+            ip  = node['host-tracker-service:addresses'][0]['ip'].encode('ascii','ignore')
+            mac = intern(node['host-tracker-service:addresses'][0]['mac'].encode('ascii','ignore'))
+            self.hosts[node_id] = Host(ip, mac, node_id)                    
+
+        # Else if the node is a switch gather usefull info about this switch
+        else:
+            self.switches[node_id] = Switch(node_id)
+        
+        # Add this node_id in the graph
+        self.graph.add_node(node_id)
+        self.node_ids.setdefault(node_id, len(self.node_ids))
+
+
+    def parse_link(self, link):
+        '''
+            Add a link of the topology document
+            [NOTE : WE USE A DIRECTED GRAPH ]
+        '''
+        # Get source & destination node id
+        src_id = intern(link['source']['source-node'].encode('ascii','ignore'))
+        src_port = link['source']['source-tp'].encode('ascii','ignore')
+
+        dst_id = intern(link['destination']['dest-node'].encode('ascii','ignore'))
+        dst_port = link['destination']['dest-tp'].encode('ascii','ignore')
+
+        # src : update their 'connections' field
+        if (src_id in self.switches):                    
+            port_num = intern(self.switch_port_to_port_num(src_port))
+            self.switches[src_id].add_connection(
+                port_num,
+                dst_id,
+                '' if dst_id in self.hosts else self.switch_port_to_port_num(dst_port)
+            )
+
+            self.number_connection(src_id, port_num, dst_id)
+        
+        # Add an edges in our graph
+        self.graph.add_edge(src_id, dst_id, weight=1)
+        self.graph.add_edge(dst_id, src_id, weight=1)
+
+
+    def number_connection(self, switch_id, port_num, conn_id):
+        '''
+            Number a switch's port and the edge it sends to ( the ids are kept once assigned )
+        '''
+        port_id = self.port_ids.setdefault((switch_id, port_num), len(self.port_ids))
+        edge_id = self.edge_ids.setdefault((switch_id, conn_id), len(self.edges))
+        if edge_id == len(self.edges):
+            self.edges.append( (switch_id, conn_id) )
+            self.edge_port.append(port_id)
+        else:
+            self.edge_port[edge_id] = port_id
 
-                # Get source & destination node id
-                src_id = link['source']['source-node'].encode('ascii','ignore')
-                src_port = link['source']['source-tp'].encode('ascii','ignore')
 
-                dst_id = link['destination']['dest-node'].encode('ascii','ignore')
-                dst_port = link['destination']['dest-tp'].encode('ascii','ignore')
+    def finish_parse(self):
+        '''
+            Build what needs the whole topology, after all the nodes and links were added
+        '''
+        if self.vectorized:
+            self.edge_ports = np.array(self.edge_port, dtype=np.intp)
+            self.edge_weights = np.array([
+                self.graph[u][v]['weight'] if self.graph.has_edge(u, v) else 1      # The edges removed by apply_changes keep their ids
+                    for (u, v) in self.edges
+            ], dtype=float)
+
+
+    def apply_changes(self, new_topology):
+        '''
+            Bring this topology in line with new_topology ( a Topology parsed from a newer document ), touching
+            only what changed: the nodes and edges added / removed, the switches whose connections changed and
+            the hosts that changed. The weights of the edges that were kept are kept, the new edges get weight 1.
+            Only the shortest-path trees and cached host pairs the changes affect are dropped.
+
+            Returns:
+                True if anything changed
+        '''
+        old_edges = set(self.graph.edges())
+        new_edges = set(new_topology.graph.edges())
+        removed_edges = old_edges - new_edges
+        added_edges = new_edges - old_edges
+        removed_nodes = [node_id for node_id in self.graph if node_id not in new_topology.graph]
+        added_nodes = [node_id for node_id in new_topology.graph if node_id not in self.graph]
+
+        changed_switches = [
+            switch for switch_id, switch in new_topology.switches.items()
+                if switch_id not in self.switches or self.switches[switch_id].connections != switch.connections
+        ]
+        changed_hosts = [
+            host for host_id, host in new_topology.hosts.items()
+                if host_id not in self.hosts or self.hosts[host_id].ip != host.ip or self.hosts[host_id].mac != host.mac
+        ]
+
+        if not (removed_edges or added_edges or removed_nodes or added_nodes or changed_switches or changed_hosts):
+            return False
 
-                # src : update their 'connections' field
-                if (src_id in self.switches):                    
-                    self.switches[src_id].connections.append( 
-                        {
-                            'port_num' : self.switch_port_to_port_num(src_port) , 
-                            'conn_id': dst_id, 
-                            'conn_port': '' if dst_id in self.hosts else self.switch_port_to_port_num(dst_port)
-                        }
-                    ) 
-                
-                # Add an edges in our graph
-                self.graph.add_edge(src_id, dst_id, weight=1)
-                self.graph.add_edge(dst_id, src_id, weight=1)
+        if info_prints:
+            print '[INFO] Topology changed'
+            print '  Nodes: +{} -{}'.format(len(added_nodes), len(removed_nodes))
+            print '  Edges: +{} -{}'.format(len(added_edges), len(removed_edges))
+
+        removed_hosts = [node_id for node_id in removed_nodes if node_id in self.hosts]
+
+        # The graph
+        self.graph.remove_nodes_from(removed_nodes)
+        self.graph.remove_edges_from(edge for edge in removed_edges if self.graph.has_edge(*edge))
+        for node_id in added_nodes:
+            self.graph.add_node(node_id)
+            self.node_ids.setdefault(node_id, len(self.node_ids))
+        for (u, v) in added_edges:
+            self.graph.add_edge(u, v, weight=1)
+        for edge in removed_edges:
+            self.changed_edges.pop(edge, None)
+
+        # The switches and hosts
+        for node_id in removed_nodes:
+            self.switches.pop(node_id, None)
+            self.hosts.pop(node_id, None)
+        for switch in changed_switches:
+            self.switches[switch.node_id] = switch
+            for connection in switch.connections:
+                self.number_connection(switch.node_id, connection.port_num, connection.conn_id)
+        for host in changed_hosts:
+            self.hosts[host.node_id] = host
+
+        # Drop the trees, paths and cached pairs the changes affect
+        self.removed_paths.extend(self.routing_engine.remove_hosts(removed_hosts))
+        self.routing_engine.invalidate_trees(removed_edges, added_edges)
+        if removed_hosts or changed_hosts:
+            self.pairs_of_hosts = []
+
+        self.finish_parse()
+        return True
 
 
     def get_host_pairs(self):
@@ -104,18 +280,12 @@ class Topology:
         '''
             Return the dijkstra paths (sortest paths) for each 2 hosts connected in this topology.
 
-            Parameters:
-                weight_function: A function taking 3 arguments as a paramenter ( node_u, node_v, edge_attributes ) 
-                    and returning the cost of the edge connecting node_u with node_v. The default argument is a lambda 
-                    that returns 1 for every edge.
+            One shortest-path tree is computed per source host and the paths to all other hosts are
+            read from it, so we run len(hosts) dijkstras instead of one per host pair. The paths are
+            the same as running nx.dijkstra_path for each pair returned by get_host_pairs (self-pairs excluded).
         '''
 
-        # Find dijkstra path for each host pair        
-        dijkstra_paths = []
-        for pair in self.get_host_pairs():            
-            dijkstra_paths.append(nx.dijkstra_path(self.graph, pair[0], pair[1], weight=lambda u,v,d: d['weight']))
-
-        dijkstra_paths = filter(lambda p: len(p) > 1, dijkstra_paths)
+        dijkstra_paths = self.routing_engine.get_paths_for_hosts(self.hosts.keys())
 
         # if info_prints:
         #     print '\n[INFO] Dijkstra paths:'
@@ -138,16 +308,79 @@ class Topology:
                         }, 
                         ...  
                     }                     
+                Or, with vectorized weights, an array with the weight of each port ( indexed by self.port_ids ).
         '''
 
+        if self.vectorized and isinstance(switch_to_port_to_weight, np.ndarray):
+            return self.update_graph_weights_array(switch_to_port_to_weight)
+
         for switch in self.switches.values():
-            for connection in switch.connections:                
-                # Adding an edge in the graph that already exists updates the edge data
-                self.graph.add_edge(
-                    switch.node_id,          # Get u node from switch
-                    connection['conn_id'],   # Get v node from switch's connection
-                    weight=switch_to_port_to_weight[switch.node_id][connection['port_num']]  # Get wight from the parameter using switch and the connection's port_number
-                )
+            for connection in switch.connections:
+                # Get the edge data from switch to its connection and the new weight using the connection's port_number
+                edge = self.graph[switch.node_id][connection.conn_id]
+                weight = switch_to_port_to_weight[switch.node_id][connection.port_num]
+
+                # Only touch edges whose weight changed and remember their old weight for the incremental routing
+                if edge['weight'] != weight:
+                    self.changed_edges.setdefault((switch.node_id, connection.conn_id), edge['weight'])
+                    edge['weight'] = weight
+                    if self.edge_weights is not None:
+                        self.edge_weights[self.edge_ids[(switch.node_id, connection.conn_id)]] = weight
+
+
+    def update_graph_weights_array(self, port_weights):
+        '''
+            Vectorized version of update_graph_weights. Parameter port_weights is an array with the weight of
+            each port ( indexed by self.port_ids ). The changed edges are found with a single array comparison
+            and only they are written to the graph.
+        '''
+        edge_weights = port_weights[self.edge_ports]
+        for edge_id in np.flatnonzero(edge_weights != self.edge_weights):
+            (u, v) = self.edges[edge_id]
+            if not self.graph.has_edge(u, v):
+                continue        # Removed by apply_changes
+            edge = self.graph[u][v]
+            self.changed_edges.setdefault((u, v), edge['weight'])
+            edge['weight'] = edge_weights[edge_id].item()
+
+        self.edge_weights = edge_weights
+
+
+    def restore_edge_weights(self, edge_weights):
+        '''
+            Set the weights of the edges to the ones saved by a previous run, before any path is computed.
+            Edges that no longer exist are skipped.
+
+            Parameters:
+                edge_weights: A list of ( node_u, node_v, weight ) tuples.
+
+            Returns:
+                The number of weights restored
+        '''
+        restored = 0
+        for (u, v, weight) in edge_weights:
+            if self.graph.has_edge(u, v):
+                self.graph[u][v]['weight'] = weight
+                if self.edge_weights is not None and (u, v) in self.edge_ids:
+                    self.edge_weights[self.edge_ids[(u, v)]] = weight
+                restored += 1
+
+        return restored
+
+
+    def get_changed_dijkstra_paths(self):
+        '''
+            Incremental version of get_dijkstra_paths_for_host_pairs. Only the shortest-path trees affected by the
+            edges whose weight changed since the last call are repaired ( the first call computes all of them ).
+
+            Returns:
+                A list of (old_path, new_path) tuples, one for each host pair whose path changed.
+                old_path / new_path is None if the pair was / is not connected.
+        '''
+        changed_paths = self.removed_paths + self.routing_engine.get_changed_paths_for_hosts(self.hosts.keys(), self.changed_edges)
+        self.changed_edges = {}
+        self.removed_paths = []
+        return changed_paths
 
 
 
@@ -0,0 +1,92 @@
+#!/usr/bin/python
+
+import json
+import re
+
+
+class TopologyStreamParser:
+    '''
+        Parses a network-topology document incrementally, while it arrives, without holding the whole
+        document or its decoded tree in memory:
+
+            {"network-topology": {"topology": [{ ..., "node": [{...}, ...], "link": [{...}, ...] }]}}
+
+        The chunks are fed to a bracket-matching scanner that only keeps track of the open containers.
+        Every element of the "node" and "link" arrays of the first topology is decoded on its own as soon
+        as it has fully arrived and is handed to on_element(kind, element), kind being 'node' or 'link'.
+        The end of each array is reported with on_element(kind, None).
+    '''
+
+    # A string ( group 2 is missing if its end has not arrived yet ) or a bracket
+    token_re = re.compile(r'"([^"\\]*(?:\\.[^"\\]*)*)(")?|[{}\[\]]')
+    # The depth of the node / link lists: root, network-topology, topology list, topology, node / link list
+    list_depth = 5
+
+    def __init__(self, on_element):
+        self.on_element = on_element
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''            # What arrived and was not scanned yet
+        self.stack = []             # The open containers as ( bracket, key ) tuples
+        self.key = None             # The last string seen inside an object ( a container's key is the last string before it )
+        self.topologies = 0         # Number of topologies opened
+        self.finished = False       # True once the document's last bracket arrived
+
+
+    def feed(self, chunk):
+        '''
+            Scan the next chunk of the document
+        '''
+        buffer = self.buffer + chunk
+        stack = self.stack
+        pos = 0
+
+        while True:
+            match = self.token_re.search(buffer, pos)
+            if match is None:
+                pos = len(buffer)
+                break
+
+            token = match.group()
+            if token[0] == '"':
+                if match.group(2) is None:
+                    pos = match.start()
+                    break       # The rest of the string has not arrived yet
+                if stack and stack[-1][0] == '{':
+                    self.key = match.group(1)
+                pos = match.end()
+                continue
+
+            if token == '{' and len(stack) == self.list_depth and self._in_lists():
+                # An element of the node / link lists: the decoder finds its end
+                try:
+                    element, pos = self.decoder.raw_decode(buffer, match.start())
+                except ValueError:
+                    pos = match.start()
+                    break       # The rest of the element has not arrived yet
+                self.on_element(stack[-1][1], element)
+                continue
+
+            pos = match.end()
+            if token == '{' or token == '[':
+                key = self.key if stack and stack[-1][0] == '{' else None
+                stack.append( (token, key) )
+                if len(stack) == 4 and stack[2][1] == 'topology':
+                    self.topologies += 1
+                continue
+
+            # A closing bracket
+            closed = stack.pop()
+            if len(stack) == self.list_depth - 1 and closed[0] == '[' and self._in_lists(closed):
+                self.on_element(closed[1], None)
+            elif not stack:
+                self.finished = True
+
+        self.buffer = buffer[pos:]
+
+
+    def _in_lists(self, container=None):
+        '''
+            Return True if container ( by default the innermost open one ) is the node / link list of the first topology
+        '''
+        (bracket, key) = container if container is not None else self.stack[-1]
+        return bracket == '[' and key in ('node', 'link') and self.stack[2][1] == 'topology' and self.topologies == 1
@@ -6,4 +6,131 @@ server_port = '8181'
 monitor_interval = 1500   
 
 # Debug / Info prints
-info_prints = True
\ No newline at end of file
+info_prints = True
+
+# Incremental routing: keep the shortest-path trees between daemon cycles and repair only the ones
+# affected by the link weights that changed, pushing only the flows that changed
+incremental_routing = False
+
+# Connection pool of the keep-alive http session to the server: max open connections, retries of
+# failed requests and the backoff factor between retries (in seconds)
+pool_size = 32
+http_retries = 3
+http_backoff = 0.1
+
+# Number of threads polling flow statistics concurrently (keep it <= pool_size)
+stats_workers = 16
+
+# Fetch the flow statistics with one request per switch (whole table) instead of one request per flow
+bulk_stats = True
+
+# Number of threads pushing flow changes concurrently and maximum requests in flight per switch
+flow_push_workers = 16
+flow_push_per_switch = 4
+
+# Flow aggregation: compress the port forward flows of each switch into fewer rules, a low priority
+# default route for its busiest port and IPv4 prefix rules (no shorter than aggregate_min_prefix) for
+# groups of hosts behind the same port
+aggregate_flows = False
+aggregate_default_route = True
+aggregate_prefixes = True
+aggregate_min_prefix = 16
+
+# Format of the flow bodies sent to the server ('xml' or 'json') and how many of their constant parts to cache
+flow_body_format = 'xml'
+flow_body_cache_size = 100000
+
+# Collect the flow statistics on a fixed-rate timer thread (every monitor_interval), independent of
+# the path recomputation and flow pushing of the daemon's loop
+scheduled_loop = True
+
+# Route damping: smooth the port weights with an EWMA ( ewma_alpha is the weight of the newest sample ),
+# only reroute a destination if its new paths are cheaper by at least min_improvement ( a fraction of the
+# current paths' cost ) and hold the paths of a destination for hold_down seconds after they move
+route_damping = False
+ewma_alpha = 0.3
+min_improvement = 0.1
+hold_down = 5.0
+
+# Vectorized weights: hold the packet rates and the link weights in NumPy arrays indexed by integer
+# port / edge ids, instead of nested dictionaries ( needs numpy, falls back to the dictionaries without it )
+vectorized_weights = False
+
+# Parallel routing: split the source hosts among path_workers processes when computing all the paths
+# ( only topologies with at least parallel_min_hosts hosts, smaller ones are faster in-process )
+parallel_routing = False
+path_workers = 8
+parallel_min_hosts = 64
+
+# Routing backend: 'networkx' runs dijkstra on the networkx graph, 'csr' on a compact copy of it with
+# integer node ids ( same paths, faster on large topologies )
+routing_backend = 'networkx'
+
+# Parse the topology while it arrives, one node / link at a time, instead of loading the whole json
+# document first ( topology_chunk_size is the size of the chunks read, in bytes )
+stream_topology = True
+topology_chunk_size = 65536
+
+# Reload the topology every topology_refresh_cycles loops of the daemon ( 0 = only on a SIGHUP ) and
+# apply only the nodes / links that changed
+topology_refresh_cycles = 20
+
+# Warm start: keep the flows installed when the daemon exits and save its state ( topology, weights, flows,
+# select groups and routes ) to state_file every state_save_cycles loops and on exit. On start the weights are
+# restored, the flows ( and the groups with multipath ) are reconciled against the controller's config datastore
+# and only the differences are pushed
+warm_start = False
+state_file = 'optimizer_state.json.gz'
+state_save_cycles = 10
+
+# Metrics: time the phases of the daemon's loop, the requests to the server and the path computations and
+# count the flows added / deleted. They are served in the Prometheus text format at
+# http://127.0.0.1:metrics_port/metrics ( 0 = not served ) and / or appended to metrics_file every
+# metrics_file_interval seconds ( None = no file, it is rotated at metrics_file_max_bytes keeping
+# metrics_file_backups old files ). Disabled they cost next to nothing.
+metrics_enabled = False
+metrics_port = 9100
+metrics_file = None
+metrics_file_interval = 10
+metrics_file_max_bytes = 10485760
+metrics_file_backups = 3
+
+# Stats requests that fail ( like a flow not in the operational datastore yet ) are retried up to stats_retries
+# times, waiting a random time of up to stats_backoff * 2 ^ retry seconds ( at most stats_backoff_max ) in
+# between. No request ( or retry ) starts later than stats_deadline seconds after the snapshot started and none
+# waits for the server past it. A flow left without a sample keeps the packet rate of its last sample
+stats_retries = 3
+stats_backoff = 0.05
+stats_backoff_max = 1.0
+stats_deadline = 1.0
+
+# Asynchronous I/O: send the requests to the server from a single event loop over async_connections
+# keep-alive connections ( see AsyncApiConnector ), instead of a pool of threads blocking on each request.
+# Thousands of flow changes / stats requests can then be in flight, queued for a free connection. A request
+# not answered async_timeout seconds after it was issued fails ( and its connection is closed )
+async_io = False
+async_connections = 256
+async_timeout = 30.0
+
+# Forwarding tables: route each destination through a single port of each switch ( see ForwardingTables ), so
+# a destination moving to another port of a switch is pushed as one modification instead of a delete and an add
+forwarding_tables = False
+
+# Flow ids: 'port' names a flow after its switch, destination and output port ( '<mac>_to_<switch_number>:<port>' ),
+# 'destination' after its switch and destination only ( '<mac>_at_<switch_number>' ), so moving a destination to
+# another port is a single PUT overwriting the flow in place. 'destination' needs forwarding_tables ( one port per
+# destination in each switch ). The flows installed with the other scheme are still found and replaced when they move
+flow_id_scheme = 'port'
+
+# Multipath: split the packets to each destination between up to multipath_k next hops in each switch, through an
+# OpenFlow select group per ( switch, destination ). A neighbor is a next hop if its path to the destination is
+# shorter than the switch's own and the path through it costs at most multipath_slack times the shortest one ( 1.0
+# = equal cost paths only ). Each bucket gets a share of the multipath_bucket_total weight inversely proportional
+# to the measured load of its port, a group is only rewritten when a share moves by more than multipath_rebalance.
+# The paths are recomputed in full every cycle ( incremental_routing, route_damping, parallel_routing,
+# forwarding_tables and aggregate_flows don't apply )
+multipath = False
+multipath_k = 4
+multipath_slack = 1.5
+multipath_bucket_total = 100
+multipath_rebalance = 0.1
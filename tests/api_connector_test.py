@@ -0,0 +1,122 @@
+#!/usr/bin/python
+
+'''
+    Checks the keep-alive connection pool and the retries of ApiConnector against the simulator
+    ( tests/odl_simulator.py ), injecting faults into its answers, and that a batch of flow changes
+    ( see FlowManager.apply_flow_changes ) reports the requests that failed instead of stopping:
+
+        python tests/api_connector_test.py
+'''
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import odl_simulator
+from src.components import api_connector
+from src.components.api_connector import ApiConnector
+from src.components.flow_manager import FlowManager
+from src.components.xml_creator import XmlCreator
+from src.params import http_retries
+
+
+switch_id = 'openflow:1'
+requests_count = 40
+
+
+class Faults:
+    '''
+        Injects a fault into the first attempts of the requests of each path ( see OdlSimulator's fault )
+    '''
+
+    def __init__(self, fault, attempts):
+        self.fault = fault
+        self.attempts = attempts        # Number of attempts of each path that fail
+        self.seen = {}
+
+    def __call__(self, method, path):
+        self.seen[path] = self.seen.get(path, 0) + 1
+        return self.fault if self.seen[path] <= self.attempts else None
+
+
+def put_flow(connector, num=0):
+    flow_id = 'flow_{}'.format(num)
+    return connector.put_flow(XmlCreator().crete_port_forward_flow(flow_id, '1', '00:00:00:00:00:01'), switch_id, flow_id)
+
+
+def check_keep_alive(simulator):
+    connector = ApiConnector(simulator.server_ip, simulator.server_port)
+    assert all(put_flow(connector, num) for num in range(requests_count))
+
+    stats = connector.get_pool_stats()
+    assert stats['opened'] == 1
+    assert stats['reused'] == requests_count - 1
+    assert stats['in_flight'] == 0
+
+
+def check_error_statuses(simulator):
+    connector = ApiConnector(simulator.server_ip, simulator.server_port)
+
+    # A 503 is retried till it succeeds
+    simulator.fault = Faults(503, http_retries)
+    assert put_flow(connector)
+    assert simulator.requests == http_retries + 1
+
+    # But not more than http_retries times, the last answer is then a failure
+    simulator.fault = Faults(503, http_retries + 1)
+    simulator.requests = 0
+    assert not put_flow(connector, 1)
+    assert simulator.requests == http_retries + 1
+    assert connector.get_pool_stats()['in_flight'] == 0
+
+    # Other errors are not retried
+    simulator.fault = Faults(400, 1)
+    simulator.requests = 0
+    assert not put_flow(connector, 2)
+    assert simulator.requests == 1
+
+
+def check_batch_failures(simulator):
+    flow_manager = FlowManager(ApiConnector(simulator.server_ip, simulator.server_port), 'port')
+    flows = [(switch_id, '00:00:00:00:00:{:02x}'.format(num), '1') for num in range(1, 7)]
+
+    # The flows of two destinations get a persistent 503, the server never answers the ones of two others
+    def fault(method, path):
+        if method != 'PUT':
+            return None
+        if '00:00:00:00:00:01' in path or '00:00:00:00:00:02' in path:
+            return 503
+        if '00:00:00:00:00:03' in path or '00:00:00:00:00:04' in path:
+            return 'close'
+        return None
+
+    simulator.fault = fault
+    report = flow_manager.apply_flow_changes(flows, [])
+    assert sorted(mac for (_, mac, _) in report[switch_id]['failures']) == [mac for (_, mac, _) in flows[:4]]
+    assert flow_manager.port_forward_flows.installed_flows() == set(flows[4:])
+
+
+checks = [check_keep_alive, check_error_statuses, check_batch_failures]
+
+
+if __name__ == '__main__':
+    api_connector.info_prints = False
+    failures = 0
+    for check in checks:
+        simulator = odl_simulator.OdlSimulator(odl_simulator.ring(2, 1)).start()
+        try:
+            check(simulator)
+        except AssertionError:
+            failures += 1
+            print '[ERR] {} failed'.format(check.__name__)
+        finally:
+            simulator.stop()
+        print '[INFO] {} checked'.format(check.__name__)
+
+    if failures > 0:
+        print '[ERR] {} checks failed'.format(failures)
+        sys.exit(1)
+
+    print '[INFO] The connector reuses its connection, retries and reports its failures'
+    os._exit(0)     # Don't wait for the threads of the flow manager
@@ -0,0 +1,145 @@
+#!/usr/bin/python
+
+'''
+    Checks the keep-alive connections, the retries and the timeouts of AsyncApiConnector against the simulator
+    ( tests/odl_simulator.py ), injecting faults into its answers:
+
+        python tests/async_connector_test.py
+'''
+
+import os
+import sys
+from time import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import odl_simulator
+from src.components import api_connector
+from src.components.async_connector import AsyncApiConnector
+from src.components.event_loop import Future
+from src.components.xml_creator import XmlCreator
+
+
+switch_id = 'openflow:1'
+requests_count = 40
+
+
+class Faults:
+    '''
+        Injects a fault into the first attempts of the requests of each path ( see OdlSimulator's fault )
+    '''
+
+    def __init__(self, fault, attempts):
+        self.fault = fault
+        self.attempts = attempts        # Number of attempts of each path that fail
+        self.seen = {}
+
+    def __call__(self, method, path):
+        self.seen[path] = self.seen.get(path, 0) + 1
+        return self.fault if self.seen[path] <= self.attempts else None
+
+
+def put_flows(connector, count=requests_count):
+    '''
+        Put count flows at once and return the list of their results
+    '''
+    xml_creator = XmlCreator()
+    futures = []
+    for num in range(count):
+        flow_id = 'flow_{}'.format(num)
+        futures.append(connector.put_flow_async(xml_creator.crete_port_forward_flow(flow_id, '1', '00:00:00:00:00:01'), switch_id, flow_id))
+    return Future.gather(futures).result()
+
+
+def check_keep_alive(simulator):
+    connector = AsyncApiConnector(simulator.server_ip, simulator.server_port, max_connections=4)
+    assert put_flows(connector) == [True] * requests_count
+
+    stats = connector.get_pool_stats()
+    assert stats['opened'] <= 4
+    assert stats['reused'] >= requests_count - 4
+    assert stats['in_flight'] == 0
+    assert simulator.requests == requests_count
+
+    # The synchronous methods go through the same connections
+    assert connector.get_flow(switch_id, 'flow_0') is not None
+    assert connector.get_pool_stats()['opened'] <= 4
+    connector.close()
+
+
+def check_closed_connections(simulator):
+    # Every connection is closed by the server after its first answer, without announcing it
+    simulator.fault = Faults('last', 1)
+    connector = AsyncApiConnector(simulator.server_ip, simulator.server_port, max_connections=4)
+    assert put_flows(connector) == [True] * requests_count
+    connector.close()
+
+    # The server closes the connection without answering the first attempt of every request
+    simulator.fault = Faults('close', 1)
+    connector = AsyncApiConnector(simulator.server_ip, simulator.server_port, max_connections=4, backoff=0.01)
+    assert put_flows(connector) == [True] * requests_count
+    assert connector.get_pool_stats()['in_flight'] == 0
+    connector.close()
+
+
+def check_error_statuses(simulator):
+    # A 503 is retried till it succeeds
+    simulator.fault = Faults(503, 2)
+    connector = AsyncApiConnector(simulator.server_ip, simulator.server_port, retries=3, backoff=0.01)
+    assert put_flows(connector) == [True] * requests_count
+    assert simulator.requests == 3 * requests_count
+
+    # But not more than retries times
+    simulator.fault = Faults(503, 10)
+    simulator.requests = 0
+    assert put_flows(connector, 1) == [False]
+    assert simulator.requests == 4
+
+    # Other errors are not retried
+    simulator.fault = Faults(400, 1)
+    simulator.requests = 0
+    assert put_flows(connector, 1) == [False]
+    assert simulator.requests == 1
+    connector.close()
+
+
+def check_timeouts(simulator):
+    connector = AsyncApiConnector(simulator.server_ip, simulator.server_port, max_connections=1, timeout=0.3)
+    assert put_flows(connector, 1) == [True]
+
+    # The request not answered in time fails and its connection is closed, the next request gets a new one
+    simulator.latency = 2.0
+    started = time()
+    assert connector.get_flow_async(switch_id, 'flow_0').result() is None
+    assert time() - started < 1.0
+
+    simulator.latency = 0.0
+    assert connector.get_flow_async(switch_id, 'flow_0', timeout=5.0).result() is not None
+    stats = connector.get_pool_stats()
+    assert stats['opened'] == 2
+    assert stats['in_flight'] == 0
+    connector.close()
+
+
+checks = [check_keep_alive, check_closed_connections, check_error_statuses, check_timeouts]
+
+
+if __name__ == '__main__':
+    api_connector.info_prints = False
+    failures = 0
+    for check in checks:
+        simulator = odl_simulator.OdlSimulator(odl_simulator.ring(2, 1)).start()
+        try:
+            check(simulator)
+        except AssertionError:
+            failures += 1
+            print '[ERR] {} failed'.format(check.__name__)
+        finally:
+            simulator.stop()
+        print '[INFO] {} checked'.format(check.__name__)
+
+    if failures > 0:
+        print '[ERR] {} checks failed'.format(failures)
+        sys.exit(1)
+
+    print '[INFO] The asynchronous connector reuses its connections, retries and times out'
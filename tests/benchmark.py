@@ -0,0 +1,90 @@
+#!/usr/bin/python
+
+'''
+    Times the phases of the optimizer against the ODL simulator ( tests/odl_simulator.py ) for
+    topologies of growing size, without Mininet or a controller:
+
+        python tests/benchmark.py --topology leaf-spine --sizes 2,4,8 --latency 0.001
+'''
+
+import argparse
+import os
+import sys
+from time import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import odl_simulator
+from src.components import api_connector, optimizer
+from src.components.api_connector import ApiConnector
+from src.components.optimizer import NetworkOptimizer
+
+
+# The topology of each size ( size is the generator's main parameter )
+topologies = {
+    'fat-tree': lambda size: odl_simulator.fat_tree(size),
+    'leaf-spine': lambda size: odl_simulator.leaf_spine(size, max(2, size // 2), 4),
+    'ring': lambda size: odl_simulator.ring(size, 2),
+    'random': lambda size: odl_simulator.random_topology(size, 2 * size, degree=3, seed=size),
+}
+
+
+def timed(function, *args):
+    started = time()
+    result = function(*args)
+    return result, time() - started
+
+
+def run(topology, latency, interval):
+    '''
+        Run each phase once against a fresh simulator and return the phase timings (in seconds).
+    '''
+    simulator = odl_simulator.OdlSimulator(topology, latency=latency).start()
+    try:
+        n_opt = NetworkOptimizer(ApiConnector(simulator.server_ip, simulator.server_port))
+        timings = {}
+
+        _, timings['load_topology'] = timed(n_opt.load_topology)
+        flows, timings['gen_optimized_flows'] = timed(n_opt.gen_optimized_flows)
+
+        # Install the flows ( update_flows from an empty network )
+        _, timings['install_flows'] = timed(n_opt.update_flows, flows, n_opt.gen_empty_flows())
+
+        # Measure the traffic; the monitor interval is not part of the polling time
+        weights, elapsed = timed(n_opt.calculate_weights, flows)
+        timings['calculate_weights'] = elapsed - interval / 1000.0
+
+        # Reroute with the new weights
+        n_opt.topology.update_graph_weights(weights)
+        new_flows, timings['recompute_flows'] = timed(n_opt.gen_optimized_flows)
+        _, timings['update_flows'] = timed(n_opt.update_flows, new_flows, flows)
+
+        timings['flows'] = sum(len(macs_set) for ports in new_flows.values() for macs_set in ports.values())
+        timings['switches'] = len(n_opt.topology.switches)
+        timings['hosts'] = len(n_opt.topology.hosts)
+
+        n_opt.flow_manager.delete_all_flows()
+        return timings
+    finally:
+        simulator.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the optimizer phases against the ODL simulator')
+    parser.add_argument('--topology', choices=sorted(topologies.keys()), default='leaf-spine')
+    parser.add_argument('--sizes', default='2,4,8', help='Comma separated sizes of the topology')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds each request is delayed by the simulator')
+    parser.add_argument('--interval', type=int, default=100, help='Monitor interval in milliseconds')
+    args = parser.parse_args()
+
+    # The benchmark measures the optimizer, not the per flow prints or the configured monitor interval
+    api_connector.info_prints = False
+    optimizer.info_prints = False
+    optimizer.monitor_interval = args.interval
+
+    phases = ['load_topology', 'gen_optimized_flows', 'install_flows', 'calculate_weights', 'recompute_flows', 'update_flows']
+    print '{:>6} {:>9} {:>6} {:>7}'.format('size', 'switches', 'hosts', 'flows') + ''.join(' {:>20}'.format(phase) for phase in phases)
+    for size in [int(size) for size in args.sizes.split(',')]:
+        timings = run(topologies[args.topology](size), args.latency, args.interval)
+        print '{:>6} {:>9} {:>6} {:>7}'.format(size, timings['switches'], timings['hosts'], timings['flows']) + \
+            ''.join(' {:>20.4f}'.format(timings[phase]) for phase in phases)
@@ -0,0 +1,129 @@
+#!/usr/bin/python
+
+'''
+    Checks that the flow changes pushed by FlowManager leave every flow with its rule in the switches: a switch
+    keeps a single rule per ( match, priority ), so a flow added next to another flow to the same destination
+    must not replace it and deleting the old one must not delete the new one ( see odl_simulator.broken_flows ).
+    Runs against the simulator ( tests/odl_simulator.py ), with the blocking and the asynchronous connector:
+
+        python tests/flow_push_test.py
+'''
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import odl_simulator
+from src.components import api_connector, optimizer
+from src.components.api_connector import ApiConnector
+from src.components.async_connector import AsyncApiConnector
+from src.components.flow_manager import FlowManager
+from src.objects import topology
+
+
+switch_ids = ['openflow:{}'.format(num) for num in range(1, 5)]
+macs = ['00:00:00:00:00:{:02x}'.format(num) for num in range(1, 7)] + ['10.0.0.0/24', 'default']
+
+
+def check_installed(simulator, flow_manager):
+    '''
+        The registry lists the flows of the simulator and all of them have their rule
+    '''
+    registered = set( (flow.switch_id, flow.flow_id) for flow in flow_manager.port_forward_flows )
+    assert registered == set( (switch_id, flow_id) for (switch_id, _, flow_id) in simulator.flows )
+    assert simulator.broken_flows() == []
+
+
+def check_reroutes(simulator, connector_class):
+    '''
+        Move every destination between ports with batches adding the new flows before deleting the old ones
+    '''
+    flow_manager = FlowManager(connector_class(simulator.server_ip, simulator.server_port), 'port')
+    flows = [(switch_id, mac, '1') for switch_id in switch_ids for mac in macs]
+    flow_manager.apply_flow_changes(flows, [])
+    check_installed(simulator, flow_manager)
+
+    for port_num in ['2', '3', '1']:
+        new_flows = [(switch_id, mac, port_num) for (switch_id, mac, _) in flows]
+        report = flow_manager.apply_flow_changes(new_flows, flows)
+        assert all(len(switch_report['failures']) == 0 for switch_report in report.values())
+        check_installed(simulator, flow_manager)
+        assert flow_manager.port_forward_flows.installed_flows() == set(new_flows)
+        flows = new_flows
+
+    flow_manager.delete_all_flows()
+    assert len(simulator.flows) == 0
+
+
+def check_modifies(simulator, connector_class):
+    '''
+        Move every destination between ports with batches of modifies ( see modify_port_forward_flow ), under both id schemes
+    '''
+    for id_scheme in ['port', 'destination']:
+        flow_manager = FlowManager(connector_class(simulator.server_ip, simulator.server_port), id_scheme)
+        flows = [(switch_id, mac, '1') for switch_id in switch_ids for mac in macs]
+        flow_manager.apply_flow_changes(flows, [])
+
+        for port_num in ['2', '3', '1']:
+            modify_flows = [(switch_id, mac, old_port, port_num) for (switch_id, mac, old_port) in flows]
+            report = flow_manager.apply_flow_changes([], [], modify_flows=modify_flows)
+            assert all(len(switch_report['failures']) == 0 for switch_report in report.values())
+            flows = [(switch_id, mac, port_num) for (switch_id, mac, _) in flows]
+            check_installed(simulator, flow_manager)
+            assert flow_manager.port_forward_flows.installed_flows() == set(flows)
+
+        flow_manager.delete_all_flows()
+        assert len(simulator.flows) == 0
+
+
+def check_migration(simulator, connector_class):
+    '''
+        Reconcile the flows installed under the 'port' scheme into the 'destination' one ( see
+        NetworkOptimizer.reconcile_flows ): every destination gets a flow with its new id, replacing the old one
+    '''
+    connector = connector_class(simulator.server_ip, simulator.server_port)
+    flow_manager = FlowManager(connector, 'port')
+    flows = [(switch_id, mac, '1') for switch_id in switch_ids for mac in macs]
+    flow_manager.apply_flow_changes(flows, [])
+
+    # Half of the destinations moved since, their flows have the alternate priority
+    flow_manager.apply_flow_changes([], [], modify_flows=[(switch_id, mac, '1', '2') for (switch_id, mac, _) in flows[::2]])
+
+    network_optimizer = optimizer.NetworkOptimizer(connector)
+    network_optimizer.load_topology()
+    network_optimizer.flow_manager = FlowManager(connector, 'destination')
+    network_optimizer.reconcile_flows({switch_id: {'3': set(macs)} for switch_id in switch_ids})
+
+    check_installed(simulator, network_optimizer.flow_manager)
+    assert network_optimizer.flow_manager.port_forward_flows.installed_flows() == set( (switch_id, mac, '3') for (switch_id, mac, _) in flows )
+    assert all('_at_' in flow_id for (_, _, flow_id) in simulator.flows)
+
+
+checks = [check_reroutes, check_modifies, check_migration]
+
+
+if __name__ == '__main__':
+    api_connector.info_prints = False
+    optimizer.info_prints = False
+    topology.info_prints = False
+    failures = 0
+    for connector_class in [ApiConnector, AsyncApiConnector]:
+        for check in checks:
+            simulator = odl_simulator.OdlSimulator(odl_simulator.ring(4, 1)).start()
+            try:
+                check(simulator, connector_class)
+            except AssertionError:
+                failures += 1
+                print '[ERR] {} failed with the {}'.format(check.__name__, connector_class.__name__)
+            finally:
+                simulator.stop()
+
+        print '[INFO] {} checked'.format(connector_class.__name__)
+
+    if failures > 0:
+        print '[ERR] {} checks failed'.format(failures)
+        sys.exit(1)
+
+    print '[INFO] All flow changes keep the rules of the installed flows'
+    os._exit(0)     # Don't wait for the threads of the connectors
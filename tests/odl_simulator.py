@@ -0,0 +1,482 @@
+#!/usr/bin/python
+
+'''
+    An in-process fake of the OpenDaylight RESTCONF endpoints used by ApiConnector, so the optimizer
+    can be run and measured without Mininet, Open vSwitch or a live controller:
+
+        GET     /restconf/operational/network-topology:network-topology
+        GET     /restconf/{config|operational}/opendaylight-inventory:nodes/node/{switch}/flow-node-inventory:table/{table}
+        GET/PUT/DELETE  /restconf/{config|operational}/opendaylight-inventory:nodes/node/{switch}/flow-node-inventory:table/{table}/flow/{flow}
+        GET/PUT/DELETE  /restconf/{config|operational}/opendaylight-inventory:nodes/node/{switch}/flow-node-inventory:group/{group}
+        GET     /restconf/{config|operational}/opendaylight-inventory:nodes/node/{switch}
+
+    The config datastore returns the flows and groups as they were written ( their priority, actions, name and
+    buckets ), the operational one with their statistics instead.
+
+    The topology is a synthetic network-topology document ( see fat_tree, leaf_spine, ring, random_topology ),
+    each installed flow reports a synthetic packet counter growing at a configurable rate ( the rate of a
+    group is shared between its buckets by weight ), and every request can be delayed by a configurable latency.
+
+    Like a switch, the simulator keeps a single rule per ( match, priority ) of a table: adding a flow with the
+    match and priority of another flow replaces that flow's rule, and deleting a flow deletes the rule with its
+    match and priority, whichever flow installed it. broken_flows lists the flows left without their rule.
+'''
+
+import BaseHTTPServer
+import SocketServer
+import json
+import random
+import re
+import socket
+import threading
+import urllib
+from time import sleep, time
+
+
+class TopologyBuilder:
+    '''
+        Builds a network-topology document formated like the one the ODL server returns.
+    '''
+
+    def __init__(self):
+        self.nodes = []
+        self.links = []
+        self.ports = {}         # The last port number used in each switch
+        self.hosts_count = 0
+
+    def add_switch(self):
+        switch_id = 'openflow:{}'.format(len(self.ports) + 1)
+        self.ports[switch_id] = 0
+        self.nodes.append({'node-id': switch_id})
+        return switch_id
+
+    def add_host(self, switch_id):
+        self.hosts_count += 1
+        num = self.hosts_count
+        mac = '00:00:{:02x}:{:02x}:{:02x}:{:02x}'.format((num >> 24) & 0xFF, (num >> 16) & 0xFF, (num >> 8) & 0xFF, num & 0xFF)
+        ip = '10.{}.{}.{}'.format((num >> 16) & 0xFF, (num >> 8) & 0xFF, num & 0xFF)
+        host_id = 'host:' + mac
+        self.nodes.append({
+            'node-id': host_id,
+            'host-tracker-service:addresses': [{'id': num, 'mac': mac, 'ip': ip}],
+            'termination-point': [{'tp-id': host_id}]
+        })
+        self.add_link(switch_id, host_id)
+        return host_id
+
+    def _tp(self, node_id):
+        if node_id not in self.ports:
+            return node_id      # A host has a single termination point named after it
+        self.ports[node_id] += 1
+        return '{}:{}'.format(node_id, self.ports[node_id])
+
+    def add_link(self, node_a, node_b):
+        tp_a = self._tp(node_a)
+        tp_b = self._tp(node_b)
+        for (src, src_tp, dst, dst_tp) in [(node_a, tp_a, node_b, tp_b), (node_b, tp_b, node_a, tp_a)]:
+            self.links.append({
+                'link-id': src_tp,
+                'source': {'source-node': src, 'source-tp': src_tp},
+                'destination': {'dest-node': dst, 'dest-tp': dst_tp}
+            })
+
+    def to_json(self):
+        return {'network-topology': {'topology': [{'topology-id': 'flow:1', 'node': self.nodes, 'link': self.links}]}}
+
+
+def fat_tree(k, hosts_per_edge=None):
+    '''
+        A k-ary fat-tree: (k/2)^2 core switches and k pods of k/2 aggregation and k/2 edge switches.
+        Each edge switch connects hosts_per_edge hosts ( k/2 by default ).
+    '''
+    half = k // 2
+    builder = TopologyBuilder()
+    cores = [builder.add_switch() for _ in range(half * half)]
+    for _ in range(k):
+        aggregations = [builder.add_switch() for _ in range(half)]
+        edges = [builder.add_switch() for _ in range(half)]
+        for idx, aggregation in enumerate(aggregations):
+            for core in cores[idx * half:(idx + 1) * half]:
+                builder.add_link(aggregation, core)
+            for edge in edges:
+                builder.add_link(edge, aggregation)
+        for edge in edges:
+            for _ in range(half if hosts_per_edge is None else hosts_per_edge):
+                builder.add_host(edge)
+    return builder.to_json()
+
+
+def leaf_spine(leaves, spines, hosts_per_leaf):
+    '''
+        Every leaf switch connects to every spine switch and to hosts_per_leaf hosts.
+    '''
+    builder = TopologyBuilder()
+    spine_ids = [builder.add_switch() for _ in range(spines)]
+    for _ in range(leaves):
+        leaf = builder.add_switch()
+        for spine in spine_ids:
+            builder.add_link(leaf, spine)
+        for _ in range(hosts_per_leaf):
+            builder.add_host(leaf)
+    return builder.to_json()
+
+
+def ring(switches, hosts_per_switch):
+    '''
+        Switches connected in a ring, each one with hosts_per_switch hosts.
+    '''
+    builder = TopologyBuilder()
+    switch_ids = [builder.add_switch() for _ in range(switches)]
+    for idx in range(switches):
+        if switches > 1 and (switches > 2 or idx == 0):
+            builder.add_link(switch_ids[idx], switch_ids[(idx + 1) % switches])
+        for _ in range(hosts_per_switch):
+            builder.add_host(switch_ids[idx])
+    return builder.to_json()
+
+
+def random_topology(switches, hosts, degree=3, seed=0):
+    '''
+        A connected random topology: a random spanning tree plus random links until the average
+        switch degree reaches degree. The hosts are attached to random switches.
+    '''
+    rnd = random.Random(seed)
+    builder = TopologyBuilder()
+    switch_ids = [builder.add_switch() for _ in range(switches)]
+    linked = set()
+    for idx in range(1, switches):
+        other = switch_ids[rnd.randrange(idx)]
+        builder.add_link(switch_ids[idx], other)
+        linked.add(frozenset([switch_ids[idx], other]))
+
+    extra = max(0, switches * degree // 2 - (switches - 1))
+    max_links = switches * (switches - 1) // 2
+    while extra > 0 and len(linked) < max_links:
+        pair = frozenset(rnd.sample(switch_ids, 2))
+        if pair not in linked:
+            linked.add(pair)
+            builder.add_link(*pair)
+            extra -= 1
+
+    for _ in range(hosts):
+        builder.add_host(rnd.choice(switch_ids))
+    return builder.to_json()
+
+
+class OdlSimulator:
+    '''
+        Serves a topology and the flows pushed to it over http, in a background thread.
+
+        Parameters:
+            topology: A network-topology document ( see the generators above ).
+            latency: Seconds every request is delayed by, or a function returning them.
+            packet_rate: The packets per second counted by every installed flow, or a function
+                ( switch_id, flow_id ) returning them. By default every flow gets a random rate.
+            fault: A function ( method, path ) called for every request, to inject faults: it returns None to
+                serve the request, an http status to answer with instead, 'close' to close the connection
+                without answering or 'last' to serve the request and close the connection afterwards ( without
+                announcing it, like a server closing an idle keep-alive connection ).
+    '''
+
+    flow_re = re.compile(r'^/restconf/(config|operational)/opendaylight-inventory:nodes/node/([^/]+)/flow-node-inventory:table/([^/]+)(?:/flow/([^/]+))?$')
+    group_re = re.compile(r'^/restconf/(config|operational)/opendaylight-inventory:nodes/node/([^/]+)/flow-node-inventory:group/([^/]+)$')
+    node_re = re.compile(r'^/restconf/(config|operational)/opendaylight-inventory:nodes/node/([^/]+)$')
+    bucket_re = re.compile(r'<bucket-id>(\d+)</bucket-id><weight>(\d+)</weight>')
+    priority_re = re.compile(r'<priority>(\d+)</priority>')
+    match_re = re.compile(r'<match>(.*)</match>')
+    output_re = re.compile(r'<output-node-connector>([^<]+)</output-node-connector>')
+    group_action_re = re.compile(r'<group-action><group-id>(\d+)</group-id></group-action>')
+    group_name_re = re.compile(r'<group-name>([^<]*)</group-name>')
+    bucket_body_re = re.compile(r'<bucket>(.*?)</bucket>')
+    topology_path = '/restconf/operational/network-topology:network-topology'
+
+    def __init__(self, topology, latency=0.0, packet_rate=None, host='127.0.0.1', port=0, seed=0, fault=None):
+        self.topology = topology
+        self.latency = latency
+        self.fault = fault
+        self.rnd = random.Random(seed)
+        self.packet_rate = packet_rate if packet_rate is not None else (lambda switch_id, flow_id: self.rnd.uniform(0, 1000))
+        self.flows = {}         # The installed flows (key: (switch_id, table_id, flow_id), value: (body, installed_at, rate) )
+        self.groups = {}        # The installed groups (key: (switch_id, group_id), value: (body, rate, {bucket_id: [packets, since, bucket_rate]}) )
+        self.rules = {}         # The rules of the switches' tables (key: (switch_id, table_id, match, priority), value: the flow_id that installed it )
+        self.lock = threading.Lock()
+        self.requests = 0       # Number of requests served
+
+        simulator = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'       # Keep-alive connections
+
+            def setup(self):
+                BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+                # Headers and body are written separately, don't let nagle delay the answer
+                self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def do_GET(self):
+                simulator._handle(self, 'GET')
+
+            def do_PUT(self):
+                simulator._handle(self, 'PUT')
+
+            def do_DELETE(self):
+                simulator._handle(self, 'DELETE')
+
+            def log_message(self, format, *args):
+                pass
+
+        class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+            daemon_threads = True
+            request_queue_size = 1024           # Many pooled connections are opened at once
+
+        self.server = Server((host, port), Handler)
+        self.thread = None
+
+    @property
+    def server_ip(self):
+        return self.server.server_address[0]
+
+    @property
+    def server_port(self):
+        return str(self.server.server_address[1])
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+    def broken_flows(self):
+        '''
+            Return a sorted list with the ( switch_id, flow_id ) of the flows whose rule was replaced or deleted
+            by another flow with the same match and priority
+        '''
+        with self.lock:
+            return sorted(
+                (switch_id, flow_id) for (switch_id, table_id, flow_id), (body, _, _) in self.flows.items()
+                    if self.rules.get((switch_id, table_id) + self._rule_key(body)) != flow_id
+            )
+
+    def _rule_key(self, body):
+        '''
+            Return the ( match, priority ) of a flow body ( xml or json )
+        '''
+        if body.lstrip().startswith('{'):
+            flow = json.loads(body)['flow-node-inventory:flow'][0]
+            return (json.dumps(flow.get('match'), sort_keys=True), int(flow.get('priority', 0)))
+        match = self.match_re.search(body)
+        priority = self.priority_re.search(body)
+        return (match.group(1) if match else '', int(priority.group(1)) if priority else 0)
+
+    def packet_count(self, installed_at, rate):
+        return int((time() - installed_at) * rate)
+
+    def _flow_json(self, flow_id, installed_at, rate, operational, body):
+        flow = {'id': flow_id, 'table_id': 0}
+        if operational:
+            packets = self.packet_count(installed_at, rate)
+            flow['opendaylight-flow-statistics:flow-statistics'] = {'packet-count': packets, 'byte-count': packets * 1000}
+        else:
+            flow.update(self._config_fields(body))
+        return flow
+
+    def _config_fields(self, body):
+        '''
+            Return the priority and the action ( output or group ) of a flow body ( xml or json ), as the config
+            datastore returns them
+        '''
+        if body.lstrip().startswith('{'):
+            flow = json.loads(body)['flow-node-inventory:flow'][0]
+            return {name: flow[name] for name in ('priority', 'instructions') if name in flow}
+
+        fields = {}
+        priority = self.priority_re.search(body)
+        if priority:
+            fields['priority'] = int(priority.group(1))
+        output = self.output_re.search(body)
+        group = self.group_action_re.search(body)
+        action = None
+        if output:
+            action = {'order': 0, 'output-action': {'output-node-connector': output.group(1)}}
+        elif group:
+            action = {'order': 0, 'group-action': {'group-id': int(group.group(1))}}
+        if action is not None:
+            fields['instructions'] = {'instruction': [{'order': 0, 'apply-actions': {'action': [action]}}]}
+        return fields
+
+    def _group_json(self, group_id, buckets, operational, body):
+        group = {'group-id': int(group_id), 'group-type': 'group-select'}
+        if not operational:
+            group.update(self._group_config_fields(body))
+        else:
+            now = time()
+            counters = [
+                {'bucket-id': bucket_id, 'packet-count': int(packets + (now - since) * rate), 'byte-count': int(packets + (now - since) * rate) * 1000}
+                    for bucket_id, (packets, since, rate) in sorted(buckets.items())
+            ]
+            group['opendaylight-group-statistics:group-statistics'] = {
+                'group-id': int(group_id),
+                'packet-count': sum(counter['packet-count'] for counter in counters),
+                'buckets': {'bucket-counter': counters}
+            }
+        return group
+
+    def _group_config_fields(self, body):
+        '''
+            Return the name and the buckets ( with their weight and output port ) of a group body ( xml or json ),
+            as the config datastore returns them
+        '''
+        if body.lstrip().startswith('{'):
+            group = json.loads(body)['flow-node-inventory:group'][0]
+            return {name: group[name] for name in ('group-name', 'buckets') if name in group}
+
+        buckets = []
+        for bucket_body in self.bucket_body_re.findall(body):
+            (bucket_id, weight) = self.bucket_re.search(bucket_body).groups()
+            bucket = {'bucket-id': int(bucket_id), 'weight': int(weight)}
+            output = self.output_re.search(bucket_body)
+            if output:
+                bucket['action'] = [{'order': 0, 'output-action': {'output-node-connector': output.group(1)}}]
+            buckets.append(bucket)
+        name = self.group_name_re.search(body)
+        return {'group-name': name.group(1) if name else '', 'buckets': {'bucket': buckets}}
+
+    def _parse_buckets(self, body):
+        '''
+            Return the { bucket_id: weight } of a group body ( xml or json )
+        '''
+        if body.lstrip().startswith('{'):
+            group = json.loads(body)['flow-node-inventory:group'][0]
+            return {int(bucket['bucket-id']): int(bucket.get('weight', 1)) for bucket in group['buckets']['bucket']}
+        return {int(bucket_id): int(weight) for (bucket_id, weight) in self.bucket_re.findall(body)}
+
+    def _handle_group(self, request, method, body, datastore, switch_id, group_id):
+        key = (switch_id, group_id)
+        if method == 'PUT':
+            weights = self._parse_buckets(body)
+            total = float(sum(weights.values())) or 1.0
+            now = time()
+            with self.lock:
+                existed = key in self.groups
+                if existed:
+                    (_, rate, buckets) = self.groups[key]       # Replacing a group keeps the counters of its buckets
+                else:
+                    (rate, buckets) = (self.packet_rate(switch_id, 'group:' + group_id), {})
+                new_buckets = {}
+                for bucket_id, weight in weights.items():
+                    (packets, since, old_rate) = buckets.get(bucket_id, (0, now, 0.0))
+                    new_buckets[bucket_id] = [packets + (now - since) * old_rate, now, rate * weight / total]
+                self.groups[key] = (body, rate, new_buckets)
+            return self._reply(request, 200 if existed else 201, None)
+
+        with self.lock:
+            group = self.groups.get(key)
+            if group is not None and method == 'DELETE':
+                del self.groups[key]
+
+        if group is None:
+            return self._reply(request, 404, {'errors': {'error': [{'error-tag': 'data-missing'}]}})
+        if method == 'DELETE':
+            return self._reply(request, 200, None)
+        return self._reply(request, 200, {'flow-node-inventory:group': [self._group_json(group_id, group[2], datastore == 'operational', group[0])]})
+
+    def _handle_node(self, request, datastore, switch_id):
+        operational = datastore == 'operational'
+        with self.lock:
+            flows = [(key[1], key[2], value) for key, value in self.flows.items() if key[0] == switch_id]
+            groups = [(key[1], value[0], value[2]) for key, value in self.groups.items() if key[0] == switch_id]
+        tables = {}
+        for (table_id, flow_id, (body, installed_at, rate)) in flows:
+            tables.setdefault(table_id, []).append(self._flow_json(flow_id, installed_at, rate, operational, body))
+        node = {
+            'id': switch_id,
+            'flow-node-inventory:table': [{'id': int(table_id), 'flow': table_flows} for table_id, table_flows in tables.items()],
+            'flow-node-inventory:group': [self._group_json(group_id, buckets, operational, body) for (group_id, body, buckets) in groups]
+        }
+        return self._reply(request, 200, {'node': [node]})
+
+    def _handle(self, request, method):
+        with self.lock:
+            self.requests += 1
+        latency = self.latency() if callable(self.latency) else self.latency
+        if latency > 0:
+            sleep(latency)
+
+        body = None
+        if 'Content-Length' in request.headers:
+            body = request.rfile.read(int(request.headers['Content-Length']))
+
+        path = urllib.unquote(request.path)
+        fault = self.fault(method, path) if self.fault is not None else None
+        if fault in ('close', 'last'):
+            request.close_connection = 1
+            if fault == 'close':
+                return
+        elif fault is not None:
+            return self._reply(request, fault, {'errors': {'error': [{'error-message': 'Injected fault'}]}})
+        if method == 'GET' and path == self.topology_path:
+            return self._reply(request, 200, self.topology)
+
+        match = self.node_re.match(path)
+        if match is not None and method == 'GET':
+            return self._handle_node(request, *match.groups())
+
+        match = self.group_re.match(path)
+        if match is not None:
+            return self._handle_group(request, method, body, *match.groups())
+
+        match = self.flow_re.match(path)
+        if match is None:
+            return self._reply(request, 404, {'errors': {'error': [{'error-message': 'Unknown path ' + path}]}})
+
+        (datastore, switch_id, table_id, flow_id) = match.groups()
+        operational = datastore == 'operational'
+
+        if flow_id is None:
+            if method != 'GET':
+                return self._reply(request, 405, None)
+            with self.lock:
+                flows = [(key[2], value) for key, value in self.flows.items() if key[0] == switch_id and key[1] == table_id]
+            table = {'id': int(table_id), 'flow': [self._flow_json(fid, installed_at, rate, operational, body) for (fid, (body, installed_at, rate)) in flows]}
+            return self._reply(request, 200, {'flow-node-inventory:table': [table]})
+
+        key = (switch_id, table_id, flow_id)
+        if method == 'PUT':
+            rule = (switch_id, table_id) + self._rule_key(body)
+            with self.lock:
+                existed = key in self.flows
+                if existed:
+                    (old_body, installed_at, rate) = self.flows[key]       # Replacing a flow keeps its counters
+                    old_rule = (switch_id, table_id) + self._rule_key(old_body)
+                    if old_rule != rule and self.rules.get(old_rule) == flow_id:
+                        del self.rules[old_rule]
+                else:
+                    (installed_at, rate) = (time(), self.packet_rate(switch_id, flow_id))
+                self.flows[key] = (body, installed_at, rate)
+                self.rules[rule] = flow_id      # Replaces the rule of any flow with the same match and priority
+            return self._reply(request, 200 if existed else 201, None)
+
+        with self.lock:
+            flow = self.flows.get(key)
+            if flow is not None and method == 'DELETE':
+                del self.flows[key]
+                # A strict delete: the rule with the flow's match and priority goes, whichever flow installed it
+                self.rules.pop((switch_id, table_id) + self._rule_key(flow[0]), None)
+
+        if flow is None:
+            return self._reply(request, 404, {'errors': {'error': [{'error-tag': 'data-missing'}]}})
+        if method == 'DELETE':
+            return self._reply(request, 200, None)
+        return self._reply(request, 200, {'flow-node-inventory:flow': [self._flow_json(flow_id, flow[1], flow[2], operational, flow[0])]})
+
+    def _reply(self, request, status, data):
+        content = json.dumps(data) if data is not None else ''
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(content)))
+        request.end_headers()
+        request.wfile.write(content)
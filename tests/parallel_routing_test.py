@@ -0,0 +1,99 @@
+#!/usr/bin/python
+
+'''
+    Checks that the flows computed in a pool of processes ( see ParallelRouter ) are the flows computed
+    in-process, also when the forwarding tables keep the port used by most paths of each destination
+    ( see ForwardingTables ): the pool must count the paths using each flow like the in-process routing.
+    Runs on the simulator's topologies ( tests/odl_simulator.py ) with random weights, few distinct ones
+    so that many paths tie:
+
+        python tests/parallel_routing_test.py
+'''
+
+import os
+import random
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import odl_simulator
+from src.components import api_connector, optimizer
+from src.components.api_connector import ApiConnector
+from src.objects import topology
+
+
+topologies = [
+    ('fat-tree 4', lambda: odl_simulator.fat_tree(4)),
+    ('leaf-spine 6x3', lambda: odl_simulator.leaf_spine(6, 3, 3)),
+] + [('random {}'.format(seed), (lambda seed=seed: odl_simulator.random_topology(12, 20, degree=3, seed=seed))) for seed in range(3)]
+
+weight_choices = [1, 2, 3]
+
+
+def load(simulator, seed):
+    '''
+        Return an optimizer routing in a pool of processes, with random weights
+    '''
+    network_optimizer = optimizer.NetworkOptimizer(ApiConnector(simulator.server_ip, simulator.server_port))
+    network_optimizer.load_topology()
+    network_optimizer.parallel_router.workers = 3
+    network_optimizer.parallel_router.min_hosts = 0
+
+    rnd = random.Random(seed)
+    network_optimizer.topology.update_graph_weights({
+        switch_id: {port_num: rnd.choice(weight_choices) for port_num in sorted(ports)}
+            for switch_id, ports in sorted(network_optimizer.gen_empty_flows().items())
+    })
+    return network_optimizer
+
+
+def gen_flows(simulator, parallel, seed):
+    '''
+        Return the flows of gen_optimized_flows, computed in-process or in the pool
+    '''
+    optimizer.parallel_routing = parallel
+    return load(simulator, seed).gen_optimized_flows()
+
+
+def check_counts(simulator, seed):
+    network_optimizer = load(simulator, seed)
+    counts = Counter()
+    for path in network_optimizer.topology.get_dijkstra_paths_for_host_pairs():
+        counts.update(network_optimizer.get_path_flows(path))
+    assert network_optimizer.parallel_router.gen_flow_counts() == counts
+
+
+def check_flows(simulator, seed):
+    for tables in [False, True]:
+        optimizer.forwarding_tables = tables
+        assert gen_flows(simulator, True, seed) == gen_flows(simulator, False, seed)
+
+
+checks = [check_counts, check_flows]
+
+
+if __name__ == '__main__':
+    api_connector.info_prints = False
+    optimizer.info_prints = False
+    topology.info_prints = False
+    optimizer.route_damping = False
+    optimizer.multipath = False
+
+    failures = 0
+    for seed, (name, topology_json) in enumerate(topologies):
+        simulator = odl_simulator.OdlSimulator(topology_json()).start()
+        for check in checks:
+            try:
+                check(simulator, seed)
+            except AssertionError:
+                failures += 1
+                print '[ERR] {} failed on {}'.format(check.__name__, name)
+        simulator.stop()
+        print '[INFO] {} checked'.format(name)
+
+    if failures > 0:
+        print '[ERR] {} checks failed'.format(failures)
+        sys.exit(1)
+
+    print '[INFO] The parallel routing finds the same flows as the in-process one'
@@ -0,0 +1,126 @@
+#!/usr/bin/python
+
+'''
+    Checks that the route damping ( see RouteStabilizer ) keeps the flows of each destination a tree: the
+    switches forward by destination mac, so a destination must never be forwarded to two ports of the same
+    switch ( two flows with the same match ). The weights change randomly in every cycle, on the simulator's
+    random topologies ( tests/odl_simulator.py ). Also checks that a suppressed reroute is counted once:
+
+        python tests/route_damping_test.py
+'''
+
+import os
+import random
+import sys
+
+import networkx as nx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import odl_simulator
+from src.components import api_connector, optimizer
+from src.components.route_stabilizer import RouteStabilizer
+from src.components.api_connector import ApiConnector
+from src.objects import topology
+
+
+cycles = 8
+
+
+def conflicts(flows):
+    '''
+        Return the number of ( switch_id, mac ) forwarded to more than one port
+    '''
+    ports = {}
+    for switch_id, switch_ports in flows.items():
+        for port_num, macs_set in switch_ports.items():
+            for mac in macs_set:
+                ports.setdefault((switch_id, mac), set()).add(port_num)
+    return sum(1 for port_nums in ports.values() if len(port_nums) > 1)
+
+
+def randomize_weights(network_optimizer, rnd):
+    # Continuous weights, so the shortest paths are unique and the undamped paths of a destination form a tree
+    network_optimizer.topology.update_graph_weights({
+        switch_id: {port_num: rnd.uniform(1, 10) for port_num in ports}
+            for switch_id, ports in network_optimizer.gen_empty_flows().items()
+    })
+
+
+def check_damping(simulator, incremental, hold_down, seed):
+    network_optimizer = optimizer.NetworkOptimizer(ApiConnector(simulator.server_ip, simulator.server_port))
+    network_optimizer.load_topology()
+    network_optimizer.route_stabilizer.hold_down = hold_down
+    rnd = random.Random(seed)
+
+    flows = network_optimizer.gen_empty_flows()
+    if incremental:
+        network_optimizer.update_optimized_flows(flows)
+    else:
+        flows = network_optimizer.gen_optimized_flows()
+    assert conflicts(flows) == 0
+
+    for _ in range(cycles):
+        randomize_weights(network_optimizer, rnd)
+        if incremental:
+            network_optimizer.update_optimized_flows(flows)
+        else:
+            flows = network_optimizer.gen_optimized_flows()
+        assert conflicts(flows) == 0
+
+    counters = network_optimizer.route_stabilizer.get_counters()
+    assert counters['applied_reroutes'] > 0 or hold_down > 0
+
+
+def check_suppression_counter():
+    '''
+        A suppressed reroute is counted once, however many cycles it stays suppressed
+    '''
+    graph = nx.DiGraph()
+    for (u, v) in [('h1', 's1'), ('s1', 's2'), ('s1', 's3'), ('s1', 's4'), ('s2', 'h2'), ('s3', 'h2'), ('s4', 'h2')]:
+        graph.add_edge(u, v, weight=1)
+    route_stabilizer = RouteStabilizer(graph, hold_down=60)
+    route_stabilizer.stabilize([['h1', 's1', 's2', 'h2']])
+
+    for _ in range(3):
+        route_stabilizer.stabilize([['h1', 's1', 's3', 'h2']])
+    assert route_stabilizer.get_counters() == {'applied_reroutes': 0, 'suppressed_reroutes': 1}
+
+    # A new candidate path is a new reroute
+    for _ in range(3):
+        route_stabilizer.stabilize([['h1', 's1', 's4', 'h2']])
+    assert route_stabilizer.get_counters() == {'applied_reroutes': 0, 'suppressed_reroutes': 2}
+
+
+if __name__ == '__main__':
+    api_connector.info_prints = False
+    optimizer.info_prints = False
+    topology.info_prints = False
+    optimizer.route_damping = True
+    optimizer.forwarding_tables = False
+
+    failures = 0
+    try:
+        check_suppression_counter()
+    except AssertionError:
+        failures += 1
+        print '[ERR] The suppressed reroutes are not counted once'
+
+    for seed in range(1, 4):
+        simulator = odl_simulator.OdlSimulator(odl_simulator.random_topology(16, 24, seed=seed)).start()
+        for incremental in [False, True]:
+            optimizer.incremental_routing = incremental
+            for hold_down in [0, 60]:
+                try:
+                    check_damping(simulator, incremental, hold_down, seed)
+                except AssertionError:
+                    failures += 1
+                    print '[ERR] Conflicting flows on random topology {} ( incremental: {}, hold-down: {} )'.format(seed, incremental, hold_down)
+        simulator.stop()
+        print '[INFO] Random topology {} checked'.format(seed)
+
+    if failures > 0:
+        print '[ERR] {} checks failed'.format(failures)
+        sys.exit(1)
+
+    print '[INFO] The damped flows of every destination form a tree'
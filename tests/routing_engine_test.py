@@ -0,0 +1,61 @@
+#!/usr/bin/python
+
+'''
+    Checks that RoutingEngine, with one dijkstra per source host, finds the paths nx.dijkstra_path finds for
+    every pair of hosts, on the graph of the simulator's fat-tree and leaf-spine topologies as it is loaded
+    ( tests/odl_simulator.py ):
+
+        python tests/routing_engine_test.py
+'''
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import networkx as nx
+import odl_simulator
+from src.objects import topology
+from src.objects.topology import Topology
+from src.objects.routing_engine import RoutingEngine
+
+
+topologies = [
+    ('fat-tree 4', lambda: odl_simulator.fat_tree(4)),
+    ('fat-tree 6', lambda: odl_simulator.fat_tree(6, 1)),
+    ('leaf-spine 4x2', lambda: odl_simulator.leaf_spine(4, 2, 2)),
+    ('leaf-spine 8x4', lambda: odl_simulator.leaf_spine(8, 4, 3)),
+]
+
+
+def check_paths(topology_json):
+    graph_topology = Topology()
+    graph_topology.parse_topology_from_json(topology_json)
+    graph = graph_topology.graph
+    host_ids = graph_topology.hosts.keys()
+
+    reference = [nx.dijkstra_path(graph, src, dst) for src in host_ids for dst in host_ids if src != dst]
+    engine = RoutingEngine(graph)
+    assert engine.get_paths_for_hosts(host_ids) == reference
+
+    # The paths of some sources only
+    sources = host_ids[:3]
+    assert engine.get_paths_for_hosts(host_ids, sources) == [path for path in reference if path[0] in sources]
+
+
+if __name__ == '__main__':
+    topology.info_prints = False
+    failures = 0
+    for name, topology_json in topologies:
+        try:
+            check_paths(topology_json())
+        except AssertionError:
+            failures += 1
+            print '[ERR] The paths differ from networkx on {}'.format(name)
+        print '[INFO] {} checked'.format(name)
+
+    if failures > 0:
+        print '[ERR] {} checks failed'.format(failures)
+        sys.exit(1)
+
+    print '[INFO] RoutingEngine finds the same paths as networkx'
@@ -0,0 +1,152 @@
+#!/usr/bin/python
+
+'''
+    Checks that the routing backends find exactly the paths networkx does ( including the tie-breaking
+    between equal cost paths ), on the simulator's topologies ( tests/odl_simulator.py ) with random weights:
+
+        python tests/routing_equivalence_test.py
+'''
+
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import networkx as nx
+import odl_simulator
+from src.objects.topology import Topology
+from src.objects.routing_engine import RoutingEngine
+from src.objects.csr_routing_engine import CsrRoutingEngine
+
+
+topologies = [
+    ('fat-tree 4', lambda: odl_simulator.fat_tree(4)),
+    ('leaf-spine 6x3', lambda: odl_simulator.leaf_spine(6, 3, 3)),
+    ('ring 9', lambda: odl_simulator.ring(9, 2)),
+    ('ring 2', lambda: odl_simulator.ring(2, 1)),
+] + [('random {}'.format(seed), (lambda seed=seed: odl_simulator.random_topology(12, 20, degree=3, seed=seed))) for seed in range(10)]
+
+# Few distinct weights, so there are many equal cost paths
+weight_choices = [1, 2, 3, 5]
+
+
+def load(topology_json):
+    topology = Topology()
+    topology.parse_topology_from_json(topology_json)
+    return topology
+
+
+def randomize_weights(graph, rnd):
+    for (u, v) in graph.edges():
+        graph[u][v]['weight'] = rnd.choice(weight_choices)
+
+
+def reference_paths(graph, host_ids):
+    '''
+        The paths nx.dijkstra_path returns for every connected pair of different hosts
+    '''
+    paths = []
+    for src in host_ids:
+        for dst in host_ids:
+            if src != dst and nx.has_path(graph, src, dst):
+                paths.append(nx.dijkstra_path(graph, src, dst))
+    return paths
+
+
+def check_paths(engine_class, topology_json, seed):
+    topology = load(topology_json)
+    randomize_weights(topology.graph, random.Random(seed))
+    host_ids = topology.hosts.keys()
+
+    paths = engine_class(topology.graph).get_paths_for_hosts(host_ids)
+    assert paths == reference_paths(topology.graph, host_ids)
+
+
+def check_trees(engine_class, topology_json, seed):
+    topology = load(topology_json)
+    randomize_weights(topology.graph, random.Random(seed))
+    engine = engine_class(topology.graph)
+
+    for src in topology.hosts.keys():
+        dist, pred = engine.get_shortest_path_tree(src)
+        assert dist == nx.single_source_dijkstra_path_length(topology.graph, src)
+        for target in dist:
+            assert RoutingEngine.tree_path(pred, target) == nx.dijkstra_path(topology.graph, src, target)
+
+
+def check_weight_updates(engine_class, topology_json, seed):
+    '''
+        The same engine keeps finding the reference paths while the weights change
+    '''
+    topology = load(topology_json)
+    rnd = random.Random(seed)
+    engine = engine_class(topology.graph)
+    host_ids = topology.hosts.keys()
+
+    for _ in range(3):
+        randomize_weights(topology.graph, rnd)
+        assert engine.get_paths_for_hosts(host_ids) == reference_paths(topology.graph, host_ids)
+
+
+def check_incremental(engine_class, topology_json, seed):
+    '''
+        The paths repaired by the incremental mode cost the same as the reference paths
+    '''
+    topology = load(topology_json)
+    rnd = random.Random(seed)
+    engine = engine_class(topology.graph)
+    host_ids = topology.hosts.keys()
+    engine.get_changed_paths_for_hosts(host_ids, {})
+
+    for _ in range(3):
+        changed_edges = {}
+        for (u, v) in rnd.sample(list(topology.graph.edges()), 5):
+            changed_edges[(u, v)] = topology.graph[u][v]['weight']
+            topology.graph[u][v]['weight'] = rnd.choice(weight_choices)
+        engine.get_changed_paths_for_hosts(host_ids, changed_edges)
+
+        for (src, dst), path in engine.paths.items():
+            cost = sum(topology.graph[path[idx]][path[idx + 1]]['weight'] for idx in range(len(path) - 1))
+            assert cost == nx.dijkstra_path_length(topology.graph, src, dst)
+
+
+def check_rebuild(engine_class, topology_json, seed):
+    '''
+        The engine follows edges added to the graph after its first computation
+    '''
+    topology = load(topology_json)
+    engine = engine_class(topology.graph)
+    host_ids = topology.hosts.keys()
+    engine.get_paths_for_hosts(host_ids)
+
+    switch_ids = sorted(topology.switches.keys())
+    rnd = random.Random(seed)
+    (u, v) = rnd.sample(switch_ids, 2)
+    topology.graph.add_edge(u, v, weight=1)
+    topology.graph.add_edge(v, u, weight=1)
+    randomize_weights(topology.graph, rnd)
+    assert engine.get_paths_for_hosts(host_ids) == reference_paths(topology.graph, host_ids)
+
+
+checks = [check_paths, check_trees, check_weight_updates, check_incremental, check_rebuild]
+
+
+if __name__ == '__main__':
+    failures = 0
+    for engine_class in [RoutingEngine, CsrRoutingEngine]:
+        for check in checks:
+            for seed, (name, topology) in enumerate(topologies):
+                try:
+                    check(engine_class, topology(), seed)
+                except AssertionError:
+                    failures += 1
+                    print '[ERR] {} failed {} on {}'.format(engine_class.__name__, check.__name__, name)
+
+        print '[INFO] {} checked'.format(engine_class.__name__)
+
+    if failures > 0:
+        print '[ERR] {} checks failed'.format(failures)
+        sys.exit(1)
+
+    print '[INFO] All backends find the same paths as networkx'
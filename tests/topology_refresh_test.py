@@ -0,0 +1,158 @@
+#!/usr/bin/python
+
+'''
+    Checks that refreshing the topology in incremental mode ( see NetworkOptimizer.refresh_topology ), which only
+    moves the counts of the paths the changes affect, leaves the flows a count of every installed path gives.
+    Changes the simulator's topology ( tests/odl_simulator.py ) under a running optimizer: links and hosts are
+    removed and added and a switch connects a neighbor at another port:
+
+        python tests/topology_refresh_test.py
+'''
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import odl_simulator
+from src.components import api_connector, optimizer
+from src.components.api_connector import ApiConnector
+from src.objects import topology
+
+
+topologies = [
+    ('fat-tree 4', lambda: odl_simulator.fat_tree(4)),
+    ('leaf-spine 4x2', lambda: odl_simulator.leaf_spine(4, 2, 2)),
+    ('random 0', lambda: odl_simulator.random_topology(10, 12, degree=3, seed=0)),
+]
+
+
+def links(topology_json):
+    return topology_json['network-topology']['topology'][0]['link']
+
+def nodes(topology_json):
+    return topology_json['network-topology']['topology'][0]['node']
+
+def switch_links(topology_json):
+    return [link for link in links(topology_json) if 'host' not in link['source']['source-node'] + link['destination']['dest-node']]
+
+
+def remove_link(topology_json, link):
+    pair = set([link['source']['source-node'], link['destination']['dest-node']])
+    links(topology_json)[:] = [other for other in links(topology_json) if set([other['source']['source-node'], other['destination']['dest-node']]) != pair]
+
+def remove_host(topology_json, host_id):
+    nodes(topology_json)[:] = [node for node in nodes(topology_json) if node['node-id'] != host_id]
+    links(topology_json)[:] = [link for link in links(topology_json) if host_id not in (link['source']['source-node'], link['destination']['dest-node'])]
+
+def add_host(topology_json, switch_id, port_num):
+    mac = '00:00:00:00:ff:{:02x}'.format(port_num)
+    host_id = 'host:' + mac
+    nodes(topology_json).append({
+        'node-id': host_id,
+        'host-tracker-service:addresses': [{'id': port_num, 'mac': mac, 'ip': '10.255.0.{}'.format(port_num)}],
+        'termination-point': [{'tp-id': host_id}]
+    })
+    switch_tp = '{}:{}'.format(switch_id, port_num)
+    links(topology_json).extend([
+        {'link-id': switch_tp, 'source': {'source-node': switch_id, 'source-tp': switch_tp}, 'destination': {'dest-node': host_id, 'dest-tp': host_id}},
+        {'link-id': host_id, 'source': {'source-node': host_id, 'source-tp': host_id}, 'destination': {'dest-node': switch_id, 'dest-tp': switch_tp}},
+    ])
+
+def renumber_port(topology_json, link, port_num):
+    '''
+        The source switch of link connects its destination at port port_num instead
+    '''
+    (switch_id, old_tp) = (link['source']['source-node'], link['source']['source-tp'])
+    new_tp = '{}:{}'.format(switch_id, port_num)
+    for other in links(topology_json):
+        if other['source']['source-tp'] == old_tp:
+            other['source']['source-tp'] = other['link-id'] = new_tp
+        if other['destination']['dest-tp'] == old_tp:
+            other['destination']['dest-tp'] = new_tp
+
+
+def changes(topology_json):
+    '''
+        The changes to apply one after the other
+    '''
+    hosts = sorted(node['node-id'] for node in nodes(topology_json) if 'host' in node['node-id'])
+    switch_id = sorted(node['node-id'] for node in nodes(topology_json) if 'host' not in node['node-id'])[-1]
+    return [
+        ('remove a link', lambda: remove_link(topology_json, switch_links(topology_json)[0])),
+        ('remove a host', lambda: remove_host(topology_json, hosts[0])),
+        ('add a host', lambda: add_host(topology_json, switch_id, 90)),
+        ('renumber a port', lambda: renumber_port(topology_json, switch_links(topology_json)[-1], 91)),
+        ('remove links', lambda: [remove_link(topology_json, link) for link in switch_links(topology_json)[1:3]]),
+    ]
+
+
+def check_refresh(network_optimizer, flows):
+    '''
+        The counts and the flows are the ones of a count of every installed path
+    '''
+    if optimizer.route_damping:
+        paths = network_optimizer.route_stabilizer.paths.values()
+    else:
+        paths = network_optimizer.topology.routing_engine.paths.values()
+
+    counts = {}
+    for path in paths:
+        for flow in network_optimizer.get_path_flows(path):
+            counts[flow] = counts.get(flow, 0) + 1
+    assert network_optimizer.flow_refs == counts
+
+    listed = set( (switch_id, mac, port_num) for switch_id, ports in flows.items() for port_num, macs in ports.items() for mac in macs )
+    if not optimizer.forwarding_tables:
+        assert listed == set(counts)
+        return
+
+    # A single port of each destination in each switch, one of its paths' ports
+    destinations = set( (switch_id, mac) for (switch_id, mac, _) in counts )
+    assert set( (switch_id, mac) for (switch_id, mac, _) in listed ) == destinations
+    assert len(listed) == len(destinations)
+    assert listed <= set(counts)
+
+
+def check_changes(topology_json):
+    simulator = odl_simulator.OdlSimulator(topology_json).start()
+    try:
+        network_optimizer = optimizer.NetworkOptimizer(ApiConnector(simulator.server_ip, simulator.server_port))
+        network_optimizer.load_topology()
+        flows = network_optimizer.gen_empty_flows()
+        network_optimizer.update_optimized_flows(flows)
+
+        for name, change in changes(topology_json):
+            change()
+            new_flows = network_optimizer.refresh_topology(flows)
+            assert new_flows is not flows, name
+            flows = new_flows
+            check_refresh(network_optimizer, flows)
+    finally:
+        simulator.stop()
+
+
+if __name__ == '__main__':
+    api_connector.info_prints = False
+    optimizer.info_prints = False
+    topology.info_prints = False
+    optimizer.incremental_routing = True
+    optimizer.multipath = False
+
+    failures = 0
+    for name, topology_json in topologies:
+        for (damping, tables) in [(False, False), (False, True), (True, False), (True, True)]:
+            optimizer.route_damping = damping
+            optimizer.forwarding_tables = tables
+            try:
+                check_changes(topology_json())
+            except AssertionError as error:
+                failures += 1
+                print '[ERR] The refreshed flows differ on {} ( route damping: {}, forwarding tables: {} ) {}'.format(name, damping, tables, error)
+        print '[INFO] {} checked'.format(name)
+
+    if failures > 0:
+        print '[ERR] {} checks failed'.format(failures)
+        sys.exit(1)
+
+    print '[INFO] The refreshed flows are the flows of the installed paths'
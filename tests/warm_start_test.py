@@ -0,0 +1,155 @@
+#!/usr/bin/python
+
+'''
+    Checks that a multipath daemon warm starting from a previous run ( see NetworkOptimizer.reconcile_groups )
+    adopts the select groups installed in the switches instead of leaving them behind, and replaces the port
+    forward flows of a previous run without multipath, leaving every flow with its rule ( see
+    odl_simulator.broken_flows ). Runs against the simulator ( tests/odl_simulator.py ) and its config datastore:
+
+        python tests/warm_start_test.py
+'''
+
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import odl_simulator
+from src.components import api_connector, optimizer
+from src.components.api_connector import ApiConnector
+from src.components.async_connector import AsyncApiConnector
+from src.components.flow_manager import FlowManager
+from src.components.state_store import StateStore
+from src.objects import topology
+
+
+def start_run(simulator, connector_class, state_path):
+    '''
+        Start a run of the daemon like optimizer_daemon does: restore the saved state and route
+    '''
+    network_optimizer = optimizer.NetworkOptimizer(connector_class(simulator.server_ip, simulator.server_port))
+    network_optimizer.state_store = StateStore(state_path)
+    network_optimizer.load_topology()
+    state = network_optimizer.state_store.load()
+    if state is not None:
+        network_optimizer.restore_state(state)
+    network_optimizer.gen_optimized_flows()
+    return network_optimizer, state
+
+
+def check_installed(simulator, network_optimizer):
+    '''
+        The switches have the groups of the routing and their flows only, all of them with their rule
+    '''
+    select_groups = network_optimizer.flow_manager.select_groups
+    assert select_groups.installed_groups() == network_optimizer.multipath_router.groups
+    assert set( (group.switch_id, str(group.group_id)) for group in select_groups ) == set(simulator.groups)
+    assert set( (group.switch_id, group.flow_id) for group in select_groups ) == set( (switch_id, flow_id) for (switch_id, _, flow_id) in simulator.flows )
+    assert simulator.broken_flows() == []
+
+
+def check_restart(simulator, connector_class, state_path):
+    '''
+        A restarted daemon adopts the groups of the previous run, their ids included
+    '''
+    network_optimizer, _ = start_run(simulator, connector_class, state_path)
+    network_optimizer.push_select_groups()
+    network_optimizer.save_state({})
+    ids = {(group.switch_id, group.mac): group.group_id for group in network_optimizer.flow_manager.select_groups}
+
+    # Nothing changed, only the config datastore of each switch is read ( its table and its node )
+    network_optimizer, state = start_run(simulator, connector_class, state_path)
+    requests = simulator.requests
+    network_optimizer.reconcile_groups(state)
+    assert simulator.requests - requests == 2 * len(network_optimizer.topology.switches)
+    check_installed(simulator, network_optimizer)
+    assert {(group.switch_id, group.mac): group.group_id for group in network_optimizer.flow_manager.select_groups} == ids
+
+    # New groups get new ids
+    assert network_optimizer.flow_manager.select_groups.group_id('openflow:1', '00:00:00:00:ff:ff') not in set(ids.values())
+
+
+def check_saved_groups(simulator, connector_class, state_path):
+    '''
+        The groups of the switches whose config datastore can't be read are taken from the saved state
+    '''
+    network_optimizer, _ = start_run(simulator, connector_class, state_path)
+    network_optimizer.push_select_groups()
+    network_optimizer.save_state({})
+
+    writes = []
+
+    def fault(method, path):
+        if method != 'GET':
+            writes.append(path)
+        return 500 if method == 'GET' and path.startswith('/restconf/config/') else None
+
+    simulator.fault = fault
+    network_optimizer, state = start_run(simulator, connector_class, state_path)
+    network_optimizer.reconcile_groups(state)
+    simulator.fault = None
+    check_installed(simulator, network_optimizer)
+    assert writes == []
+
+
+def check_port_flows(simulator, connector_class, state_path):
+    '''
+        The port forward flows of a run without multipath are replaced by the groups, also when a previous
+        multipath run put the flows of its groups on top of them with the same priority
+    '''
+    optimizer.multipath = False
+    network_optimizer, _ = start_run(simulator, connector_class, state_path)
+    network_optimizer.push_flow_changes(network_optimizer.flows_to_list(network_optimizer.gen_optimized_flows()), [])
+    optimizer.multipath = True
+
+    # Groups pushed by a manager that does not know the port forward flows
+    network_optimizer, _ = start_run(simulator, connector_class, state_path)
+    network_optimizer.flow_manager = FlowManager(network_optimizer.connector)
+    for switch_id in network_optimizer.topology.switches:
+        for host_id in sorted(network_optimizer.topology.hosts)[:2]:
+            mac = network_optimizer.topology.host_id_to_mac(host_id)
+            buckets = network_optimizer.multipath_router.groups.get( (switch_id, mac) )
+            if buckets is not None:
+                network_optimizer.flow_manager.add_select_group(switch_id, mac, buckets)
+    assert len(simulator.broken_flows()) > 0
+
+    network_optimizer, state = start_run(simulator, connector_class, state_path)
+    network_optimizer.reconcile_groups(state)
+    check_installed(simulator, network_optimizer)
+    assert len(network_optimizer.flow_manager.port_forward_flows) == 0
+
+
+checks = [check_restart, check_saved_groups, check_port_flows]
+
+
+if __name__ == '__main__':
+    api_connector.info_prints = False
+    optimizer.info_prints = False
+    topology.info_prints = False
+    optimizer.multipath = True
+
+    failures = 0
+    for connector_class in [ApiConnector, AsyncApiConnector]:
+        for check in checks:
+            simulator = odl_simulator.OdlSimulator(odl_simulator.leaf_spine(4, 2, 2)).start()
+            state_dir = tempfile.mkdtemp()
+            try:
+                check(simulator, connector_class, os.path.join(state_dir, 'state.json.gz'))
+            except AssertionError:
+                failures += 1
+                print '[ERR] {} failed with the {}'.format(check.__name__, connector_class.__name__)
+            finally:
+                optimizer.multipath = True
+                simulator.stop()
+                shutil.rmtree(state_dir)
+
+        print '[INFO] {} checked'.format(connector_class.__name__)
+
+    if failures > 0:
+        print '[ERR] {} checks failed'.format(failures)
+        sys.exit(1)
+
+    print '[INFO] The warm started groups replace the installed groups and flows'
+    os._exit(0)     # Don't wait for the threads of the connectors